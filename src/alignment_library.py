@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, Any, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from nptyping import Float, NDArray, Shape
+
+
+class ResyncAligner:
+    """
+    Fits the sync correction, a rotation about the down axis plus a translation,
+    to a sliding window of resync references and where the camera thought it
+    was at the time. A single noisy reference then only nudges the correction,
+    instead of stepping it.
+
+    Minimizes the weighted squared position error, plus `heading_weight` times
+    the heading error, which has the closed form solution
+
+        yaw = atan2(S + heading_weight * sum(w sin(dh)), C + heading_weight * sum(w cos(dh)))
+
+    where S and C are the weighted cross and dot products of the centered
+    positions, and dh the heading offset of each pair. This is 2D
+    Umeyama/Kabsch with headings as extra evidence, so a single pair
+    gives exactly the single sample correction.
+    """
+
+    def __init__(
+        self,
+        window: int = 20,
+        forgetting: float = 1.0,
+        heading_weight: float = 1e4,
+        outlier_distance: float = math.inf,
+        outlier_heading: float = math.inf,
+    ) -> None:
+        """
+        `forgetting` scales down the weight of a pair for each newer one,
+        1 weighs the whole window equally. `heading_weight` is in squared
+        position units, the distance at which a point pins the yaw as strongly
+        as a heading does. Pairs off by more than `outlier_distance`,
+        or `outlier_heading` radians, from the fit are left out of it.
+        """
+        self.window = window
+        self.forgetting = forgetting
+        self.heading_weight = heading_weight
+        self.outlier_distance = outlier_distance
+        self.outlier_heading = outlier_heading
+
+        self._sensor = np.zeros((window, 3))
+        self._reference = np.zeros((window, 3))
+        self._heading_offsets = np.zeros(window)
+        self._index = 0
+
+        self.count = 0
+        """
+        Number of pairs in the window.
+        """
+        self.rejected = 0
+        """
+        Number of pairs left out of the last fit as outliers.
+        """
+
+    def add(
+        self,
+        sensor_position: NDArray[Shape["3"], Float],
+        sensor_heading: float,
+        reference_position: NDArray[Shape["3"], Float],
+        reference_heading: float,
+    ) -> None:
+        """
+        Add a pair of where the camera thought it was and the reference said it
+        was. Headings are in radians.
+        """
+        i = self._index
+        self._sensor[i] = sensor_position
+        self._reference[i] = reference_position
+        self._heading_offsets[i] = reference_heading - sensor_heading
+
+        self._index = (i + 1) % self.window
+        self.count = min(self.count + 1, self.window)
+
+    def reset(self) -> None:
+        """
+        Forget every pair, like when the camera's tracking frame changed and
+        older pairs no longer line up with new ones. The current correction
+        stays until the next resync.
+        """
+        self._index = 0
+        self.count = 0
+        self.rejected = 0
+
+    def _weights(self) -> NDArray[Any, Float]:
+        # age of each slot, 0 for the newest pair
+        age = (self._index - 1 - np.arange(self.window)) % self.window
+        weights = self.forgetting**age
+        weights[age >= self.count] = 0
+        return weights
+
+    def _fit(
+        self, weights: NDArray[Any, Float]
+    ) -> Tuple[float, NDArray[Shape["3"], Float]]:
+        total = weights.sum()
+        sensor_mean = weights.dot(self._sensor) / total
+        reference_mean = weights.dot(self._reference) / total
+
+        a = self._sensor[:, :2] - sensor_mean[:2]
+        b = self._reference[:, :2] - reference_mean[:2]
+        S = weights.dot(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+        C = weights.dot(a[:, 0] * b[:, 0] + a[:, 1] * b[:, 1])
+
+        yaw = math.atan2(
+            S + self.heading_weight * weights.dot(np.sin(self._heading_offsets)),
+            C + self.heading_weight * weights.dot(np.cos(self._heading_offsets)),
+        )
+
+        # rotating about the down axis leaves it alone, so its offset is
+        # just the mean difference
+        c = math.cos(yaw)
+        s = math.sin(yaw)
+        translation = reference_mean - (
+            c * sensor_mean[0] - s * sensor_mean[1],
+            s * sensor_mean[0] + c * sensor_mean[1],
+            sensor_mean[2],
+        )
+        return yaw, translation
+
+    def _outlier_scores(
+        self, yaw: float, translation: NDArray[Shape["3"], Float]
+    ) -> NDArray[Any, Float]:
+        """
+        How far off each pair is from a fit, relative to the outlier thresholds.
+        Above 1 is an outlier.
+        """
+        c = math.cos(yaw)
+        s = math.sin(yaw)
+        R = np.array(((c, -s, 0), (s, c, 0), (0, 0, 1)))
+
+        distance = np.linalg.norm(
+            self._sensor.dot(R.T) + translation - self._reference, axis=1
+        )
+        # wrapped into (-pi, pi]
+        heading = np.abs(np.angle(np.exp(1j * (self._heading_offsets - yaw))))
+
+        return np.maximum(
+            distance / self.outlier_distance, heading / self.outlier_heading
+        )
+
+    def solve(self) -> Tuple[float, NDArray[Shape["3"], Float]]:
+        """
+        Best fit yaw, in radians, and translation that take camera positions
+        to reference positions. The worst outlier is dropped and the fit redone
+        until none are left, as a gross outlier drags the whole fit towards it.
+        """
+        if not self.count:
+            raise ValueError("No resync pairs to align")
+
+        weights = self._weights()
+        yaw, translation = self._fit(weights)
+        self.rejected = 0
+
+        while self.count - self.rejected > 1:
+            scores = self._outlier_scores(yaw, translation)
+            scores[weights == 0] = 0
+            worst = int(scores.argmax())
+            if scores[worst] <= 1:
+                break
+
+            weights[worst] = 0
+            self.rejected += 1
+            yaw, translation = self._fit(weights)
+
+        return yaw, translation
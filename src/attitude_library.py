@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import math
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+import transforms3d as t3d
+
+if TYPE_CHECKING:
+    from nptyping import Float, NDArray, Shape
+
+
+def _skew(v: NDArray[Shape["3"], Float]) -> NDArray[Shape["3, 3"], Float]:
+    return np.array(((0.0, -v[2], v[1]), (v[2], 0.0, -v[0]), (-v[1], v[0], 0.0)))
+
+
+def rotation_exp(v: NDArray[Shape["3"], Float]) -> NDArray[Shape["3, 3"], Float]:
+    """
+    Rotation matrix of a rotation vector, the axis scaled by the angle in radians.
+    """
+    theta = math.sqrt(float(v.dot(v)))
+    if theta < 1e-12:
+        return np.eye(3) + _skew(v)
+
+    K = _skew(v / theta)
+    return np.eye(3) + math.sin(theta) * K + (1 - math.cos(theta)) * K.dot(K)
+
+
+def rotation_log(R: NDArray[Shape["3, 3"], Float]) -> NDArray[Shape["3"], Float]:
+    """
+    Rotation vector of a rotation matrix. Only accurate for rotations well short
+    of half a turn, which is all the corrections between frames ever are.
+    """
+    cos_theta = min(max((R.trace() - 1) / 2, -1.0), 1.0)
+    theta = math.acos(cos_theta)
+
+    v = np.array((R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1])) / 2
+    if theta < 1e-9:
+        return v
+
+    return v * theta / math.sin(theta)
+
+
+def rotation_angle(R: NDArray[Shape["3, 3"], Float]) -> float:
+    """
+    Angle of a rotation matrix in radians, accurate over the whole half turn,
+    unlike `rotation_log`.
+    """
+    v = np.array((R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1])) / 2
+    return math.atan2(math.sqrt(float(v.dot(v))), (R.trace() - 1) / 2)
+
+
+class AttitudePropagator:
+    """
+    Complementary filter running the vehicle attitude forward from gyro rates
+    between camera frames, and pulling it towards the visual attitude whenever
+    a frame arrives.
+
+    Frames arrive after the IMU samples taken at the same time, so every
+    propagated attitude is kept for a short while, and each visual attitude is
+    compared against the attitude propagated for its own timestamp. A `gain`
+    fraction of the difference is applied to the current attitude, and the
+    rate the difference builds up at is fed into the gyro bias estimate with
+    `bias_gain`.
+
+    A difference larger than `jump_threshold` radians, like the heading step of
+    a resync, is not drift. The attitude jumps straight to the visual one, and
+    the bias is left alone.
+    """
+
+    def __init__(
+        self,
+        R_aeroBody_TRACKCAMBody: NDArray[Shape["3, 3"], Float],
+        gain: float = 0.1,
+        bias_gain: float = 0.02,
+        max_gap: float = 0.1,
+        history: int = 256,
+        jump_threshold: float = math.radians(10),
+    ) -> None:
+        """
+        `R_aeroBody_TRACKCAMBody` is the camera mounting, to rotate the gyro
+        rates of the camera into the vehicle's body frame. Gyro samples more
+        than `max_gap` seconds apart are not integrated across.
+        """
+        self.R_aeroBody_TRACKCAMBody = np.asarray(R_aeroBody_TRACKCAMBody)
+        self.gain = gain
+        self.bias_gain = bias_gain
+        self.max_gap = max_gap
+        self.jump_threshold = jump_threshold
+
+        self.R = np.eye(3)
+        """
+        Current attitude, rotating the vehicle's body frame into the synced
+        reference frame.
+        """
+        self.bias = np.zeros(3)
+        """
+        Gyro bias estimate in the vehicle's body frame, in rad/s.
+        """
+        self.initialized = False
+        """
+        Whether a visual attitude arrived yet. Nothing is propagated before.
+        """
+
+        self.propagated = 0
+        """
+        Number of gyro samples integrated.
+        """
+        self.corrections = 0
+        """
+        Number of visual attitudes applied.
+        """
+        self.rejected = 0
+        """
+        Number of gyro samples rejected for not moving time forward, NaNs,
+        or following a gap longer than `max_gap`.
+        """
+        self.jumps = 0
+        """
+        Number of visual attitudes jumped to instead of corrected towards.
+        """
+        self.correction = 0.0
+        """
+        Radians between the visual attitude and the propagated one at the last
+        correction.
+        """
+
+        self._timestamp = 0
+        self._last_correction = 0
+        # monotonic time of the last gyro sample, to tell when they stop
+        self._last_sample = -math.inf
+
+        # gyro samples and camera frames arrive on different threads
+        self._lock = threading.Lock()
+
+        # propagated attitudes by timestamp, in a ring buffer
+        self._times = np.zeros(history, dtype=np.int64)
+        self._attitudes = np.tile(np.eye(3), (history, 1, 1))
+        self._index = 0
+        self._count = 0
+
+    def active(self, now: Optional[float] = None) -> bool:
+        """
+        Whether gyro samples are being propagated, so the attitude is more
+        current than the last camera frame.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        return self.initialized and now - self._last_sample <= self.max_gap
+
+    def _record(self, timestamp: int) -> None:
+        i = self._index
+        self._times[i] = timestamp
+        self._attitudes[i] = self.R
+        self._index = (i + 1) % len(self._times)
+        self._count = min(self._count + 1, len(self._times))
+
+    def _attitude_at(self, timestamp: int) -> NDArray[Shape["3, 3"], Float]:
+        """
+        Newest propagated attitude no newer than `timestamp`, or the current
+        attitude if there is none.
+        """
+        times = self._times[: self._count]
+        older = np.flatnonzero(times <= timestamp)
+        if not len(older):
+            return self.R
+
+        return self._attitudes[older[np.argmax(times[older])]]
+
+    def propagate(
+        self, angular_velocity: Tuple[float, float, float], timestamp: int
+    ) -> Optional[Tuple[float, float, float]]:
+        """
+        Integrate a gyro sample of the camera, in rad/s, with its timestamp in
+        nanoseconds. Returns the new attitude as roll, pitch and yaw in radians,
+        or None if there is no attitude to propagate yet or the sample was
+        rejected.
+        """
+        with self._lock:
+            return self._propagate(angular_velocity, timestamp)
+
+    def _propagate(
+        self, angular_velocity: Tuple[float, float, float], timestamp: int
+    ) -> Optional[Tuple[float, float, float]]:
+        if not self.initialized:
+            return
+
+        if math.isnan(sum(angular_velocity)) or timestamp <= self._timestamp:
+            self.rejected += 1
+            return
+
+        dt = (timestamp - self._timestamp) / 1e9
+        self._timestamp = timestamp
+        self._last_sample = time.monotonic()
+
+        if dt > self.max_gap:
+            # the gyro stopped for a while, wait for the next camera frame
+            # rather than integrating a stale rate over the gap
+            self.rejected += 1
+            return
+
+        rate = self.R_aeroBody_TRACKCAMBody.dot(angular_velocity) - self.bias
+        # body rates, so the increment applies on the right
+        self.R = self.R.dot(rotation_exp(rate * dt))
+        self.propagated += 1
+        self._record(timestamp)
+
+        return self.euler()
+
+    def correct(
+        self, rpy: Tuple[float, float, float], timestamp: int, jump: bool = False
+    ) -> None:
+        """
+        Apply a visual attitude, as roll, pitch and yaw in radians, of the camera
+        frame with the timestamp in nanoseconds. With `jump`, like for the first
+        frame after a resync, the attitude jumps to it however small the
+        difference.
+        """
+        with self._lock:
+            self._correct(rpy, timestamp, jump)
+
+    def _jump(self, C: NDArray[Shape["3, 3"], Float], timestamp: int) -> None:
+        """
+        Rotate the current attitude and every attitude kept by `C`, without
+        touching the bias.
+        """
+        self.R = C.dot(self.R)
+        self._attitudes[: self._count] = np.matmul(C, self._attitudes[: self._count])
+        self._last_correction = max(timestamp, self._last_correction)
+        if timestamp > self._timestamp:
+            self._timestamp = timestamp
+        self.jumps += 1
+
+    def _correct(
+        self, rpy: Tuple[float, float, float], timestamp: int, jump: bool
+    ) -> None:
+        R_visual = t3d.euler.euler2mat(*rpy, axes="rxyz")
+
+        if not self.initialized:
+            self.R = R_visual
+            self.initialized = True
+            self._timestamp = timestamp
+            self._last_correction = timestamp
+            return
+
+        R_then = self._attitude_at(timestamp)
+
+        R_error = R_visual.dot(R_then.T)
+        self.correction = rotation_angle(R_error)
+        if jump or self.correction > self.jump_threshold:
+            # the same jump for attitudes propagated after the frame, so the
+            # current attitude is the visual one plus the gyro since
+            self._jump(R_error, timestamp)
+            return
+
+        # bias from how fast the error built up in the body frame since the
+        # last correction, which already took out its share of the error
+        error_body = rotation_log(R_then.T.dot(R_visual))
+        elapsed = (timestamp - self._last_correction) / 1e9
+        if elapsed > 0:
+            self.bias -= self.bias_gain * error_body / elapsed
+        self._last_correction = max(timestamp, self._last_correction)
+
+        # the same correction moves the current attitude and every attitude
+        # kept for later frames
+        error = rotation_log(R_error)
+        C = rotation_exp(self.gain * error)
+        self.R = C.dot(self.R)
+        self._attitudes[: self._count] = np.matmul(C, self._attitudes[: self._count])
+
+        # keep rounding errors from building up
+        U, _, Vt = np.linalg.svd(self.R)
+        self.R = U.dot(Vt)
+
+        if timestamp > self._timestamp:
+            # no gyro samples since this frame, so it is the latest attitude
+            self._timestamp = timestamp
+
+        self.corrections += 1
+
+    def euler(self) -> Tuple[float, float, float]:
+        """
+        Current attitude as roll, pitch and yaw in radians.
+        """
+        return t3d.euler.mat2euler(self.R, axes="rxyz")
+
+    def report(self) -> Dict[str, float]:
+        """
+        Counters and the current gyro bias estimate.
+        """
+        return {
+            "propagated": self.propagated,
+            "corrections": self.corrections,
+            "jumps": self.jumps,
+            "rejected": self.rejected,
+            "correction_deg": math.degrees(self.correction),
+            "bias_deg_s": float(np.degrees(np.linalg.norm(self.bias))),
+        }
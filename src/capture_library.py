@@ -0,0 +1,94 @@
+import threading
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class LatestFrameSlot(Generic[T]):
+    """
+    Triple buffer handing the latest frame from one producer thread to
+    consumers, without the producer ever waiting on them.
+
+    The producer writes into `back()` and then calls `publish()`, which swaps it
+    with the ready buffer. `latest()` swaps the ready buffer with the one being
+    read. Frames the consumer did not get to in time are overwritten, never
+    queued. The lock is only held to swap indices, so it is never held for
+    longer than a few instructions.
+
+    The buffer returned by `latest()` stays untouched until `latest()` is
+    called again, so concurrent consumers need to share a lock around it.
+    """
+
+    def __init__(self, factory: Callable[[], T]) -> None:
+        """
+        `factory` creates each of the three preallocated buffers.
+        """
+        self.buffers: List[T] = [factory() for _ in range(3)]
+        self.frame_ids = [-1, -1, -1]
+        self.timestamps = [0, 0, 0]
+
+        self._condition = threading.Condition(threading.Lock())
+        self._write = 0
+        self._ready = 1
+        self._read = 2
+        self._fresh = False
+
+        self.published = 0
+        """
+        Number of frames published.
+        """
+        self.overwritten = 0
+        """
+        Number of published frames that were replaced before being read.
+        """
+
+    def back(self) -> T:
+        """
+        Buffer the producer should write the next frame into.
+        """
+        return self.buffers[self._write]
+
+    def publish(self, frame_id: int, timestamp: int) -> None:
+        """
+        Make the buffer returned by `back()` the latest frame.
+        """
+        self.frame_ids[self._write] = frame_id
+        self.timestamps[self._write] = timestamp
+
+        with self._condition:
+            self._write, self._ready = self._ready, self._write
+            if self._fresh:
+                self.overwritten += 1
+            self._fresh = True
+            self._condition.notify_all()
+
+        self.published += 1
+
+    def latest(
+        self, min_frame_id: int = 0, timeout: float = 0.0
+    ) -> Optional[Tuple[T, int, int]]:
+        """
+        Return the latest buffer, with its frame ID and timestamp.
+        Waits up to `timeout` seconds for a frame with an ID of at least
+        `min_frame_id`, and returns None if there is none.
+        """
+        with self._condition:
+            if timeout > 0:
+                self._condition.wait_for(
+                    lambda: (
+                        max(self.frame_ids[self._ready], self.frame_ids[self._read])
+                        >= min_frame_id
+                    ),
+                    timeout,
+                )
+
+            if self._fresh:
+                self._read, self._ready = self._ready, self._read
+                self._fresh = False
+
+            i = self._read
+
+        if self.frame_ids[i] < max(min_frame_id, 0):
+            return None
+
+        return self.buffers[i], self.frame_ids[i], self.timestamps[i]
@@ -3,6 +3,23 @@ import math
 CAM_UPDATE_FREQ = 10
 """
 Times per second to update data from the camera.
+Not used when `CAM_GRAB_PACED` is enabled.
+"""
+
+CAM_FPS = 60
+"""
+Frame rate to run the camera at.
+"""
+
+CAM_GRAB_PACED = False
+"""
+Pace the pose loop by frame arrival instead of polling at `CAM_UPDATE_FREQ`.
+Every grabbed frame is transformed and published as soon as it arrives.
+"""
+
+CAM_OUTPUT_DECIMATION = 1
+"""
+When `CAM_GRAB_PACED` is enabled, only publish every Nth grabbed frame.
 """
 
 CAM_POS = (17, 0, 8.5)
@@ -21,7 +38,403 @@ CAM_GROUND_HEIGHT = 10
 Centimeters above the ground.
 """
 
+CAMERA_GRAB_FAILURE_LIMIT = 5
+"""
+Number of ZED grabs failing in a row before the camera is closed and opened
+again, with tracking continuing from the last pose.
+"""
+
+CAMERA_RECONNECT_BACKOFF = 0.1
+"""
+Seconds to wait before reopening the camera again after the first attempt
+failed. Doubles with every failed attempt, up to `CAMERA_RECONNECT_MAX_BACKOFF`.
+"""
+
+CAMERA_RECONNECT_MAX_BACKOFF = 5.0
+"""
+Longest wait in seconds between attempts to reopen the camera.
+"""
+
+ADAPTIVE_SCHEDULER = False
+"""
+Pace the pose loop with the adaptive scheduler instead of `CAM_UPDATE_FREQ`.
+It starts at `CAM_UPDATE_FREQ`, backs off the image stream when pose frames
+miss their deadlines, and raises the pose rate towards `CAM_FPS` when there
+is headroom.
+"""
+
+SCHEDULER_POSE_BUDGET = 0.5
+"""
+Fraction of the pose period processing a frame may take before it counts as
+a missed deadline.
+"""
+
+SCHEDULER_MISS_THRESHOLD = 0.05
+"""
+Fraction of pose frames missing their deadline that makes the scheduler back off.
+"""
+
+SCHEDULER_HEADROOM = 0.25
+"""
+With no missed deadlines and processing using less than this fraction of the
+pose period, the scheduler restores the image stream or raises the pose rate.
+"""
+
+SCHEDULER_WINDOW = 2.0
+"""
+Seconds between scheduler decisions.
+"""
+
+SCHEDULER_IMAGE_NICE = 5
+"""
+How much lower the priority of image threads is than the pose loop, as a nice
+value, when the adaptive scheduler is enabled.
+"""
+
 CONTINUOUS_SYNC = True
 """
 Enable continous resyncing.
 """
+
+CAMERA_BACKEND = "zed"
+"""
+Where camera data comes from. "zed" for the ZED tracking camera,
+"replay" to play back `REPLAY_FILE` instead, or "synthetic" to generate
+frames along `SYNTHETIC_TRAJECTORY` without any camera.
+"""
+
+RECORD_FILE = None
+"""
+If set, every camera frame is appended to this file, for later use with
+the "replay" camera backend.
+"""
+
+REPLAY_FILE = "/usr/local/zed/settings/vio_recording.bin"
+"""
+Recording played back by the "replay" camera backend.
+"""
+
+REPLAY_SPEED = 1.0
+"""
+Playback rate of the "replay" camera backend relative to real time.
+0 plays back as fast as possible.
+"""
+
+REPLAY_LOOP = False
+"""
+Start the recording over once the "replay" camera backend reaches the end.
+"""
+
+SYNTHETIC_TRAJECTORY = "hover"
+"""
+Path flown by the "synthetic" camera backend. "hover", "circle" or "figure8".
+"""
+
+SYNTHETIC_FPS = 60
+"""
+Frame rate of the "synthetic" camera backend. Can be several hundred.
+"""
+
+SYNTHETIC_SPEED = 1.0
+"""
+Rate the "synthetic" camera backend delivers frames at relative to real time.
+0 delivers them as fast as possible.
+"""
+
+SYNTHETIC_RADIUS = 2.0
+"""
+Meters. Radius of the "circle" trajectory, and half the width of the "figure8".
+"""
+
+SYNTHETIC_PERIOD = 20.0
+"""
+Seconds to complete one lap of the "circle" or "figure8" trajectory.
+"""
+
+SYNTHETIC_ALTITUDE = 1.0
+"""
+Meters above the ground the synthetic trajectories are flown at.
+"""
+
+SYNTHETIC_POSITION_NOISE = 0.0
+"""
+Meters. Standard deviation of the noise added to synthetic positions.
+"""
+
+SYNTHETIC_VELOCITY_NOISE = 0.0
+"""
+Meters per second. Standard deviation of the noise added to synthetic velocities.
+"""
+
+SYNTHETIC_HEADING_NOISE = 0.0
+"""
+Radians. Standard deviation of the noise added to synthetic headings.
+"""
+
+SYNTHETIC_DROPOUT = 0.0
+"""
+Probability of a synthetic frame failing to grab, like a dropped ZED frame.
+"""
+
+SYNTHETIC_CONFIDENCE_DROP = 0.0
+"""
+Probability of a synthetic frame reporting a low tracking confidence.
+"""
+
+SYNTHETIC_GYRO_NOISE = 0.0
+"""
+Radians per second. Standard deviation of the noise added to synthetic gyro samples.
+"""
+
+SYNTHETIC_GYRO_BIAS = 0.0
+"""
+Radians per second. Constant bias added to every axis of synthetic gyro samples.
+"""
+
+IMU_ATTITUDE = False
+"""
+Propagate the attitude with the camera's gyro between camera frames, and
+publish `avr/vio/attitude/euler/radians` and `avr/vio/heading` at `IMU_RATE`
+instead of once per frame. Camera frames correct the propagated attitude.
+Falls back to publishing once per frame while no gyro samples arrive.
+"""
+
+IMU_RATE = 400
+"""
+Times per second to poll the camera for gyro samples and publish the attitude.
+Also the rate the "synthetic" camera backend generates gyro samples at.
+The ZED's gyro is read once per grab, so it has new samples at the frame rate.
+"""
+
+IMU_ATTITUDE_GAIN = 0.1
+"""
+Fraction of the difference between the camera attitude and the propagated one
+that is corrected with each camera frame. Higher values trust the camera more.
+"""
+
+IMU_BIAS_GAIN = 0.02
+"""
+How quickly the gyro bias estimate follows the drift seen between camera frames.
+0 disables bias estimation.
+"""
+
+IMU_MAX_GAP = 0.1
+"""
+Seconds. Gyro samples further apart than this are not integrated across.
+"""
+
+IMU_JUMP_THRESHOLD = 10.0
+"""
+Degrees. A camera attitude further than this from the propagated one is jumped
+to, instead of being corrected towards and counted as gyro bias.
+"""
+
+POSE_PREDICTION = False
+"""
+Extrapolate every camera frame's position and attitude from its image timestamp
+to the moment it is published, using its velocity and the turn rate between
+frames.
+"""
+
+PREDICTION_HORIZON = 0.1
+"""
+Seconds. Frames are never extrapolated further than this.
+"""
+
+PREDICTION_MAX_POSITION = 20.0
+"""
+Centimeters. Largest position correction extrapolation applies to a frame.
+"""
+
+PREDICTION_MAX_ANGLE = 10.0
+"""
+Degrees. Largest attitude correction extrapolation applies to a frame.
+"""
+
+STATS_PERIOD = 1.0
+"""
+Seconds between publishing the module's counters on `avr/vio/stats`.
+0 disables it.
+"""
+
+STATUS_PERIOD = 1.0
+"""
+Seconds between publishing the module's readiness on `avr/vio/status`.
+0 disables it.
+"""
+
+STATUS_STALE_TIMEOUT = 2.0
+"""
+Seconds without a published pose before the status turns degraded.
+"""
+
+CAMERA_SETUP_RETRY_PERIOD = 5.0
+"""
+Seconds to wait before setting up the camera again after it failed.
+"""
+
+LATENCY_LOG_PERIOD = 0
+"""
+Seconds between logging latency percentiles of the pose pipeline. 0 disables it.
+"""
+
+VELOCITY_ESTIMATOR = "least_squares"
+"""
+How the ZED camera velocity is estimated from its positions.
+"finite_difference" uses the last two positions, "least_squares" fits a line
+through the last `VELOCITY_WINDOW` positions, and "kalman" runs a constant
+velocity Kalman filter.
+"""
+
+VELOCITY_WINDOW = 5
+"""
+Number of positions the "least_squares" velocity estimator fits over.
+"""
+
+VELOCITY_KALMAN_PROCESS_NOISE = 1.0
+"""
+Acceleration noise spectral density of the "kalman" velocity estimator,
+in (m/s^2)^2/Hz. Higher values track changes in velocity faster.
+"""
+
+VELOCITY_KALMAN_MEASUREMENT_NOISE = 1e-4
+"""
+Position measurement variance of the "kalman" velocity estimator, in m^2.
+"""
+
+IMAGE_DEMAND_TIMEOUT = 1.0
+"""
+Seconds after the last image request that the ZED camera keeps retrieving
+images after each grab. Images are not retrieved at all while nobody asks.
+Also how long a single image request waits for the camera to capture one.
+"""
+
+IMAGE_ENCODER_WORKERS = 1
+"""
+Number of workers encoding images to send.
+"""
+
+IMAGE_ENCODER_PROCESSES = False
+"""
+Encode images in worker processes instead of threads, so encoding does not
+compete with the pose loop for the GIL, at the cost of copying each image
+to the worker.
+"""
+
+IMAGE_ENCODER_QUEUE = 2
+"""
+Number of images allowed to wait for an encoder. When full, the oldest waiting
+image is dropped.
+"""
+
+IMAGE_COMPRESSION_LEVEL = 1
+"""
+zlib compression level, 1-9, of compressed images. Higher levels save
+bandwidth, but take much longer to encode.
+"""
+
+IMAGE_STREAM_SCALE = 1
+"""
+Integer factor streamed images are downscaled by before encoding.
+"""
+
+PUBLISH_STATE = False
+"""
+Also publish each processed frame as a single `avr/vio/state` message,
+holding every pose topic's fields and the image timestamp.
+"""
+
+TOPIC_THROTTLE = {
+    "avr/vio/confidence": {"deadband": 0.0, "max_period": 1.0},
+}
+"""
+Per topic publishing limits for the pose topics and `avr/vio/state`.
+"decimation" only publishes every Nth frame, and 0 never publishes the topic.
+"deadband" only publishes once any value changed by more than it,
+or "max_period" seconds passed since the topic was last published.
+Topics not listed are published every frame.
+"""
+
+POSE_HISTORY_SIZE = 256
+"""
+Number of camera poses kept to resync against the pose at the time of the
+reference position. Should cover `RESYNC_DELAY` at `CAM_FPS`.
+"""
+
+RESYNC_DELAY = 0.0
+"""
+Seconds between a resync reference position being valid and it arriving.
+Resyncs are computed against the camera pose from this long before the
+message arrived. The delay depends on the reference source and has not been
+measured, so this is off by default and resyncs use the latest pose.
+"""
+
+RESYNC_WINDOW = 20
+"""
+Number of recent resyncs the sync correction is fit over. 1 applies each
+resync as is.
+"""
+
+RESYNC_FORGETTING = 0.9
+"""
+Factor the weight of a resync is scaled by for each newer one, so the
+correction follows slow drift. 1 weighs the whole window equally.
+"""
+
+RESYNC_HEADING_WEIGHT = 10_000
+"""
+How strongly reference headings pin the heading correction, compared to the
+spread of the reference positions, in cm^2. Headings count as much as a
+position this far from the others, 1m by default.
+"""
+
+RESYNC_OUTLIER_DISTANCE = 100
+"""
+Resyncs more than this many cm off the fit of the window are left out of it.
+"""
+
+RESYNC_OUTLIER_HEADING = 20
+"""
+Resyncs whose heading is more than this many degrees off the fit of the window
+are left out of it.
+"""
+
+AREA_MEMORY = False
+"""
+Let ZED tracking remember the area it has seen in `AREA_FILE`, and relocalize in
+it on the next start, instead of starting from an empty map at the origin.
+The sync correction is kept in `SYNC_FILE` alongside it.
+"""
+
+AREA_FILE = "/usr/local/zed/settings/vio.area"
+"""
+ZED spatial memory file. Loaded on startup if it exists, and saved on shutdown
+and every `AREA_SAVE_PERIOD` seconds.
+"""
+
+SYNC_FILE = "/usr/local/zed/settings/vio_sync.json"
+"""
+Sync correction of the last resync, restored on startup with `AREA_MEMORY`,
+as it only applies to the frame of the area file.
+"""
+
+AREA_SAVE_PERIOD = 300
+"""
+Seconds between refreshing `AREA_FILE` in the background. 0 only saves it on
+shutdown.
+"""
+
+AREA_SAVE_TIMEOUT = 30
+"""
+Seconds to wait for the ZED SDK to export the area file.
+"""
+
+PROFILE_DIR = "/usr/local/zed/settings/"
+"""
+Directory profiles requested on `avr/vio/debug/profile` are written to.
+"""
+
+PROFILE_MAX_DURATION = 60
+"""
+Seconds. Longest profiling session that can be requested.
+"""
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import math
+import threading
+from typing import TYPE_CHECKING, Optional, Tuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from nptyping import Float, NDArray, Shape
+
+
+def slerp(
+    q0: NDArray[Shape["4"], Float], q1: NDArray[Shape["4"], Float], t: float
+) -> NDArray[Shape["4"], Float]:
+    """
+    Spherical linear interpolation between two unit quaternions, along the
+    shortest path. `t` of 0 gives `q0` and 1 gives `q1`.
+    """
+    dot = float(q0.dot(q1))
+    # q and -q are the same rotation, take the short way around
+    if dot < 0:
+        q1 = -q1
+        dot = -dot
+
+    if dot > 0.9995:
+        # nearly identical, where slerp is numerically unstable and
+        # indistinguishable from a normalized lerp
+        q = q0 + t * (q1 - q0)
+        return q / np.linalg.norm(q)
+
+    theta = math.acos(dot)
+    sin_theta = math.sin(theta)
+    return (
+        math.sin((1 - t) * theta) / sin_theta * q0
+        + math.sin(t * theta) / sin_theta * q1
+    )
+
+
+class PoseHistory:
+    """
+    Fixed size ring buffer of timestamped camera poses, to look up where the
+    camera was at a given time. Lookups are a binary search, interpolating
+    between the two nearest poses.
+    """
+
+    def __init__(self, capacity: int = 256) -> None:
+        self.capacity = capacity
+
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._rotations = np.zeros((capacity, 4))
+        self._translations = np.zeros((capacity, 3))
+
+        # physical index of the oldest pose
+        self._start = 0
+        self.count = 0
+        """
+        Number of poses in the buffer.
+        """
+
+        # lookups are rare, and only hold it for a binary search
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        timestamp: int,
+        rotation: Tuple[float, float, float, float],
+        translation: Tuple[float, float, float],
+    ) -> None:
+        """
+        Add a camera pose, with its timestamp in nanoseconds. Poses that do not
+        move time forward are ignored.
+        """
+        with self._lock:
+            count = self.count
+            if count and timestamp <= self._timestamp(count - 1):
+                return
+
+            if count == self.capacity:
+                i = self._start
+                self._start = (self._start + 1) % self.capacity
+            else:
+                i = (self._start + count) % self.capacity
+                self.count = count + 1
+
+            self._timestamps[i] = timestamp
+            self._rotations[i] = rotation
+            self._translations[i] = translation
+
+    def _timestamp(self, index: int) -> int:
+        """
+        Timestamp of the pose `index` poses after the oldest one.
+        """
+        return self._timestamps.item((self._start + index) % self.capacity)
+
+    def latest_timestamp(self) -> Optional[int]:
+        """
+        Timestamp of the newest pose, if there is one.
+        """
+        with self._lock:
+            if not self.count:
+                return None
+
+            return self._timestamp(self.count - 1)
+
+    def lookup(
+        self, timestamp: int
+    ) -> Optional[Tuple[NDArray[Shape["4"], Float], NDArray[Shape["3"], Float]]]:
+        """
+        Rotation quaternion and translation of the camera at `timestamp`,
+        interpolated between the nearest poses. Times after the newest pose
+        give the newest pose. Returns None if the history is empty, or the
+        time is older than anything in it.
+        """
+        with self._lock:
+            count = self.count
+            if not count or timestamp < self._timestamp(0):
+                return None
+
+            if timestamp >= self._timestamp(count - 1):
+                i = (self._start + count - 1) % self.capacity
+                return self._rotations[i].copy(), self._translations[i].copy()
+
+            # find the first pose newer than the timestamp
+            low = 1
+            high = count - 1
+            while low < high:
+                middle = (low + high) // 2
+                if self._timestamp(middle) <= timestamp:
+                    low = middle + 1
+                else:
+                    high = middle
+
+            i0 = (self._start + low - 1) % self.capacity
+            i1 = (self._start + low) % self.capacity
+            t0 = self._timestamps.item(i0)
+            t1 = self._timestamps.item(i1)
+            q0 = self._rotations[i0].copy()
+            q1 = self._rotations[i1].copy()
+            p0 = self._translations[i0].copy()
+            p1 = self._translations[i1].copy()
+
+        t = (timestamp - t0) / (t1 - t0)
+        return slerp(q0, q1, t), p0 + t * (p1 - p0)
@@ -0,0 +1,272 @@
+import base64
+import collections
+import concurrent.futures
+import threading
+import time
+import zlib
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypedDict
+
+import numpy as np
+from bell.avr.utils.images import ImageData, serialize_image
+from loguru import logger
+from scheduler_library import lower_thread_priority
+from stats_library import LatencyTracker
+
+
+def scale_image(image: np.ndarray, scale: int) -> np.ndarray:
+    """
+    Downscale an image by an integer factor, by keeping every `scale`-th pixel
+    in each direction. This is a view, so nothing is copied until encoding.
+    """
+    if scale <= 1:
+        return image
+
+    return image[::scale, ::scale]
+
+
+class ImageOptions(TypedDict):
+    scale: int  # integer downscale factor
+    roi: Optional[Tuple[int, int, int, int]]  # x, y, width, height, in full pixels
+    grayscale: bool  # keep only the green channel
+    channels: Optional[int]  # number of leading channels to keep, 3 drops alpha
+
+
+def default_image_options() -> ImageOptions:
+    """
+    Options that leave images untouched.
+    """
+    return ImageOptions(scale=1, roi=None, grayscale=False, channels=None)
+
+
+def parse_image_options(payload: Dict[str, Any]) -> ImageOptions:
+    """
+    Validate image options received over MQTT. Options that are missing
+    keep their default.
+    """
+    unknown = set(payload) - set(ImageOptions.__annotations__)
+    if unknown:
+        raise ValueError(f"Unknown image options {sorted(unknown)}")
+
+    options = default_image_options()
+
+    scale = payload.get("scale", 1)
+    if not isinstance(scale, int) or scale < 1:
+        raise ValueError(f"Image scale must be a positive integer, not {scale}")
+    options["scale"] = scale
+
+    roi = payload.get("roi")
+    if roi is not None:
+        if (
+            len(roi) != 4
+            or not all(isinstance(v, int) for v in roi)
+            or min(roi) < 0
+            or min(roi[2:]) < 1
+        ):
+            raise ValueError(f"Image ROI must be [x, y, width, height], not {roi}")
+        options["roi"] = tuple(roi)  # type: ignore
+
+    options["grayscale"] = bool(payload.get("grayscale", False))
+
+    channels = payload.get("channels")
+    if channels is not None:
+        if not isinstance(channels, int) or channels < 1:
+            raise ValueError(
+                f"Image channels must be a positive integer, not {channels}"
+            )
+        options["channels"] = channels
+
+    return options
+
+
+def apply_image_options(image: np.ndarray, options: ImageOptions) -> np.ndarray:
+    """
+    Crop, downscale and select channels of an image. Everything is done with
+    strided views, so nothing is copied until encoding.
+    """
+    if options["roi"] is not None:
+        x, y, width, height = options["roi"]
+        image = image[y : y + height, x : x + width]
+
+    image = scale_image(image, options["scale"])
+
+    if image.ndim == 3:
+        if options["grayscale"]:
+            # green carries most of the luminance, and is the same in
+            # RGB(A) and BGR(A) images
+            image = image[..., 1]
+        elif options["channels"] is not None:
+            image = image[..., : options["channels"]]
+
+    return image
+
+
+def encode_image(
+    image: np.ndarray, compress: bool = False, level: int = zlib.Z_DEFAULT_COMPRESSION
+) -> ImageData:
+    """
+    Same output as `serialize_image`, but 8-bit images are turned into bytes
+    directly instead of going through a Python list of every value.
+    Other images fall back to `serialize_image`.
+    """
+    if image.dtype != np.uint8:
+        return serialize_image(image, compress=compress)
+
+    image_bytes = np.ascontiguousarray(image).tobytes()
+
+    if compress:
+        image_bytes = zlib.compress(image_bytes, level)
+
+    return ImageData(
+        data=base64.b64encode(image_bytes).decode("utf-8"),
+        shape=list(image.shape),
+        compressed=compress,
+    )
+
+
+class ImageEncoderPool:
+    """
+    Encodes images on worker threads, or processes, and hands the results to
+    `callback` from a worker thread. Waiting images are kept in a bounded queue
+    where the oldest image is dropped to make room for a new one, so a slow
+    encoder shows up as a lower frame rate instead of growing latency.
+
+    Until `start()` is called, images are encoded right away on the calling
+    thread.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, ImageData], None],
+        workers: int = 1,
+        max_queue: int = 2,
+        processes: bool = False,
+        nice: int = 0,
+    ) -> None:
+        """
+        `callback` is called with the tag the image was submitted with,
+        and its encoded data. With `processes`, encoding happens in
+        a process pool so it does not hold the GIL. `nice` lowers the
+        priority of the worker threads.
+        """
+        self.callback = callback
+        self.workers = workers
+        self.processes = processes
+        self.nice = nice
+
+        self._queue: Deque[Tuple[str, np.ndarray, bool, int]] = collections.deque(
+            maxlen=max_queue
+        )
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._running = False
+
+        self.encode_latency = LatencyTracker()
+        """
+        Time from an image being picked up by a worker to being encoded.
+        """
+        self.submitted = 0
+        """
+        Number of images submitted.
+        """
+        self.encoded = 0
+        """
+        Number of images encoded and handed to the callback.
+        """
+        self.dropped = 0
+        """
+        Number of images dropped because newer ones replaced them in the queue.
+        """
+        self.failed = 0
+        """
+        Number of images that failed to encode or send.
+        """
+
+    def start(self) -> None:
+        """
+        Start the workers.
+        """
+        if self.processes:
+            self._executor = concurrent.futures.ProcessPoolExecutor(self.workers)
+
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"image-encoder-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def close(self) -> None:
+        """
+        Stop the workers, dropping any images still waiting.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads.clear()
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def submit(
+        self,
+        tag: str,
+        image: np.ndarray,
+        compress: bool = False,
+        level: int = zlib.Z_DEFAULT_COMPRESSION,
+        scale: int = 1,
+    ) -> None:
+        """
+        Queue an image to be downscaled by `scale` and encoded.
+        """
+        self.submitted += 1
+        image = scale_image(image, scale)
+
+        if not self._running:
+            self._encode(tag, image, compress, level)
+            return
+
+        with self._condition:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1
+            self._queue.append((tag, image, compress, level))
+            self._condition.notify()
+
+    def _work(self) -> None:
+        lower_thread_priority(self.nice)
+
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+
+                if not self._running:
+                    return
+
+                job = self._queue.popleft()
+
+            self._encode(*job)
+
+    def _encode(self, tag: str, image: np.ndarray, compress: bool, level: int) -> None:
+        try:
+            start = time.perf_counter()
+
+            if self._executor is not None:
+                image_data = self._executor.submit(
+                    encode_image, image, compress, level
+                ).result()
+            else:
+                image_data = encode_image(image, compress, level)
+
+            self.encode_latency.record(time.perf_counter() - start)
+
+            self.callback(tag, image_data)
+            self.encoded += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"Failed to encode {tag} image: {e}")
@@ -1,4 +1,10 @@
-from typing import Tuple, TypedDict
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Literal, Optional, Protocol, Tuple, TypedDict
+
+if TYPE_CHECKING:
+    import numpy as np
+    from stats_library import LatencyTracker
 
 
 class CameraFrameData(TypedDict):
@@ -6,3 +12,45 @@ class CameraFrameData(TypedDict):
     translation: Tuple[float, float, float]
     velocity: Tuple[float, float, float]
     tracker_confidence: float
+    timestamp: int  # image timestamp, nanoseconds
+    frame_id: int  # shared with the images captured from the same grab
+
+
+class ImageFrameData(TypedDict):
+    image: np.ndarray
+    frame_id: int
+    timestamp: int  # image timestamp, nanoseconds
+
+
+class ImuData(TypedDict):
+    angular_velocity: Tuple[float, float, float]  # camera frame, rad/s
+    timestamp: int  # nanoseconds, same clock as the image timestamps
+
+
+class Camera(Protocol):
+    """
+    Interface shared by the camera backends `VIOModule` can read from.
+    """
+
+    grab_latency: LatencyTracker
+    """
+    Time spent waiting for each new frame.
+    """
+    pose_latency: LatencyTracker
+    """
+    Time spent fetching the pose of each new frame.
+    """
+
+    def setup(self) -> None: ...
+
+    def get_pipe_data(self) -> Optional[CameraFrameData]: ...
+
+    def get_imu_data(self) -> Optional[ImuData]: ...
+
+    def get_image_frame(
+        self, side: Literal["left", "right"]
+    ) -> Optional[ImageFrameData]: ...
+
+    def get_rgb_image(self, side: Literal["left", "right"]) -> Optional[np.ndarray]: ...
+
+    def close(self) -> None: ...
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import math
+import time
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+
+import numpy as np
+import transforms3d as t3d
+from attitude_library import rotation_exp, rotation_log
+
+if TYPE_CHECKING:
+    from nptyping import Float, NDArray, Shape
+
+
+class PosePredictor:
+    """
+    Extrapolates each camera frame from its image timestamp to the moment it is
+    published, so the pose is current rather than a grab and a transform old.
+    The position moves along the frame's velocity, and the attitude turns at
+    the rate seen between the last two frames.
+
+    Extrapolation stops at `horizon` seconds, and each correction is clamped to
+    `max_position` cm and `max_angle` radians, so a stall or a bad frame can't
+    fling the pose away.
+    """
+
+    def __init__(
+        self,
+        horizon: float = 0.1,
+        max_position: float = 20.0,
+        max_angle: float = math.radians(10),
+    ) -> None:
+        self.horizon = horizon
+        self.max_position = max_position
+        self.max_angle = max_angle
+
+        self.predicted = 0
+        """
+        Number of frames extrapolated.
+        """
+        self.clamped = 0
+        """
+        Number of frames whose extrapolation was limited by the horizon or a clamp.
+        """
+        self.lead = 0.0
+        """
+        Seconds the last frame was extrapolated by.
+        """
+        self.position_correction = 0.0
+        """
+        Centimeters the last frame's position was moved by.
+        """
+        self.angle_correction = 0.0
+        """
+        Radians the last frame's attitude was turned by.
+        """
+
+        # attitude and timestamp of the previous frame, for the angular rate
+        self._R: Optional[NDArray[Shape["3, 3"], Float]] = None
+        self._timestamp = 0
+        self._rate = np.zeros(3)
+
+    def reset(self) -> None:
+        """
+        Forget the previous frame, like after a resync stepped the attitude,
+        so the next frame isn't turned until the rate is measured again.
+        """
+        self._R = None
+        self._rate = np.zeros(3)
+
+    def _update_rate(self, R: NDArray[Shape["3, 3"], Float], timestamp: int) -> None:
+        if self._R is not None and timestamp > self._timestamp:
+            # body rates, from the rotation between the two frames
+            self._rate = rotation_log(self._R.T.dot(R)) / (
+                (timestamp - self._timestamp) / 1e9
+            )
+
+        self._R = R
+        self._timestamp = timestamp
+
+    def predict(
+        self,
+        ned_pos: Tuple[float, float, float],
+        ned_vel: Tuple[float, float, float],
+        rpy: Tuple[float, float, float],
+        timestamp: int,
+        now: Optional[int] = None,
+    ) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+        """
+        Extrapolate a frame's position, in cm, along its velocity, in cm/s, and
+        its roll, pitch and yaw, in radians, from its image timestamp to `now`,
+        both in nanoseconds on the system clock. Frames with NaNs are returned
+        as they are.
+        """
+        if now is None:
+            now = time.time_ns()
+
+        if math.isnan(sum(ned_pos) + sum(ned_vel) + sum(rpy)):
+            return ned_pos, rpy
+
+        R = t3d.euler.euler2mat(*rpy, axes="rxyz")
+        self._update_rate(R, timestamp)
+
+        lead = (now - timestamp) / 1e9
+        if lead <= 0:
+            self.lead = self.position_correction = self.angle_correction = 0.0
+            return ned_pos, rpy
+
+        clamped = lead > self.horizon
+        lead = min(lead, self.horizon)
+
+        offset = np.asarray(ned_vel[:3]) * lead
+        distance = math.sqrt(float(offset.dot(offset)))
+        if distance > self.max_position:
+            offset *= self.max_position / distance
+            distance = self.max_position
+            clamped = True
+
+        turn = self._rate * lead
+        angle = math.sqrt(float(turn.dot(turn)))
+        if angle > self.max_angle:
+            turn *= self.max_angle / angle
+            angle = self.max_angle
+            clamped = True
+
+        self.predicted += 1
+        self.clamped += clamped
+        self.lead = lead
+        self.position_correction = distance
+        self.angle_correction = angle
+
+        n, e, d = (np.asarray(ned_pos) + offset).tolist()
+        roll, pitch, yaw = t3d.euler.mat2euler(R.dot(rotation_exp(turn)), axes="rxyz")
+        return (n, e, d), (roll, pitch, yaw)
+
+    def report(self) -> Dict[str, float]:
+        """
+        Counters and the correction applied to the last frame.
+        """
+        return {
+            "predicted": self.predicted,
+            "clamped": self.clamped,
+            "lead_ms": self.lead * 1000,
+            "position_correction_cm": self.position_correction,
+            "angle_correction_deg": math.degrees(self.angle_correction),
+        }
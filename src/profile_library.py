@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import cProfile
+import inspect
+import os
+import pstats
+import sys
+import threading
+import time
+from types import CodeType
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict
+
+import config
+from loguru import logger
+
+PROFILE_MODES = ("sampling", "cprofile")
+"""
+`sampling` periodically records the stack of every thread, and works on code
+that is already running. `cprofile` records every call made inside the
+profiled methods, on the threads calling them.
+"""
+
+
+class ProfileRequest(TypedDict):
+    mode: str
+    duration: float  # seconds
+    interval: float  # seconds between samples, sampling only
+    top: int  # functions in the summary
+
+
+def parse_profile_request(payload: Dict[str, Any]) -> ProfileRequest:
+    """
+    Validate a profiling request received over MQTT. Fields that are missing
+    keep their default.
+    """
+    unknown = set(payload) - set(ProfileRequest.__annotations__)
+    if unknown:
+        raise ValueError(f"Unknown profile options {sorted(unknown)}")
+
+    mode = payload.get("mode", "sampling")
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Profile mode must be one of {PROFILE_MODES}, not {mode}")
+
+    duration = payload.get("duration", 10)
+    if (
+        not isinstance(duration, (int, float))
+        or not 0 < duration <= config.PROFILE_MAX_DURATION
+    ):
+        raise ValueError(
+            f"Profile duration must be between 0 and {config.PROFILE_MAX_DURATION}"
+            + f" seconds, not {duration}"
+        )
+
+    interval = payload.get("interval", 0.005)
+    if not isinstance(interval, (int, float)) or interval <= 0:
+        raise ValueError(f"Profile interval must be positive, not {interval}")
+
+    top = payload.get("top", 20)
+    if not isinstance(top, int) or top < 1:
+        raise ValueError(f"Profile top must be a positive integer, not {top}")
+
+    return ProfileRequest(
+        mode=mode, duration=float(duration), interval=float(interval), top=top
+    )
+
+
+def _function_name(code: CodeType) -> str:
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class ProfileSession:
+    """
+    A single profiling run. Nothing is hooked into the profiled code outside of
+    `run`, so there is no overhead when not profiling.
+
+    Sampling writes the stacks in the collapsed format flame graph tools read.
+    cProfile writes a `pstats` file.
+    """
+
+    def __init__(
+        self,
+        request: ProfileRequest,
+        directory: str,
+        targets: List[Tuple[object, str]],
+    ) -> None:
+        """
+        `targets` are the `(object, method name)` pairs to profile in `cprofile`
+        mode. Each is replaced by a profiled wrapper on the instance while the
+        session runs, so the loops calling them pick it up on their next call.
+        """
+        self.request = request
+        self.directory = directory
+        self.targets = targets
+
+        self.done = False
+
+        # per thread profiler, and how deep in profiled calls the thread is
+        self._profiles: Dict[int, List[Any]] = {}
+        self._profiles_lock = threading.Lock()
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Profile for the requested duration, write the profile out, and return
+        a summary of the top functions.
+        """
+        start = time.perf_counter()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+
+        try:
+            if self.request["mode"] == "sampling":
+                path = os.path.join(self.directory, f"vio-profile-{stamp}.txt")
+                summary = self._run_sampling(path)
+            else:
+                path = os.path.join(self.directory, f"vio-profile-{stamp}.prof")
+                summary = self._run_cprofile(path)
+        finally:
+            self.done = True
+
+        logger.info(f"Wrote {self.request['mode']} profile to {path}")
+        return {
+            "mode": self.request["mode"],
+            "duration": time.perf_counter() - start,
+            "file": path,
+            **summary,
+        }
+
+    def _run_sampling(self, path: str) -> Dict[str, Any]:
+        stacks: Dict[str, int] = {}
+        threads: Dict[str, int] = {}
+        self_samples: Dict[str, int] = {}
+        total_samples: Dict[str, int] = {}
+        names: Dict[CodeType, str] = {}
+
+        me = threading.get_ident()
+        end = time.monotonic() + self.request["duration"]
+
+        while time.monotonic() < end:
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    name = names.get(code)
+                    if name is None:
+                        name = names[code] = _function_name(code)
+                    stack.append(name)
+                    frame = frame.f_back
+
+                thread = thread_names.get(ident, str(ident))
+                threads[thread] = threads.get(thread, 0) + 1
+
+                if stack:
+                    self_samples[stack[0]] = self_samples.get(stack[0], 0) + 1
+                    # recursive functions only count once per sample
+                    for name in set(stack):
+                        total_samples[name] = total_samples.get(name, 0) + 1
+
+                collapsed = ";".join([thread, *reversed(stack)])
+                stacks[collapsed] = stacks.get(collapsed, 0) + 1
+
+            time.sleep(self.request["interval"])
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(path, "w") as f:
+            for collapsed, count in stacks.items():
+                f.write(f"{collapsed} {count}\n")
+
+        top = sorted(self_samples, key=self_samples.__getitem__, reverse=True)
+        return {
+            "samples": sum(threads.values()),
+            "threads": threads,
+            "functions": [
+                {
+                    "function": name,
+                    "self_samples": self_samples[name],
+                    "total_samples": total_samples[name],
+                }
+                for name in top[: self.request["top"]]
+            ],
+        }
+
+    def _thread_profile(self) -> List[Any]:
+        ident = threading.get_ident()
+        profile = self._profiles.get(ident)
+        if profile is None:
+            with self._profiles_lock:
+                profile = self._profiles[ident] = [cProfile.Profile(), 0]
+
+        return profile
+
+    def _profiled(self, func: Callable) -> Callable:
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            profile = self._thread_profile()
+
+            # profiled methods can call each other
+            profile[1] += 1
+            if profile[1] == 1:
+                profile[0].enable()
+
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile[1] -= 1
+                if profile[1] == 0:
+                    profile[0].disable()
+
+        return wrapper
+
+    def _run_cprofile(self, path: str) -> Dict[str, Any]:
+        patched = []
+        for obj, name in self.targets:
+            original = getattr(obj, name, None)
+            if original is None:
+                # like a callback that is not connected yet
+                continue
+
+            # methods are shadowed on the instance and deleted again after,
+            # anything else, like callback properties, is set back
+            shadowed = name not in vars(obj) and inspect.isfunction(
+                getattr(type(obj), name, None)
+            )
+            setattr(obj, name, self._profiled(original))
+            patched.append((obj, name, original, shadowed))
+
+        try:
+            time.sleep(self.request["duration"])
+        finally:
+            for obj, name, original, shadowed in patched:
+                if shadowed:
+                    delattr(obj, name)
+                else:
+                    setattr(obj, name, original)
+
+        # let calls that were already running finish
+        deadline = time.monotonic() + 1
+        while (
+            any(depth for _, depth in list(self._profiles.values()))
+            and time.monotonic() < deadline
+        ):
+            time.sleep(0.001)
+
+        profiles = [profile for profile, _ in self._profiles.values()]
+        if not profiles:
+            return {"functions": []}
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        os.makedirs(self.directory, exist_ok=True)
+        stats.dump_stats(path)
+
+        # (file, line, name) -> (primitive calls, calls, self time, total time, callers)
+        entries = stats.stats  # type: ignore
+        top = sorted(entries, key=lambda key: entries[key][2], reverse=True)
+        return {
+            "functions": [
+                {
+                    "function": f"{name} ({os.path.basename(filename)}:{line})",
+                    "calls": entries[(filename, line, name)][1],
+                    "self_s": entries[(filename, line, name)][2],
+                    "total_s": entries[(filename, line, name)][3],
+                }
+                for filename, line, name in top[: self.request["top"]]
+            ],
+        }
+
+
+def start_profile(
+    request: ProfileRequest,
+    targets: List[Tuple[object, str]],
+    callback: Callable[[Dict[str, Any]], None],
+    directory: Optional[str] = None,
+) -> ProfileSession:
+    """
+    Run a profiling session in the background, and call `callback` with its
+    summary once done.
+    """
+    session = ProfileSession(request, directory or config.PROFILE_DIR, targets)
+
+    def run() -> None:
+        try:
+            callback(session.run())
+        except Exception as e:
+            logger.exception(f"Profiling failed: {e}")
+
+    threading.Thread(target=run, name="profiler", daemon=True).start()
+    return session
@@ -0,0 +1,208 @@
+import math
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import config
+from loguru import logger
+from stats_library import LatencyTracker
+
+
+class TopicThrottle:
+    """
+    Decides which updates of a topic are worth publishing. Only every
+    `decimation`-th update is considered, and with a `deadband` only when a
+    value changed by more than it since the last one published, or
+    `max_period` seconds have passed.
+
+    The attitude and heading are published from both the pose loop and the IMU
+    thread, so updates are decided one at a time.
+    """
+
+    def __init__(
+        self,
+        decimation: int = 1,
+        deadband: Optional[float] = None,
+        max_period: Optional[float] = None,
+    ) -> None:
+        """
+        A `decimation` of 0 never publishes.
+        """
+        self.decimation = decimation
+        self.deadband = deadband
+        self.max_period = max_period
+
+        self._updates = 0
+        self._last_values: Optional[Sequence[float]] = None
+        self._last_published = -math.inf
+        self._lock = threading.Lock()
+
+        self.suppressed = 0
+        """
+        Number of updates not published.
+        """
+
+    def ready(self, values: Sequence[float], now: Optional[float] = None) -> bool:
+        """
+        Whether an update with these values should be published. When it is,
+        it is taken as the last published update.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        with self._lock:
+            return self._ready(values, now)
+
+    def _ready(self, values: Sequence[float], now: float) -> bool:
+        updates = self._updates
+        self._updates += 1
+
+        if not self.decimation or updates % self.decimation:
+            self.suppressed += 1
+            return False
+
+        if self.deadband is not None and self._last_values is not None:
+            changed = any(
+                abs(value - last) > self.deadband
+                for value, last in zip(values, self._last_values)
+            )
+            expired = (
+                self.max_period is not None
+                and now - self._last_published >= self.max_period
+            )
+            if not changed and not expired:
+                self.suppressed += 1
+                return False
+
+        self._last_values = values
+        self._last_published = now
+        return True
+
+
+def create_topic_throttles(topics: Iterable[str]) -> Dict[str, TopicThrottle]:
+    """
+    Create a throttle for each topic, with the settings in `config.TOPIC_THROTTLE`.
+    """
+    return {
+        topic: TopicThrottle(**config.TOPIC_THROTTLE.get(topic, {})) for topic in topics
+    }
+
+
+class CoalescingPublisher:
+    """
+    Sends messages from a dedicated thread, so a slow or reconnecting broker
+    never holds up whoever is publishing. Only the newest message of each topic
+    is kept waiting, so the queue can never grow past the number of topics,
+    and stale poses are replaced instead of sent late.
+
+    Until `start()` is called, messages are sent right away on the calling thread.
+    """
+
+    def __init__(
+        self, send: Callable[[str, Any], None], name: str = "publisher"
+    ) -> None:
+        self.send = send
+        self.name = name
+
+        self._pending: Dict[str, Tuple[Any, float]] = {}
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        self.queue_latency = LatencyTracker()
+        """
+        Time messages spent waiting to be sent.
+        """
+        self.send_latency = LatencyTracker()
+        """
+        Time spent sending each message.
+        """
+        self.sent = 0
+        """
+        Number of messages sent.
+        """
+        self.coalesced = 0
+        """
+        Number of messages replaced by a newer one of the same topic before
+        being sent.
+        """
+        self.failed = 0
+        """
+        Number of messages that failed to send.
+        """
+        self.max_depth = 0
+        """
+        Most messages ever waiting at once.
+        """
+
+    @property
+    def depth(self) -> int:
+        """
+        Number of messages waiting to be sent.
+        """
+        return len(self._pending)
+
+    def start(self) -> None:
+        """
+        Start the sender thread.
+        """
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        """
+        Send whatever is waiting, and stop the sender thread.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def publish(self, topic: str, payload: Any) -> None:
+        """
+        Queue a message to be sent, replacing any message of the same topic
+        still waiting.
+        """
+        if not self._running:
+            self._send(topic, payload, time.perf_counter())
+            return
+
+        with self._condition:
+            # re-insert so topics are sent in the order they were last published
+            if self._pending.pop(topic, None) is not None:
+                self.coalesced += 1
+            self._pending[topic] = (payload, time.perf_counter())
+            self.max_depth = max(self.max_depth, len(self._pending))
+            self._condition.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+
+                if not self._pending:
+                    return
+
+                pending = self._pending
+                self._pending = {}
+
+            for topic, (payload, queued) in pending.items():
+                self._send(topic, payload, queued)
+
+    def _send(self, topic: str, payload: Any, queued: float) -> None:
+        start = time.perf_counter()
+        self.queue_latency.record(start - queued)
+
+        try:
+            self.send(topic, payload)
+            self.sent += 1
+        except Exception as e:
+            self.failed += 1
+            logger.exception(f"Failed to send {topic}: {e}")
+
+        self.send_latency.record(time.perf_counter() - start)
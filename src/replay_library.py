@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from typing import BinaryIO, Literal, Optional
+
+import numpy as np
+from bell.avr.utils.decorators import try_except
+from loguru import logger
+from models import CameraFrameData, ImageFrameData, ImuData
+from stats_library import LatencyTracker
+
+FRAME_RECORD_MAGIC = b"AVRVIOFR"
+"""
+First bytes of every recording file.
+"""
+
+FRAME_RECORD_VERSION = 1
+"""
+Version of the record layout below. Bump this when changing it.
+"""
+
+FRAME_RECORD_DTYPE = np.dtype(
+    [
+        ("timestamp", "<i8"),  # ZED image timestamp, nanoseconds
+        ("rotation", "<f8", (4,)),  # quaternion
+        ("translation", "<f8", (3,)),
+        ("velocity", "<f8", (3,)),
+        ("tracker_confidence", "<f8"),
+    ]
+)
+"""
+Layout of a single fixed size record. Recordings are a small header followed
+by a flat array of these, so they can be memory-mapped directly.
+"""
+
+FRAME_RECORD_HEADER_DTYPE = np.dtype(
+    [("magic", "S8"), ("version", "<u4"), ("record_size", "<u4")]
+)
+"""
+Layout of the 16 byte header at the start of a recording.
+"""
+
+_HD720_SHAPE = (720, 1280, 4)
+
+
+def _make_header() -> bytes:
+    header = np.zeros(1, dtype=FRAME_RECORD_HEADER_DTYPE)
+    header["magic"] = FRAME_RECORD_MAGIC
+    header["version"] = FRAME_RECORD_VERSION
+    header["record_size"] = FRAME_RECORD_DTYPE.itemsize
+    return header.tobytes()
+
+
+def load_recording(path: str) -> np.memmap:
+    """
+    Memory-map a recording made by `FrameRecorder` as a NumPy structured array
+    with `FRAME_RECORD_DTYPE` records.
+    """
+    header = np.fromfile(path, dtype=FRAME_RECORD_HEADER_DTYPE, count=1)
+    if (
+        len(header) != 1
+        or header["magic"][0] != FRAME_RECORD_MAGIC
+        or header["version"][0] != FRAME_RECORD_VERSION
+        or header["record_size"][0] != FRAME_RECORD_DTYPE.itemsize
+    ):
+        raise ValueError(f"{path} is not a version {FRAME_RECORD_VERSION} recording")
+
+    # ignore a partially written record at the end, if the recorder was killed
+    count = (
+        os.path.getsize(path) - FRAME_RECORD_HEADER_DTYPE.itemsize
+    ) // FRAME_RECORD_DTYPE.itemsize
+
+    return np.memmap(
+        path,
+        dtype=FRAME_RECORD_DTYPE,
+        mode="r",
+        offset=FRAME_RECORD_HEADER_DTYPE.itemsize,
+        shape=(count,),
+    )
+
+
+class FrameRecorder:
+    """
+    Appends camera frames to a recording file from a background thread.
+    `record` never blocks. If the writer falls behind, frames are dropped
+    and counted instead.
+    """
+
+    def __init__(self, path: str, max_queue: int = 1024) -> None:
+        self.path = path
+
+        self.recorded = 0
+        self.dropped = 0
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._file = self._open(path)
+        self._thread = threading.Thread(
+            target=self._write_loop, name="frame-recorder", daemon=True
+        )
+        self._thread.start()
+
+    @staticmethod
+    def _open(path: str) -> BinaryIO:
+        exists = os.path.isfile(path) and os.path.getsize(path) > 0
+        if exists:
+            # validates the header before we start appending to it
+            load_recording(path)
+
+        f = open(path, "ab")
+        if not exists:
+            f.write(_make_header())
+            f.flush()
+
+        logger.debug(f"Recording camera frames to {path}")
+        return f
+
+    def record(self, data: CameraFrameData) -> None:
+        """
+        Queue a frame to be written.
+        """
+        try:
+            self._queue.put_nowait(
+                (
+                    data["timestamp"],
+                    data["rotation"],
+                    data["translation"],
+                    data["velocity"],
+                    data["tracker_confidence"],
+                )
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def _write_loop(self) -> None:
+        # reused between batches, only grows if a larger batch shows up
+        buffer = np.zeros(64, dtype=FRAME_RECORD_DTYPE)
+        running = True
+
+        while running:
+            # drain whatever else is waiting so it goes out in one write
+            items = [self._queue.get()]
+            while True:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if items[-1] is None:
+                running = False
+                items.pop()
+
+            if len(items) > len(buffer):
+                buffer = np.zeros(len(items), dtype=FRAME_RECORD_DTYPE)
+
+            if items:
+                self._write(buffer[: len(items)], items)
+
+    @try_except(reraise=False)
+    def _write(self, batch: np.ndarray, items: list) -> None:
+        batch[:] = items
+        self._file.write(batch.tobytes())
+        self._file.flush()
+        self.recorded += len(items)
+
+    def close(self) -> None:
+        """
+        Write out everything still queued and close the file.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        self._file.close()
+
+
+class ReplayCamera:
+    """
+    Plays back a recording made with `FrameRecorder`. Drop-in replacement for
+    `ZEDCamera`, so the rest of the module can run without the camera.
+    Frame timestamps are moved to the current system clock, keeping their
+    spacing scaled by the playback speed.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False) -> None:
+        """
+        `speed` is the playback rate relative to real time. 0 plays the
+        recording back as fast as possible, with every frame timestamped when
+        it is played back. With `loop`, playback starts over
+        once the end of the recording is reached.
+        """
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+
+        self.frames: Optional[np.memmap] = None
+        self.index = 0
+
+        # ID and timestamp of the last frame played back
+        self.frame_id = 0
+        self.timestamp = 0
+
+        # time spent waiting for each frame to be due, and decoding it
+        self.grab_latency = LatencyTracker()
+        self.pose_latency = LatencyTracker()
+
+        # nothing to retrieve images from, so hand out a blank frame
+        self._blank_image = np.zeros(_HD720_SHAPE, dtype=np.uint8)
+
+    @try_except(reraise=True)
+    def setup(self) -> None:
+        self.frames = load_recording(self.path)
+        logger.success(f"Loaded {len(self.frames)} recorded frames from {self.path}")
+        self._restart()
+
+    def _restart(self) -> None:
+        assert self.frames is not None
+
+        self.index = 0
+        self._start = time.monotonic()
+        self._start_ns = time.time_ns()
+        if len(self.frames):
+            self._first_timestamp = int(self.frames[0]["timestamp"])
+
+    def get_pipe_data(self) -> Optional[CameraFrameData]:
+        assert self.frames is not None
+
+        if self.index >= len(self.frames):
+            if not self.loop or not len(self.frames):
+                return
+
+            self._restart()
+
+        start = time.perf_counter()
+
+        record = self.frames[self.index]
+        self.index += 1
+
+        recorded = int(record["timestamp"])
+        self.frame_id += 1
+
+        if self.speed > 0:
+            # wait until this frame is due, relative to the start of playback
+            elapsed = (recorded - self._first_timestamp) / self.speed
+            due = self._start + elapsed / 1e9 - time.monotonic()
+            if due > 0:
+                time.sleep(due)
+
+            # timestamps are on the system clock like the camera's, as of
+            # when the frame is played back, so latencies and resyncs line up
+            timestamp = self._start_ns + round(elapsed)
+        else:
+            timestamp = time.time_ns()
+
+        self.timestamp = timestamp
+
+        loaded = time.perf_counter()
+        self.grab_latency.record(loaded - start)
+
+        data = CameraFrameData(
+            rotation=tuple(record["rotation"].tolist()),  # type: ignore
+            translation=tuple(record["translation"].tolist()),  # type: ignore
+            velocity=tuple(record["velocity"].tolist()),  # type: ignore
+            tracker_confidence=float(record["tracker_confidence"]),
+            timestamp=timestamp,
+            frame_id=self.frame_id,
+        )
+
+        self.pose_latency.record(time.perf_counter() - loaded)
+        return data
+
+    def get_imu_data(self) -> Optional[ImuData]:
+        """
+        Recordings do not contain IMU samples.
+        """
+        return None
+
+    def get_image_frame(self, side: Literal["left", "right"]) -> ImageFrameData:
+        """
+        Recordings do not contain images, so this is always a blank HD720 frame,
+        tagged with the last frame played back.
+        """
+        return ImageFrameData(
+            image=self._blank_image, frame_id=self.frame_id, timestamp=self.timestamp
+        )
+
+    def get_rgb_image(self, side: Literal["left", "right"]) -> np.ndarray:
+        """
+        Recordings do not contain images, so this is always a blank HD720 frame.
+        """
+        return self._blank_image
+
+    def close(self) -> None:
+        pass
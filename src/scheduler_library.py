@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from loguru import logger
+
+IMAGE_LEVELS = ((1, 1), (2, 1), (2, 2), (4, 2), (4, 4))
+"""
+Image stream back-off levels, as the factors the requested frequency is divided
+by and the requested downscale is multiplied by. Frequency drops first, then
+resolution.
+"""
+
+
+def lower_thread_priority(nice: int) -> None:
+    """
+    Raise the nice value of the calling thread by `nice`, so the kernel favors
+    the other threads of the module. Linux nice values are per thread.
+    Does nothing where that is not supported.
+    """
+    if not nice:
+        return
+
+    try:
+        tid = threading.get_native_id()
+        os.setpriority(
+            os.PRIO_PROCESS, tid, os.getpriority(os.PRIO_PROCESS, tid) + nice
+        )
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not lower thread priority: {e}")
+
+
+class AdaptiveScheduler:
+    """
+    Deadline-aware pacing of the pose loop, which also decides how much the
+    image stream has to back off to keep the pose loop on time.
+
+    Every pose iteration is due one period after the last. An iteration misses
+    its deadline when processing the frame takes longer than `budget` of the
+    period, or when the loop falls a whole period behind. At the end of every
+    `window` seconds, if more than `miss_threshold` of the iterations missed,
+    the image stream backs off a level, or once it can't back off any further,
+    the pose rate is lowered towards `base_rate`. If nothing missed and
+    processing used less than `headroom` of the period, the image stream is
+    restored a level, or once fully restored, the pose rate is raised
+    towards `max_rate`.
+    """
+
+    def __init__(
+        self,
+        base_rate: float,
+        max_rate: float,
+        budget: float = 0.5,
+        miss_threshold: float = 0.05,
+        headroom: float = 0.25,
+        window: float = 2.0,
+        rate_step: float = 1.25,
+    ) -> None:
+        self.base_rate = base_rate
+        self.max_rate = max(max_rate, base_rate)
+        self.budget = budget
+        self.miss_threshold = miss_threshold
+        self.headroom = headroom
+        self.window = window
+        self.rate_step = rate_step
+
+        self.pose_rate = base_rate
+        """
+        Pose iterations per second the loop currently runs at.
+        """
+        self.image_level = 0
+        """
+        Index into `IMAGE_LEVELS` the image stream is currently backed off to.
+        """
+        self.images_streaming = False
+        """
+        Whether an image stream is running, and so can be backed off.
+        """
+        self.iterations = 0
+        """
+        Number of pose iterations.
+        """
+        self.misses = 0
+        """
+        Number of pose iterations that missed their deadline.
+        """
+        self.last_decision = ""
+        """
+        Description of the last change made.
+        """
+
+        self._deadline: Optional[float] = None
+        self._pose_busy = False
+
+        self._window_start = time.perf_counter()
+        self._window_iterations = 0
+        self._window_misses = 0
+        self._window_busy = 0.0
+        self._utilization = 0.0
+
+    def next_pose_delay(self, now: Optional[float] = None) -> float:
+        """
+        Schedule the next pose iteration, and return how many seconds until
+        it is due.
+        """
+        if now is None:
+            now = time.perf_counter()
+
+        period = 1 / self.pose_rate
+        if self._deadline is None:
+            self._deadline = now
+        else:
+            self._deadline += period
+            if now - self._deadline > period:
+                # a whole period behind, start over from now instead of
+                # bursting to catch up
+                self._deadline = now
+                self._miss()
+
+        return max(self._deadline - now, 0.0)
+
+    def wait_for_pose(self) -> None:
+        """
+        Sleep until the next pose iteration is due.
+        """
+        delay = self.next_pose_delay()
+        if delay > 0:
+            time.sleep(delay)
+
+    def pose_started(self) -> None:
+        """
+        Record that a frame arrived and is being processed. Images wait until
+        `pose_done`.
+        """
+        self._pose_busy = True
+
+    def pose_done(self, duration: Optional[float], now: Optional[float] = None) -> None:
+        """
+        Record the end of a pose iteration, with how long processing the frame
+        took in seconds, or None if there was no frame to process.
+        """
+        if now is None:
+            now = time.perf_counter()
+
+        self._pose_busy = False
+        self.iterations += 1
+        self._window_iterations += 1
+
+        if duration is not None:
+            self._window_busy += duration
+            if duration > self.budget / self.pose_rate:
+                self._miss()
+
+        if now - self._window_start >= self.window:
+            self._adapt(now)
+
+    def _miss(self) -> None:
+        self.misses += 1
+        self._window_misses += 1
+
+    def _decide(self, decision: str) -> None:
+        self.last_decision = decision
+        logger.info(f"Scheduler: {decision}")
+
+    def _adapt(self, now: float) -> None:
+        iterations = max(self._window_iterations, 1)
+        miss_ratio = self._window_misses / iterations
+        # mean processing time as a fraction of the period
+        self._utilization = self._window_busy * self.pose_rate / iterations
+
+        if miss_ratio > self.miss_threshold:
+            if self.images_streaming and self.image_level < len(IMAGE_LEVELS) - 1:
+                self.image_level += 1
+                self._decide(f"backed off image stream to level {self.image_level}")
+            elif self.pose_rate > self.base_rate:
+                self.pose_rate = max(self.pose_rate / self.rate_step, self.base_rate)
+                self._decide(f"lowered pose rate to {self.pose_rate:.1f} Hz")
+        elif not self._window_misses and self._utilization < self.headroom:
+            if self.image_level > 0:
+                self.image_level -= 1
+                self._decide(f"restored image stream to level {self.image_level}")
+            elif self.pose_rate < self.max_rate:
+                self.pose_rate = min(self.pose_rate * self.rate_step, self.max_rate)
+                self._decide(f"raised pose rate to {self.pose_rate:.1f} Hz")
+
+        self._window_start = now
+        self._window_iterations = 0
+        self._window_misses = 0
+        self._window_busy = 0.0
+
+    def image_allowed(self) -> bool:
+        """
+        Whether the image stream may send an image now. Images wait while
+        a pose frame is being processed.
+        """
+        return not self._pose_busy
+
+    def image_settings(self, frequency: float, scale: int) -> Tuple[float, int]:
+        """
+        Image stream frequency and downscale to use instead of the requested ones.
+        """
+        frequency_divisor, scale_factor = IMAGE_LEVELS[self.image_level]
+        return frequency / frequency_divisor, scale * scale_factor
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Current decisions of the scheduler.
+        """
+        frequency_divisor, scale_factor = IMAGE_LEVELS[self.image_level]
+        return {
+            "pose_rate": self.pose_rate,
+            "image_level": self.image_level,
+            "image_frequency_divisor": frequency_divisor,
+            "image_scale_factor": scale_factor,
+            "iterations": self.iterations,
+            "misses": self.misses,
+            "utilization": self._utilization,
+            "last_decision": self.last_decision,
+        }
@@ -0,0 +1,167 @@
+import os
+import time
+from typing import Dict
+
+import numpy as np
+
+# fallback for process_uptime, where /proc can't be read
+_IMPORTED_AT = time.monotonic()
+
+
+def process_uptime() -> float:
+    """
+    Seconds since the process started. Read from /proc on Linux, so it counts
+    the interpreter starting and the imports too. Elsewhere it counts from
+    when this module was imported.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            stat = f.read()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+
+        # the command name can contain spaces, so split after it.
+        # starttime is the 22nd field, in clock ticks since boot.
+        fields = stat[stat.rindex(")") + 2 :].split()
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.monotonic() - _IMPORTED_AT
+
+
+class LatencyTracker:
+    """
+    Rolling window of latency samples, kept in a fixed size ring buffer so
+    recording a sample never allocates. Percentiles are only computed when
+    asked for.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._samples = np.zeros(capacity)
+        self._index = 0
+
+        self.count = 0
+        """
+        Total number of samples ever recorded.
+        """
+
+    def record(self, seconds: float) -> None:
+        """
+        Record a latency sample, in seconds.
+        """
+        self._samples[self._index] = seconds
+        self._index += 1
+        if self._index == len(self._samples):
+            self._index = 0
+        self.count += 1
+
+    def reset(self) -> None:
+        """
+        Forget every sample recorded so far.
+        """
+        self._index = 0
+        self.count = 0
+
+    def percentiles(self) -> Dict[str, float]:
+        """
+        p50/p95/p99/max of the samples currently in the window, in milliseconds.
+        All zero if nothing has been recorded yet.
+        """
+        samples = self._samples[: min(self.count, len(self._samples))]
+        if not len(samples):
+            return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+
+        p50, p95, p99 = np.percentile(samples, (50, 95, 99)) * 1000
+        return {
+            "p50": float(p50),
+            "p95": float(p95),
+            "p99": float(p99),
+            "max": float(samples.max() * 1000),
+        }
+
+
+class FrameLoopStats:
+    """
+    Counters for the pose loop, updated once per grabbed frame.
+    Only does integer and float arithmetic so it is cheap enough for every frame.
+    """
+
+    def __init__(self, frame_period: float) -> None:
+        """
+        `frame_period` is the expected time between camera frames, in seconds.
+        """
+        self.frame_period = frame_period
+
+        self.frames = 0
+        """
+        Frames grabbed from the camera.
+        """
+        self.published = 0
+        """
+        Frames transformed and published.
+        """
+        self.dropped = 0
+        """
+        Camera frames that were never grabbed, based on gaps in the image timestamps.
+        """
+        self.lagged = 0
+        """
+        Frames that took longer than a frame period to process,
+        so the next frame was already waiting.
+        """
+        self.failed = 0
+        """
+        Grabs that returned no frame.
+        """
+        self.rejected = 0
+        """
+        Frames not published because they had NaNs.
+        """
+        self.overruns = 0
+        """
+        Iterations of the polling loop that took longer than its period.
+        """
+
+        self._last_timestamp = 0
+
+    def grabbed(self, timestamp: int) -> None:
+        """
+        Record a grabbed frame with its image timestamp in nanoseconds.
+        """
+        self.frames += 1
+
+        if self._last_timestamp:
+            gap = (timestamp - self._last_timestamp) / 1e9
+            missed = round(gap / self.frame_period) - 1
+            if missed > 0:
+                self.dropped += missed
+
+        self._last_timestamp = timestamp
+
+    def processed(self, duration: float) -> None:
+        """
+        Record a published frame and how long it took to process, in seconds.
+        """
+        self.published += 1
+
+        if duration > self.frame_period:
+            self.lagged += 1
+
+    def failed_grab(self) -> None:
+        """
+        Record a grab that returned no frame.
+        """
+        self.failed += 1
+
+    def rejected_frame(self) -> None:
+        """
+        Record a frame that was not published because it had NaNs.
+        """
+        self.rejected += 1
+
+    def looped(self, duration: float, period: float) -> None:
+        """
+        Record an iteration of the polling loop and how long it took, against
+        the loop's period, in seconds.
+        """
+        if duration > period:
+            self.overruns += 1
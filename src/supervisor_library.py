@@ -0,0 +1,149 @@
+import time
+from typing import Any, Dict, Optional
+
+SUPERVISOR_STATES = ("running", "failing", "reconnecting", "recovering")
+"""
+`running` while grabs succeed, `failing` after a grab failed, `reconnecting`
+once too many grabs failed in a row and the camera has to be reopened, and
+`recovering` after it was reopened, until the next grab succeeds.
+"""
+
+
+class CameraSupervisor:
+    """
+    Decides when a camera that stopped delivering frames has to be closed and
+    opened again, and how long to wait between attempts.
+
+    `failure_limit` grabs failing in a row start a reconnect. The first attempt
+    is made right away, and every failed attempt doubles the wait before the
+    next one, from `backoff` up to `max_backoff` seconds. A reopened camera
+    that still can't grab counts as a failed attempt, and the wait only starts
+    over once grabs succeed again. The recovery time is measured from the
+    first failed grab to the first grab succeeding again.
+    """
+
+    def __init__(
+        self, failure_limit: int = 5, backoff: float = 0.1, max_backoff: float = 5.0
+    ) -> None:
+        self.failure_limit = max(failure_limit, 1)
+        self.backoff = backoff
+        self.max_backoff = max(max_backoff, backoff)
+
+        self.state = "running"
+        """
+        One of `SUPERVISOR_STATES`.
+        """
+        self.consecutive_failures = 0
+        """
+        Number of grabs that failed since the last one that succeeded.
+        """
+        self.reconnects = 0
+        """
+        Number of times the camera was reopened.
+        """
+        self.reconnect_failures = 0
+        """
+        Number of attempts to reopen the camera that failed.
+        """
+        self.recoveries = 0
+        """
+        Number of times grabs succeeded again after a reconnect.
+        """
+        self.recovery_time: Optional[float] = None
+        """
+        Seconds from the first failed grab to grabs succeeding again, of the
+        last reconnect.
+        """
+
+        self._failed_at = 0.0
+        self._retry_at = 0.0
+        self._delay = 0.0
+
+    def grab_failed(self, now: Optional[float] = None) -> bool:
+        """
+        Record a failed grab. Returns True when it is the one that starts
+        a reconnect.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        self.consecutive_failures += 1
+        if self.state == "running":
+            self.state = "failing"
+            self._failed_at = now
+
+        if self.consecutive_failures < self.failure_limit:
+            return False
+
+        if self.state == "failing":
+            self.state = "reconnecting"
+            self._retry_at = now
+            return True
+
+        if self.state == "recovering":
+            self.state = "reconnecting"
+            self.reopen_failed(now)
+            return True
+
+        return False
+
+    def grab_succeeded(self, now: Optional[float] = None) -> None:
+        """
+        Record a successful grab.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        if self.state == "recovering":
+            self.recoveries += 1
+            self.recovery_time = now - self._failed_at
+
+        self.state = "running"
+        self._delay = 0.0
+        self.consecutive_failures = 0
+
+    def retry_delay(self, now: Optional[float] = None) -> float:
+        """
+        Seconds until the camera should be reopened again.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        return max(self._retry_at - now, 0.0)
+
+    def reopen_failed(self, now: Optional[float] = None) -> float:
+        """
+        Record a failed attempt to reopen the camera, and return the seconds
+        until the next one.
+        """
+        if now is None:
+            now = time.monotonic()
+
+        self.reconnect_failures += 1
+        self._delay = min(max(self._delay * 2, self.backoff), self.max_backoff)
+        self._retry_at = now + self._delay
+        return self._delay
+
+    def reopened(self) -> None:
+        """
+        Record that the camera was reopened. Grabs get another `failure_limit`
+        tries before the next reconnect.
+        """
+        self.reconnects += 1
+        self.consecutive_failures = 0
+        self.state = "recovering"
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Current state and counters.
+        """
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "reconnects": self.reconnects,
+            "reconnect_failures": self.reconnect_failures,
+            "recoveries": self.recoveries,
+            "recovery_ms": (
+                self.recovery_time * 1000 if self.recovery_time is not None else None
+            ),
+        }
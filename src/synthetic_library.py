@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import math
+import time
+from typing import Literal, Optional, Tuple
+
+import numpy as np
+import transforms3d as t3d
+from bell.avr.utils.decorators import try_except
+from loguru import logger
+from models import CameraFrameData, ImageFrameData, ImuData
+from stats_library import LatencyTracker
+from vio_library import CameraCoordinateTransformation
+
+TRAJECTORIES = ("hover", "circle", "figure8")
+"""
+Paths the synthetic camera can fly.
+"""
+
+_HD720_SHAPE = (720, 1280, 4)
+# horizontal period of the synthetic image texture, and the offset of the
+# right image from the left one, in pixels
+_TEXTURE_PERIOD = 256
+_DISPARITY = 16
+# pixels the texture moves per meter travelled east
+_PIXELS_PER_METER = 100
+
+
+def trajectory_point(
+    trajectory: str, t: float, radius: float, period: float, altitude: float
+) -> Tuple[Tuple[float, float, float], Tuple[float, float, float], float]:
+    """
+    Position and velocity in meters NED, and heading in radians, of a
+    trajectory `t` seconds after it starts. Moving trajectories point the
+    vehicle along its direction of travel.
+    """
+    down = -altitude
+
+    if trajectory == "hover":
+        return (0.0, 0.0, down), (0.0, 0.0, 0.0), 0.0
+
+    omega = 2 * math.pi / period
+    a = omega * t
+
+    if trajectory == "circle":
+        position = (radius * math.cos(a), radius * math.sin(a), down)
+        velocity = (-radius * omega * math.sin(a), radius * omega * math.cos(a), 0.0)
+    elif trajectory == "figure8":
+        # lemniscate of Gerono, crossing itself at the origin
+        position = (radius * math.sin(a), radius * math.sin(2 * a) / 2, down)
+        velocity = (radius * omega * math.cos(a), radius * omega * math.cos(2 * a), 0.0)
+    else:
+        raise ValueError(f"Unknown trajectory {trajectory}")
+
+    return position, velocity, math.atan2(velocity[1], velocity[0])
+
+
+def trajectory_yaw_rate(
+    trajectory: str, t: float, radius: float, period: float
+) -> float:
+    """
+    Rate the heading of a trajectory turns at, `t` seconds after it starts,
+    in radians per second. The vehicle stays level, so this is all a gyro
+    on it measures.
+    """
+    if trajectory == "hover":
+        return 0.0
+
+    omega = 2 * math.pi / period
+    a = omega * t
+
+    if trajectory == "circle":
+        return omega
+
+    if trajectory == "figure8":
+        # the heading is atan2(ve, vn), so its rate is the cross product of
+        # velocity and acceleration over the squared speed
+        vn = radius * omega * math.cos(a)
+        ve = radius * omega * math.cos(2 * a)
+        an = -radius * omega * omega * math.sin(a)
+        ae = -2 * radius * omega * omega * math.sin(2 * a)
+        return (vn * ae - ve * an) / (vn * vn + ve * ve)
+
+    raise ValueError(f"Unknown trajectory {trajectory}")
+
+
+class SyntheticCamera:
+    """
+    Generates camera frames along a parametric trajectory, with optional noise,
+    dropped frames and confidence drops. Drop-in replacement for `ZEDCamera`,
+    so the whole module can be load tested without a camera or GPU.
+
+    Poses are generated in the vehicle's NED frame and inverse-transformed
+    through the configured camera mounting, so with no resync the module
+    publishes the trajectory itself.
+    """
+
+    def __init__(
+        self,
+        trajectory: str = "hover",
+        fps: float = 60,
+        speed: float = 1.0,
+        radius: float = 2.0,
+        period: float = 20.0,
+        altitude: float = 1.0,
+        position_noise: float = 0.0,
+        velocity_noise: float = 0.0,
+        heading_noise: float = 0.0,
+        dropout: float = 0.0,
+        confidence_drop: float = 0.0,
+        imu_rate: float = 400,
+        gyro_noise: float = 0.0,
+        gyro_bias: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        """
+        `speed` is the rate frames are delivered at relative to real time.
+        0 delivers them as fast as possible. `dropout` and `confidence_drop`
+        are the probabilities of each frame failing to grab, or reporting
+        a low tracking confidence. Gyro samples are generated at `imu_rate`,
+        with `gyro_noise` and a constant `gyro_bias` on every axis, in rad/s.
+        """
+        if trajectory not in TRAJECTORIES:
+            raise ValueError(f"Unknown trajectory {trajectory}")
+
+        self.trajectory = trajectory
+        self.fps = fps
+        self.speed = speed
+        self.radius = radius
+        self.period = period
+        self.altitude = altitude
+        self.position_noise = position_noise
+        self.velocity_noise = velocity_noise
+        self.heading_noise = heading_noise
+        self.dropout = dropout
+        self.confidence_drop = confidence_drop
+        self.imu_rate = imu_rate
+        self.gyro_noise = gyro_noise
+        self.gyro_bias = gyro_bias
+
+        self.rng = np.random.default_rng(seed)
+
+        # index of the next frame, counting dropped and skipped ones
+        self.index = 0
+        self.dropped = 0
+
+        # ID and timestamp of the last frame delivered
+        self.frame_id = 0
+        self.timestamp = 0
+
+        # index of the last gyro sample delivered
+        self.imu_index = -1
+
+        # time spent waiting for each frame to be due, and generating it
+        self.grab_latency = LatencyTracker()
+        self.pose_latency = LatencyTracker()
+
+        # frame ID, timestamp and texture offset of the last frame,
+        # swapped in whole for the image readers
+        self._image_state = (0, 0, 0)
+
+    @try_except(reraise=True)
+    def setup(self) -> None:
+        # the same camera mounting the module transforms frames with
+        tm = CameraCoordinateTransformation().tm
+        self.H_TRACKCAMRef_aeroRef = np.linalg.inv(tm["H_aeroRef_TRACKCAMRef"])
+        self.H_aeroBody_TRACKCAMBody = tm["H_aeroBody_TRACKCAMBody"]
+
+        # a horizontally periodic texture, wide enough to slide the left and
+        # right views across it
+        texture = self.rng.integers(
+            0, 256, (_HD720_SHAPE[0] // 8, _TEXTURE_PERIOD // 8, 4), dtype=np.uint8
+        )
+        texture = np.repeat(np.repeat(texture, 8, axis=0), 8, axis=1)
+        texture[..., 3] = 255
+        self._texture = np.tile(
+            texture, (1, math.ceil(_HD720_SHAPE[1] / _TEXTURE_PERIOD) + 2, 1)
+        )
+
+        # timestamps come from the system clock like the ZED's, so resyncs
+        # can look up poses by arrival time
+        self._start_ns = time.time_ns()
+        self._start = time.monotonic()
+
+        logger.success(f"Synthetic camera flying a {self.trajectory} at {self.fps} fps")
+
+    def get_pipe_data(self) -> Optional[CameraFrameData]:
+        start = time.perf_counter()
+
+        if self.speed > 0:
+            # like the ZED, a slow reader gets the newest frame, and the ones
+            # in between are never seen
+            now = (time.monotonic() - self._start) * self.speed * self.fps
+            if now - self.index >= 1:
+                self.index = math.floor(now)
+
+        t = self.index / self.fps
+        self.index += 1
+
+        if self.speed > 0:
+            due = self._start + t / self.speed - time.monotonic()
+            if due > 0:
+                time.sleep(due)
+
+        if self.dropout and self.rng.random() < self.dropout:
+            self.dropped += 1
+            return
+
+        generated = time.perf_counter()
+        self.grab_latency.record(generated - start)
+
+        position, velocity, heading = trajectory_point(
+            self.trajectory, t, self.radius, self.period, self.altitude
+        )
+        if self.position_noise:
+            position = tuple(
+                np.add(position, self.rng.normal(0, self.position_noise, 3)).tolist()
+            )
+        if self.velocity_noise:
+            velocity = tuple(
+                np.add(velocity, self.rng.normal(0, self.velocity_noise, 3)).tolist()
+            )
+        if self.heading_noise:
+            heading += self.rng.normal(0, self.heading_noise)
+
+        # vehicle pose in the reference frame, in centimeters, to camera pose
+        H_aeroRef_aeroBody = t3d.affines.compose(
+            np.asarray(position) * 100,
+            t3d.euler.euler2mat(0, 0, heading, axes="rxyz"),
+            np.ones(3),
+        )
+        H_TRACKCAMRef_TRACKCAMBody = self.H_TRACKCAMRef_aeroRef.dot(
+            H_aeroRef_aeroBody
+        ).dot(self.H_aeroBody_TRACKCAMBody)
+        camera_velocity = self.H_TRACKCAMRef_aeroRef[:3, :3].dot(velocity)
+
+        tracker_confidence = 100.0
+        if self.confidence_drop and self.rng.random() < self.confidence_drop:
+            tracker_confidence = float(self.rng.uniform(0, 50))
+
+        self.frame_id += 1
+        self.timestamp = self._start_ns + round(t * 1e9)
+        self._image_state = (
+            self.frame_id,
+            self.timestamp,
+            round(position[1] * _PIXELS_PER_METER) % _TEXTURE_PERIOD,
+        )
+
+        rotation = t3d.quaternions.mat2quat(H_TRACKCAMRef_TRACKCAMBody[:3, :3])
+        data = CameraFrameData(
+            rotation=tuple(rotation.tolist()),  # type: ignore
+            translation=tuple((H_TRACKCAMRef_TRACKCAMBody[:3, 3] / 100).tolist()),  # type: ignore
+            velocity=tuple(camera_velocity.tolist()),  # type: ignore
+            tracker_confidence=tracker_confidence,
+            timestamp=self.timestamp,
+            frame_id=self.frame_id,
+        )
+
+        self.pose_latency.record(time.perf_counter() - generated)
+        return data
+
+    def get_imu_data(self) -> Optional[ImuData]:
+        """
+        Newest gyro sample of the trajectory, in the camera frame. Samples follow
+        real time like frames do. When frames are delivered as fast as possible,
+        every sample up to the next frame is delivered in turn.
+        """
+        if self.speed > 0:
+            t = (time.monotonic() - self._start) * self.speed
+        else:
+            t = self.index / self.fps
+
+        # samples due at the same time as a frame are not rounded away
+        index = math.floor(t * self.imu_rate + 1e-6)
+        if self.speed == 0:
+            # nothing to keep up with, so hand out every sample in turn
+            index = min(index, self.imu_index + 1)
+        if index <= self.imu_index:
+            return
+        self.imu_index = index
+        t = index / self.imu_rate
+
+        # level flight, so the body only turns about its down axis
+        body_rate = (
+            0.0,
+            0.0,
+            trajectory_yaw_rate(self.trajectory, t, self.radius, self.period),
+        )
+        rate = self.H_aeroBody_TRACKCAMBody[:3, :3].T.dot(body_rate)
+        if self.gyro_bias:
+            rate = rate + self.gyro_bias
+        if self.gyro_noise:
+            rate = rate + self.rng.normal(0, self.gyro_noise, 3)
+
+        return ImuData(
+            angular_velocity=tuple(rate.tolist()),  # type: ignore
+            timestamp=self._start_ns + round(t * 1e9),
+        )
+
+    def get_image_frame(
+        self, side: Literal["left", "right"]
+    ) -> Optional[ImageFrameData]:
+        """
+        Synthetic HD720 image of the last frame. The texture slides as the
+        vehicle moves east, and the right image is offset from the left one.
+        """
+        frame_id, timestamp, offset = self._image_state
+        if side == "right":
+            offset += _DISPARITY
+
+        return ImageFrameData(
+            image=self._texture[:, offset : offset + _HD720_SHAPE[1]].copy(),
+            frame_id=frame_id,
+            timestamp=timestamp,
+        )
+
+    def get_rgb_image(self, side: Literal["left", "right"]) -> Optional[np.ndarray]:
+        """
+        Return a synthetic RGB image for the specified side.
+        """
+        return self.get_image_frame(side)["image"]  # type: ignore
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,253 @@
+import abc
+import math
+from typing import Tuple
+
+import config
+import numpy as np
+
+
+class VelocityEstimator(abc.ABC):
+    """
+    Base class for estimating velocity from timestamped positions.
+    Samples are kept in a preallocated ring buffer. Samples that do not move
+    time forward, or contain NaNs, are rejected instead of producing inf/NaN.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        # times are stored in seconds relative to `_origin` (nanoseconds),
+        # so they stay small enough for float64 to represent precisely
+        self._times = np.zeros(capacity)
+        self._positions = np.zeros((capacity, 3))
+        self._origin = 0
+        self._index = 0
+        self._last_timestamp = 0
+
+        self.count = 0
+        """
+        Number of samples currently in the ring buffer.
+        """
+        self.rejected = 0
+        """
+        Number of samples rejected for a zero or negative time step, or NaNs.
+        """
+        self.velocity: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+        """
+        Latest velocity estimate.
+        """
+
+    def update(
+        self, timestamp: int, position: Tuple[float, float, float]
+    ) -> Tuple[float, float, float]:
+        """
+        Add a position sample, with its timestamp in nanoseconds,
+        and return the new velocity estimate.
+        """
+        x, y, z = position
+        if math.isnan(x + y + z) or (self.count and timestamp <= self._last_timestamp):
+            self.rejected += 1
+            return self.velocity
+
+        if not self.count:
+            self._origin = timestamp
+
+        i = self._index
+        if self.count == len(self._times):
+            self._evict(i)
+
+        self._times[i] = (timestamp - self._origin) / 1e9
+        self._positions[i, 0] = x
+        self._positions[i, 1] = y
+        self._positions[i, 2] = z
+
+        self._index = (i + 1) % len(self._times)
+        self.count = min(self.count + 1, len(self._times))
+        self._last_timestamp = timestamp
+
+        self.velocity = self._estimate(i)
+        return self.velocity
+
+    def _evict(self, i: int) -> None:
+        """
+        Called before the oldest sample, at index `i`, is overwritten.
+        """
+
+    @abc.abstractmethod
+    def _estimate(self, i: int) -> Tuple[float, float, float]:
+        """
+        Compute a new velocity estimate after the sample at index `i` was added.
+        """
+
+
+class FiniteDifferenceVelocityEstimator(VelocityEstimator):
+    """
+    Velocity from the difference between the last two positions.
+    Noisy, but has the least lag.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(capacity=2)
+
+    def _estimate(self, i: int) -> Tuple[float, float, float]:
+        if self.count < 2:
+            return (0.0, 0.0, 0.0)
+
+        j = i - 1
+        t = self._times
+        p = self._positions
+        dt = t.item(i) - t.item(j)
+        return (
+            (p.item(i, 0) - p.item(j, 0)) / dt,
+            (p.item(i, 1) - p.item(j, 1)) / dt,
+            (p.item(i, 2) - p.item(j, 2)) / dt,
+        )
+
+
+class LeastSquaresVelocityEstimator(VelocityEstimator):
+    """
+    Velocity from the slope of a least-squares line through the last `window`
+    positions. This is a first order Savitzky-Golay derivative filter that
+    also handles uneven frame spacing.
+
+    The sums the fit needs are updated incrementally, so an update costs the
+    same regardless of the window size. They are rebuilt from the buffer,
+    relative to a fresh time origin, every time the buffer wraps around to keep
+    floating point error from accumulating.
+    """
+
+    def __init__(self, window: int = 5) -> None:
+        if window < 2:
+            raise ValueError("Least squares velocity needs a window of at least 2")
+
+        super().__init__(capacity=window)
+
+        self._st = 0.0
+        self._stt = 0.0
+        self._sp = np.zeros(3)
+        self._stp = np.zeros(3)
+
+    def _evict(self, i: int) -> None:
+        t = self._times.item(i)
+        p = self._positions[i]
+        self._st -= t
+        self._stt -= t * t
+        self._sp -= p
+        self._stp -= t * p
+
+    def _rebase(self, i: int) -> None:
+        # move the time origin to the newest sample and rebuild the sums
+        shift = round(self._times.item(i) * 1e9)
+        self._origin += shift
+        self._times -= shift / 1e9
+
+        self._st = float(self._times.sum())
+        self._stt = float(self._times.dot(self._times))
+        self._sp = self._positions.sum(axis=0)
+        self._stp = self._times.dot(self._positions)
+
+    def _estimate(self, i: int) -> Tuple[float, float, float]:
+        if self._index == 0 and self.count == len(self._times):
+            self._rebase(i)
+        else:
+            t = self._times.item(i)
+            p = self._positions[i]
+            self._st += t
+            self._stt += t * t
+            self._sp += p
+            self._stp += t * p
+
+        n = self.count
+        if n < 2:
+            return (0.0, 0.0, 0.0)
+
+        denominator = n * self._stt - self._st * self._st
+        if denominator <= 0:
+            return self.velocity
+
+        vx, vy, vz = ((n * self._stp - self._st * self._sp) / denominator).tolist()
+        return (vx, vy, vz)
+
+
+class KalmanVelocityEstimator(VelocityEstimator):
+    """
+    Constant velocity Kalman filter, run independently on each axis.
+    Since every axis sees the same time steps and noise, they share one
+    covariance matrix and only the state differs.
+    """
+
+    def __init__(
+        self, process_noise: float = 1.0, measurement_noise: float = 1e-4
+    ) -> None:
+        """
+        `process_noise` is the spectral density of the unmodelled acceleration,
+        in (m/s^2)^2/Hz. `measurement_noise` is the variance of the measured
+        positions, in m^2.
+        """
+        super().__init__(capacity=2)
+
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+
+        self._p = [0.0, 0.0, 0.0]
+        self._v = [0.0, 0.0, 0.0]
+        # shared covariance [[P00, P01], [P01, P11]]
+        self._P00 = 0.0
+        self._P01 = 0.0
+        self._P11 = 0.0
+
+    def _estimate(self, i: int) -> Tuple[float, float, float]:
+        z = self._positions[i].tolist()
+
+        if self.count < 2:
+            # start at the first measurement, with no idea of the velocity yet
+            self._p = z
+            self._v = [0.0, 0.0, 0.0]
+            self._P00 = self.measurement_noise
+            self._P01 = 0.0
+            self._P11 = 1e6
+            return (0.0, 0.0, 0.0)
+
+        dt = self._times.item(i) - self._times.item(i - 1)
+        q = self.process_noise
+
+        # predict
+        P00 = (
+            self._P00 + 2 * dt * self._P01 + dt * dt * self._P11 + q * dt * dt * dt / 3
+        )
+        P01 = self._P01 + dt * self._P11 + q * dt * dt / 2
+        P11 = self._P11 + q * dt
+
+        # update
+        S = P00 + self.measurement_noise
+        K0 = P00 / S
+        K1 = P01 / S
+
+        for axis in range(3):
+            p = self._p[axis] + self._v[axis] * dt
+            residual = z[axis] - p
+            self._p[axis] = p + K0 * residual
+            self._v[axis] += K1 * residual
+
+        self._P00 = (1 - K0) * P00
+        self._P01 = (1 - K0) * P01
+        self._P11 = P11 - K1 * P01
+
+        return (self._v[0], self._v[1], self._v[2])
+
+
+def create_velocity_estimator() -> VelocityEstimator:
+    """
+    Create the velocity estimator selected by `config.VELOCITY_ESTIMATOR`.
+    """
+    if config.VELOCITY_ESTIMATOR == "finite_difference":
+        return FiniteDifferenceVelocityEstimator()
+
+    if config.VELOCITY_ESTIMATOR == "least_squares":
+        return LeastSquaresVelocityEstimator(window=config.VELOCITY_WINDOW)
+
+    if config.VELOCITY_ESTIMATOR == "kalman":
+        return KalmanVelocityEstimator(
+            process_noise=config.VELOCITY_KALMAN_PROCESS_NOISE,
+            measurement_noise=config.VELOCITY_KALMAN_MEASUREMENT_NOISE,
+        )
+
+    raise ValueError(f"Unknown velocity estimator {config.VELOCITY_ESTIMATOR}")
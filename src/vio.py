@@ -1,6 +1,13 @@
+from __future__ import annotations
+
+import json
 import math
+import os
+import signal
+import sys
 import threading
-from typing import Literal, Tuple
+import time
+from typing import TYPE_CHECKING, Any, Dict, Literal, Optional, Tuple
 
 import config
 import numpy as np
@@ -17,11 +24,104 @@ from bell.avr.mqtt.payloads import (
     AVRVIOVelocity,
 )
 from bell.avr.utils.decorators import run_forever, try_except
-from bell.avr.utils.images import serialize_image
+from bell.avr.utils.images import ImageData
 from bell.avr.utils.timing import rate_limit
+from image_library import (
+    ImageEncoderPool,
+    ImageOptions,
+    apply_image_options,
+    default_image_options,
+    parse_image_options,
+)
 from loguru import logger
+from models import Camera, CameraFrameData
+from profile_library import ProfileSession, parse_profile_request, start_profile
+from publish_library import CoalescingPublisher, create_topic_throttles
+from replay_library import FrameRecorder, ReplayCamera
+from scheduler_library import AdaptiveScheduler, lower_thread_priority
+from stats_library import FrameLoopStats, LatencyTracker, process_uptime
 from vio_library import CameraCoordinateTransformation
-from zed_library import ZEDCamera
+
+if TYPE_CHECKING:
+    from attitude_library import AttitudePropagator
+    from prediction_library import PosePredictor
+
+
+def create_camera() -> Camera:
+    """
+    Create the camera backend selected by `config.CAMERA_BACKEND`.
+    """
+    if config.CAMERA_BACKEND == "replay":
+        return ReplayCamera(
+            config.REPLAY_FILE, speed=config.REPLAY_SPEED, loop=config.REPLAY_LOOP
+        )
+
+    if config.CAMERA_BACKEND == "synthetic":
+        from synthetic_library import SyntheticCamera
+
+        return SyntheticCamera(
+            config.SYNTHETIC_TRAJECTORY,
+            fps=config.SYNTHETIC_FPS,
+            speed=config.SYNTHETIC_SPEED,
+            radius=config.SYNTHETIC_RADIUS,
+            period=config.SYNTHETIC_PERIOD,
+            altitude=config.SYNTHETIC_ALTITUDE,
+            position_noise=config.SYNTHETIC_POSITION_NOISE,
+            velocity_noise=config.SYNTHETIC_VELOCITY_NOISE,
+            heading_noise=config.SYNTHETIC_HEADING_NOISE,
+            dropout=config.SYNTHETIC_DROPOUT,
+            confidence_drop=config.SYNTHETIC_CONFIDENCE_DROP,
+            imu_rate=config.IMU_RATE,
+            gyro_noise=config.SYNTHETIC_GYRO_NOISE,
+            gyro_bias=config.SYNTHETIC_GYRO_BIAS,
+        )
+
+    if config.CAMERA_BACKEND == "zed":
+        # imported here so the other backends work without the ZED SDK installed
+        from zed_library import ZEDCamera
+
+        return ZEDCamera()
+
+    raise ValueError(f"Unknown camera backend {config.CAMERA_BACKEND}")
+
+
+POSE_TOPICS = (
+    "avr/vio/position/local",
+    "avr/vio/attitude/euler/radians",
+    "avr/vio/heading",
+    "avr/vio/velocity",
+    "avr/vio/confidence",
+)
+"""
+Topics published for every processed camera frame.
+"""
+
+STATE_TOPIC = "avr/vio/state"
+"""
+Optional topic bundling every pose topic of a frame into one message.
+"""
+
+STATS_TOPIC = "avr/vio/stats"
+"""
+Periodic runtime counters, for spotting degraded units.
+"""
+
+STATUS_TOPIC = "avr/vio/status"
+"""
+Periodic readiness of the module: `starting` until the first pose is
+published, `tracking` while poses are published, and `degraded` when the
+camera can't be set up or poses stop.
+"""
+
+PROFILE_TOPIC = "avr/vio/debug/profile"
+"""
+Starts a profiling session.
+"""
+
+PROFILE_RESULT_TOPIC = "avr/vio/debug/profile/result"
+"""
+Summary of the top functions of a finished profiling session.
+"""
 
 
 class VIOModule(MQTTModule):
@@ -36,24 +136,160 @@ class VIOModule(MQTTModule):
         self.image_stream_side: Literal["left", "right"] = "left"
         self.image_stream_compressed: bool = False
         self.image_stream_frequency: float = 1
+        self.image_stream_scale: int = config.IMAGE_STREAM_SCALE
+        self.image_stream_compression_level: int = config.IMAGE_COMPRESSION_LEVEL
+
+        # single image request waiting to be sent, and when it arrived
+        self.image_request: Optional[AVRVIOImageRequest] = None
+        self._image_request_time = 0.0
+
+        # cropping, scaling and channels of every image sent
+        self.image_options: ImageOptions = default_image_options()
 
         # connected libraries
-        self.camera = ZEDCamera()
+        self.camera = create_camera()
         self.coord_trans = CameraCoordinateTransformation()
 
+        # resyncs from before the camera's tracking frame changed don't fit
+        # with newer ones, only the ZED can change it
+        if hasattr(self.camera, "on_tracking_reset"):
+            self.camera.on_tracking_reset = self.coord_trans.reset_resyncs  # type: ignore
+
+        # camera readiness, and when each startup step finished, in seconds
+        # since the process started
+        self.camera_ready = False
+        self.camera_failures = 0
+        self.startup: Dict[str, Optional[float]] = {
+            "mqtt_s": None,
+            "camera_s": None,
+            "first_pose_s": None,
+        }
+        self._camera_ready_time = 0.0
+        self._last_pose: Optional[float] = None
+        self._status_state = ""
+
+        # optionally run the attitude forward with the gyro between frames.
+        # The optional libraries are only imported when enabled.
+        self.attitude: Optional[AttitudePropagator] = None
+        if config.IMU_ATTITUDE:
+            from attitude_library import AttitudePropagator
+
+            self.attitude = AttitudePropagator(
+                self.coord_trans.tm["H_aeroBody_TRACKCAMBody"][:3, :3],
+                gain=config.IMU_ATTITUDE_GAIN,
+                bias_gain=config.IMU_BIAS_GAIN,
+                max_gap=config.IMU_MAX_GAP,
+                jump_threshold=math.radians(config.IMU_JUMP_THRESHOLD),
+            )
+        # optionally extrapolate frames to the moment they are published
+        self.predictor: Optional[PosePredictor] = None
+        if config.POSE_PREDICTION:
+            from prediction_library import PosePredictor
+
+            self.predictor = PosePredictor(
+                horizon=config.PREDICTION_HORIZON,
+                max_position=config.PREDICTION_MAX_POSITION,
+                max_angle=math.radians(config.PREDICTION_MAX_ANGLE),
+            )
+
+        # sync version of the last frame the attitude was corrected with, and
+        # the predictor measured the turn rate with, as resyncs step both
+        self._attitude_version = self.coord_trans.version
+        self._prediction_version = self.coord_trans.version
+
+        # pose loop counters
+        self.frame_stats = FrameLoopStats(1 / config.CAM_FPS)
+
+        # optionally adapt the pose rate and image stream to the load
+        self.scheduler = (
+            AdaptiveScheduler(
+                config.CAM_UPDATE_FREQ,
+                config.CAM_FPS,
+                budget=config.SCHEDULER_POSE_BUDGET,
+                miss_threshold=config.SCHEDULER_MISS_THRESHOLD,
+                headroom=config.SCHEDULER_HEADROOM,
+                window=config.SCHEDULER_WINDOW,
+            )
+            if config.ADAPTIVE_SCHEDULER
+            else None
+        )
+        # counters at the last stats message, to turn them into rates
+        self._stats_time = time.monotonic()
+        self._stats_frames = 0
+        self._stats_published = 0
+
+        # latency of each stage after the camera, plus the whole pipeline
+        # from the image timestamp to the last message being sent
+        self.latency: Dict[str, LatencyTracker] = {
+            stage: LatencyTracker()
+            for stage in ("transform", "end_to_end", *POSE_TOPICS, STATE_TOPIC)
+        }
+
+        # per topic decimation and deadbands
+        self.throttles = create_topic_throttles((*POSE_TOPICS, STATE_TOPIC))
+
+        # messages are sent from their own thread, so the broker can't stall
+        # the pose loop. Images take milliseconds to send, so they have a
+        # thread of their own, and poses never wait behind them.
+        self.publisher = CoalescingPublisher(self.send_timed_message)
+        self.image_publisher = CoalescingPublisher(
+            self.send_timed_message, name="image-publisher"
+        )
+
+        # optional recording of every camera frame
+        self.recorder = (
+            FrameRecorder(config.RECORD_FILE) if config.RECORD_FILE else None
+        )
+
+        # images are encoded off the streaming thread
+        self.image_encoder = ImageEncoderPool(
+            self.send_image_capture,
+            workers=config.IMAGE_ENCODER_WORKERS,
+            max_queue=config.IMAGE_ENCODER_QUEUE,
+            processes=config.IMAGE_ENCODER_PROCESSES,
+            nice=config.SCHEDULER_IMAGE_NICE if config.ADAPTIVE_SCHEDULER else 0,
+        )
+
+        # on demand profiling, only hooked in while a session runs
+        self.profile_session: Optional[ProfileSession] = None
+
         # mqtt
         self.topic_callbacks = {
             "avr/vio/resync": self.handle_resync,
             "avr/vio/image/request": self.handle_image_request,
             "avr/vio/image/stream/enable": self.handle_image_stream_enable,
             "avr/vio/image/stream/disable": self.handle_image_stream_disable,
+            "avr/vio/image/options": self.handle_image_options,
+            PROFILE_TOPIC: self.handle_profile,
         }
 
     def handle_image_request(self, payload: AVRVIOImageRequest) -> None:
         """
         Handle a single image request
         """
-        self.send_rgb_image(side=payload.side, compressed=payload.compressed)
+        if not self.camera_ready:
+            logger.warning("Camera is not set up yet")
+            return
+
+        # sent from the image stream thread, as the camera may only capture
+        # the image after its next grab, and MQTT callbacks never wait
+        self._image_request_time = time.monotonic()
+        self.image_request = payload
+
+    def serve_image_request(self) -> None:
+        """
+        Send the requested image once the camera captured one, or give up
+        after `config.IMAGE_DEMAND_TIMEOUT` seconds.
+        """
+        request = self.image_request
+        if request is None:
+            return
+
+        if self.send_rgb_image(side=request.side, compressed=request.compressed):
+            self.image_request = None
+        elif time.monotonic() - self._image_request_time > config.IMAGE_DEMAND_TIMEOUT:
+            logger.warning(f"No {request.side} image captured for the image request")
+            self.image_request = None
 
     def handle_image_stream_enable(self, payload: AVRVIOImageStreamEnable) -> None:
         """
@@ -64,35 +300,172 @@ class VIOModule(MQTTModule):
         self.image_stream_compressed = payload.compressed
         self.image_stream_frequency = payload.frequency
 
+        if self.scheduler is not None:
+            self.scheduler.images_streaming = True
+
     def handle_image_stream_disable(self) -> None:
         """
         Disable image streaming
         """
         self.image_stream_enabled = False
 
-    def send_rgb_image(self, side: Literal["left", "right"], compressed: bool) -> None:
+        if self.scheduler is not None:
+            self.scheduler.images_streaming = False
+
+    @try_except(reraise=False)
+    def handle_image_options(self, payload: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Set how images are cropped, scaled and which channels are sent,
+        for both image requests and streams. An empty message resets them.
+        """
+        self.image_options = parse_image_options(payload or {})
+        logger.debug(f"Image options set to {self.image_options}")
+
+    @try_except(reraise=False)
+    def handle_profile(self, payload: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Profile the module for a while in the background, then publish a summary
+        of the top functions. The profile itself is written to `config.PROFILE_DIR`.
+        """
+        request = parse_profile_request(payload or {})
+
+        if self.profile_session is not None and not self.profile_session.done:
+            logger.warning("A profiling session is already running")
+            return
+
+        logger.info(f"Starting {request['mode']} profile for {request['duration']}s")
+        # the pose loop, image stream, senders and MQTT threads
+        self.profile_session = start_profile(
+            request,
+            [
+                (self, "process_camera_frame"),
+                (self, "send_rgb_image"),
+                (self.publisher, "send"),
+                (self.image_publisher, "send"),
+                (self._mqtt_client, "on_message"),
+            ],
+            lambda summary: self.publisher.publish(PROFILE_RESULT_TOPIC, summary),
+        )
+
+    def send_rgb_image(
+        self,
+        side: Literal["left", "right"],
+        compressed: bool,
+        level: int = config.IMAGE_COMPRESSION_LEVEL,
+        scale: int = 1,
+    ) -> bool:
         """
-        Send an RGB image from the tracking camera.
+        Send an RGB image from the tracking camera. The image is encoded and
+        sent in the background. `scale` downscales it further, on top of
+        the image options. Returns False if the camera has not captured one yet.
         """
+        image_frame = self.camera.get_image_frame(side)
+        if image_frame is None:
+            logger.debug(f"No {side} image captured yet")
+            return False
+
         if self.enable_verbose_logging:
-            logger.debug("Sending RGB image")
+            logger.debug(f"Encoding RGB image of frame {image_frame['frame_id']}")
 
-        image_data = self.camera.get_rgb_image(side)
-        serialized_image_data = serialize_image(image_data, compress=compressed)
+        image = apply_image_options(image_frame["image"], self.image_options)
+        self.image_encoder.submit(
+            side, image, compress=compressed, level=level, scale=scale
+        )
+        return True
 
-        payload = AVRVIOImageCapture(**serialized_image_data, side=side)
-        self.send_message("avr/vio/image/capture", payload)
+    def send_image_capture(
+        self, side: Literal["left", "right"], image_data: ImageData
+    ) -> None:
+        """
+        Send an encoded RGB image.
+        """
+        payload = AVRVIOImageCapture(**image_data, side=side)
+        self.image_publisher.publish("avr/vio/image/capture", payload)
 
         if self.enable_verbose_logging:
-            logger.debug("RGB image sent")
+            logger.debug("RGB image queued")
 
     def handle_resync(self, payload: AVRVIOResync) -> None:
         # whenever new data is published to the ZEDCamera resync topic, we need to compute a new correction
         # to compensate for sensor drift over time.
         if not self.init_sync or config.CONTINUOUS_SYNC:
-            self.coord_trans.sync(payload)
+            # the reference position is older than its arrival, so compare it
+            # against where the camera was back then, which keeps continuous
+            # resyncs from pulling the position back while moving
+            timestamp = time.time_ns() - int(config.RESYNC_DELAY * 1e9)
+            self.coord_trans.sync(payload, timestamp)
             self.init_sync = True
 
+            if config.AREA_MEMORY:
+                self.save_sync()
+
+    @try_except(reraise=False)
+    def save_sync(self) -> None:
+        """
+        Save the sync correction, so it can be restored along with the area file.
+        """
+        with open(config.SYNC_FILE + ".tmp", "w") as f:
+            json.dump(
+                {
+                    "heading_offset": self.coord_trans.heading_offset,
+                    "position_offset": self.coord_trans.position_offset,
+                },
+                f,
+            )
+        os.replace(config.SYNC_FILE + ".tmp", config.SYNC_FILE)
+
+    @try_except(reraise=False)
+    def restore_sync(self) -> None:
+        """
+        Restore the sync correction saved with the area file the camera loaded,
+        so the module publishes in the same frame as before once tracking
+        relocalizes. A resync still replaces it.
+        """
+        if not getattr(self.camera, "area_loaded", False) or not os.path.isfile(
+            config.SYNC_FILE
+        ):
+            return
+
+        with open(config.SYNC_FILE) as f:
+            saved = json.load(f)
+
+        self.coord_trans.apply_sync_offsets(
+            saved["heading_offset"], tuple(saved["position_offset"])
+        )
+        logger.info(f"Restored sync correction from {config.SYNC_FILE}")
+
+    def send_timed_message(self, topic: str, payload: Any) -> None:
+        """
+        Send a message, and record how long sending it took.
+        """
+        start = time.perf_counter()
+        self.send_message(topic, payload)  # type: ignore
+        if topic in self.latency:
+            self.latency[topic].record(time.perf_counter() - start)
+
+    def publish_attitude(self, rpy: Tuple[float, float, float], now: float) -> None:
+        """
+        Publish the attitude and heading, as limited by their throttles.
+        """
+        throttles = self.throttles
+
+        # send orientation update
+        if throttles["avr/vio/attitude/euler/radians"].ready(rpy, now):
+            self.publisher.publish(
+                "avr/vio/attitude/euler/radians",
+                AVRVIOAttitudeEulerRadians(psi=rpy[0], theta=rpy[1], phi=rpy[2]),
+            )
+
+        heading = rpy[2]
+        # correct for negative heading
+        if heading < 0:
+            heading += 2 * math.pi
+        heading = math.degrees(heading)
+
+        # send heading update
+        if throttles["avr/vio/heading"].ready((heading,), now):
+            self.publisher.publish("avr/vio/heading", AVRVIOHeading(hdg=heading))
+
     @try_except(reraise=False)
     def publish_updates(
         self,
@@ -100,101 +473,529 @@ class VIOModule(MQTTModule):
         ned_vel: Tuple[float, float, float],
         rpy: Tuple[float, float, float],
         tracker_confidence: float,
-    ) -> None:
-        if np.isnan(ned_pos).any():
-            raise ValueError("Camera has NaNs for position")
-
-        # send position update
-        self.send_message(
-            "avr/vio/position/local",
-            AVRVIOPositionLocal(n=ned_pos[0], e=ned_pos[1], d=ned_pos[2]),
-        )
-
-        if np.isnan(rpy).any():
-            raise ValueError("Camera has NaNs for orientation")
-
-        # send orientation update
-        self.send_message(
-            "avr/vio/attitude/euler/radians",
-            AVRVIOAttitudeEulerRadians(psi=rpy[0], theta=rpy[1], phi=rpy[2]),
+        timestamp: Optional[int] = None,
+    ) -> Optional[bool]:
+        """
+        Publish a transformed camera frame. `timestamp` is the image timestamp
+        of the frame in nanoseconds, used to measure end-to-end latency up to
+        the frame being queued for sending. Nothing is sent if any of the values
+        are NaN. Returns True if the frame was published, and None if it was
+        rejected.
+        """
+        nan = (
+            "position"
+            if np.isnan(ned_pos).any()
+            else "orientation"
+            if np.isnan(rpy).any()
+            else "velocity"
+            if np.isnan(ned_vel).any()
+            else None
         )
+        if nan is not None:
+            self.frame_stats.rejected_frame()
+            raise ValueError(f"Camera has NaNs for {nan}")
 
-        # send heading update
         heading = rpy[2]
         # correct for negative heading
         if heading < 0:
             heading += 2 * math.pi
         heading = np.rad2deg(heading)
-        self.send_message("avr/vio/heading", AVRVIOHeading(hdg=heading))
-        # coord_trans.heading = rpy[2]
 
-        if np.isnan(ned_vel).any():
-            raise ValueError("Camera has NaNs for velocity")
+        now = time.monotonic()
+        throttles = self.throttles
+
+        # send everything at once
+        if config.PUBLISH_STATE and throttles[STATE_TOPIC].ready(ned_pos, now):
+            self.publisher.publish(
+                STATE_TOPIC,
+                {
+                    "timestamp": timestamp,
+                    "position": {"n": ned_pos[0], "e": ned_pos[1], "d": ned_pos[2]},
+                    "attitude": {"psi": rpy[0], "theta": rpy[1], "phi": rpy[2]},
+                    "heading": {"hdg": heading},
+                    "velocity": {"Vn": ned_vel[0], "Ve": ned_vel[1], "Vd": ned_vel[2]},
+                    "confidence": {"tracking": tracker_confidence},
+                },
+            )
+
+        # send position update
+        if throttles["avr/vio/position/local"].ready(ned_pos, now):
+            self.publisher.publish(
+                "avr/vio/position/local",
+                AVRVIOPositionLocal(n=ned_pos[0], e=ned_pos[1], d=ned_pos[2]),
+            )
+
+        # the gyro updates the attitude more often while it is running
+        if self.attitude is None or not self.attitude.active(now):
+            self.publish_attitude(rpy, now)
 
         # send velocity update
-        self.send_message(
-            "avr/vio/velocity",
-            AVRVIOVelocity(Vn=ned_vel[0], Ve=ned_vel[1], Vd=ned_vel[2]),
-        )
+        if throttles["avr/vio/velocity"].ready(ned_vel, now):
+            self.publisher.publish(
+                "avr/vio/velocity",
+                AVRVIOVelocity(Vn=ned_vel[0], Ve=ned_vel[1], Vd=ned_vel[2]),
+            )
 
-        self.send_message(
-            "avr/vio/confidence",
-            AVRVIOConfidence(
-                tracking=tracker_confidence,
-            ),
-        )
+        if throttles["avr/vio/confidence"].ready((tracker_confidence,), now):
+            self.publisher.publish(
+                "avr/vio/confidence",
+                AVRVIOConfidence(
+                    tracking=tracker_confidence,
+                ),
+            )
+
+        if timestamp is not None:
+            # the image timestamp comes from the system clock, not a monotonic one
+            self.latency["end_to_end"].record((time.time_ns() - timestamp) / 1e9)
+
+        if self._last_pose is None:
+            self.startup["first_pose_s"] = process_uptime()
+            logger.success(
+                f"First pose published {self.startup['first_pose_s']:.2f}s after start"
+                + f", startup: {self.startup}"
+            )
+        self._last_pose = now
+        return True
 
-    @run_forever(frequency=config.CAM_UPDATE_FREQ)
     @try_except(reraise=False)
-    def process_camera_data(self) -> None:
+    def process_camera_frame(self, decimation: int = 1) -> Optional[float]:
+        """
+        Grab a single frame from the camera, and publish it if it is not
+        skipped by `decimation`. Returns how long processing the frame took
+        after it was grabbed, in seconds, or None if nothing was published.
+        """
         data = self.camera.get_pipe_data()
 
         if data is None:
+            self.frame_stats.failed_grab()
             logger.debug("Waiting on camera data")
             return
 
+        duration = self.publish_camera_frame(data, decimation)
+
+        # images of the frame are only retrieved once its pose is out,
+        # before the next grab replaces them
+        capture_images = getattr(self.camera, "capture_images", None)
+        if capture_images is not None:
+            capture_images()
+
+        return duration
+
+    def publish_camera_frame(
+        self, data: CameraFrameData, decimation: int = 1
+    ) -> Optional[float]:
+        """
+        Transform and publish a grabbed frame, unless it is skipped by
+        `decimation`. Returns how long that took, in seconds, or None if
+        nothing was published.
+        """
+        start = time.perf_counter()
+        self.frame_stats.grabbed(data["timestamp"])
+        if self.scheduler is not None:
+            self.scheduler.pose_started()
+
+        if self.recorder is not None:
+            self.recorder.record(data)
+
+        if self.frame_stats.frames % decimation:
+            return
+
+        # read before transforming, so a resync in between is noticed
+        # on the next frame at the latest
+        version = self.coord_trans.version
+
         # collect data from the sensor and transform it into "global" NED frame
         (
             ned_pos,
             ned_vel,
             rpy,
-        ) = self.coord_trans.transform_trackcamera_to_global_ned(data)
+        ) = self.coord_trans.transform_trackcamera_to_global_ned_fast(data)
+        self.latency["transform"].record(time.perf_counter() - start)
 
-        self.publish_updates(
-            tuple(ned_pos),  # type: ignore
+        if self.attitude is not None and not math.isnan(sum(rpy)):
+            # a resync steps the attitude, which is not drift
+            self.attitude.correct(
+                rpy, data["timestamp"], jump=version != self._attitude_version
+            )
+            self._attitude_version = version
+
+        ned_pos = tuple(ned_pos)
+        if self.predictor is not None:
+            if version != self._prediction_version:
+                # the rotation across a resync is not a turn
+                self.predictor.reset()
+                self._prediction_version = version
+
+            ned_pos, rpy = self.predictor.predict(
+                ned_pos,  # type: ignore
+                ned_vel,  # type: ignore
+                rpy,
+                data["timestamp"],
+            )
+
+        if not self.publish_updates(
+            ned_pos,  # type: ignore
             tuple(ned_vel),  # type: ignore
             rpy,
             data["tracker_confidence"],
+            data["timestamp"],
+        ):
+            # rejected, and only counted as such
+            return
+
+        duration = time.perf_counter() - start
+        self.frame_stats.processed(duration)
+        return duration
+
+    @run_forever(frequency=config.CAM_UPDATE_FREQ)
+    def process_camera_data(self) -> None:
+        """
+        Poll the camera at `config.CAM_UPDATE_FREQ`.
+        """
+        start = time.perf_counter()
+        self.process_camera_frame()
+        self.frame_stats.looped(time.perf_counter() - start, 1 / config.CAM_UPDATE_FREQ)
+
+    @run_forever(period=0)
+    def process_camera_frames(self) -> None:
+        """
+        Process every frame as soon as the camera delivers it. The blocking grab
+        inside `get_pipe_data` paces this loop, so there is no timer to beat
+        against the camera's frame clock.
+        """
+        failed = self.frame_stats.failed
+        self.process_camera_frame(decimation=config.CAM_OUTPUT_DECIMATION)
+
+        if self.frame_stats.failed != failed:
+            # nothing blocked, like while the camera waits to reconnect or
+            # a replay has ended, so wait a frame instead of spinning
+            time.sleep(1 / config.CAM_FPS)
+
+    @run_forever(period=0)
+    @try_except(reraise=False)
+    def process_camera_scheduled(self) -> None:
+        """
+        Process frames at the rate chosen by the adaptive scheduler, each
+        starting when it is due rather than a fixed sleep after the last.
+        """
+        assert self.scheduler is not None
+
+        self.scheduler.wait_for_pose()
+        self.scheduler.pose_done(self.process_camera_frame())
+
+    @run_forever(frequency=config.IMU_RATE)
+    @try_except(reraise=False)
+    def process_imu_data(self) -> None:
+        """
+        Propagate the attitude with the newest gyro sample, and publish it.
+        """
+        assert self.attitude is not None
+
+        imu_data = self.camera.get_imu_data()
+        if imu_data is None:
+            return
+
+        rpy = self.attitude.propagate(
+            imu_data["angular_velocity"], imu_data["timestamp"]
         )
+        if rpy is not None:
+            self.publish_attitude(rpy, time.monotonic())
+
+    def latency_report(self) -> Dict[str, Dict[str, float]]:
+        """
+        Latency percentiles of every stage of the pose pipeline, in milliseconds.
+        """
+        report = {
+            "grab": self.camera.grab_latency.percentiles(),
+            "pose": self.camera.pose_latency.percentiles(),
+            "image_encode": self.image_encoder.encode_latency.percentiles(),
+            "publish_queue": self.publisher.queue_latency.percentiles(),
+            "publish_send": self.publisher.send_latency.percentiles(),
+            "image_publish_send": self.image_publisher.send_latency.percentiles(),
+        }
+        for stage, tracker in self.latency.items():
+            report[stage] = tracker.percentiles()
+
+        return report
+
+    @run_forever(period=config.LATENCY_LOG_PERIOD or 1)
+    @try_except(reraise=False)
+    def log_latency(self) -> None:
+        """
+        Periodically log the latency of the pose pipeline.
+        """
+        for stage, percentiles in self.latency_report().items():
+            logger.debug(
+                f"Latency {stage}: "
+                + ", ".join(f"{k}={v:.2f}ms" for k, v in percentiles.items())
+            )
+
+        logger.debug(
+            f"Publisher: depth={self.publisher.depth}, "
+            + f"max_depth={self.publisher.max_depth}, "
+            + f"coalesced={self.publisher.coalesced}, failed={self.publisher.failed}"
+        )
+
+    def stats_report(self) -> Dict[str, Any]:
+        """
+        Counters of the whole module, with the frame rates since the last report.
+        """
+        now = time.monotonic()
+        # reports are seconds apart, this only guards against dividing by zero
+        elapsed = max(now - self._stats_time, 1e-3)
+        frame_stats = self.frame_stats
+        grab_rate = (frame_stats.frames - self._stats_frames) / elapsed
+        publish_rate = (frame_stats.published - self._stats_published) / elapsed
+        self._stats_time = now
+        self._stats_frames = frame_stats.frames
+        self._stats_published = frame_stats.published
+
+        encode_latency = self.image_encoder.encode_latency.percentiles()
+        coord_trans = self.coord_trans
+
+        report = {
+            "grab": {
+                "rate_hz": grab_rate,
+                "frames": frame_stats.frames,
+                "failed": frame_stats.failed,
+                "dropped": frame_stats.dropped,
+            },
+            "pose": {
+                "rate_hz": publish_rate,
+                "published": frame_stats.published,
+                "rejected_nan": frame_stats.rejected,
+                "lagged": frame_stats.lagged,
+                "overruns": frame_stats.overruns,
+            },
+            "images": {
+                "encoded": self.image_encoder.encoded,
+                "dropped": self.image_encoder.dropped,
+                "failed": self.image_encoder.failed,
+                "sent": self.image_publisher.sent,
+                "send_failed": self.image_publisher.failed,
+                "encode_ms": {
+                    "p50": encode_latency["p50"],
+                    "p95": encode_latency["p95"],
+                },
+            },
+            "publisher": {
+                "sent": self.publisher.sent,
+                "coalesced": self.publisher.coalesced,
+                "failed": self.publisher.failed,
+                "depth": self.publisher.depth,
+            },
+            "throttled": {
+                topic: throttle.suppressed for topic, throttle in self.throttles.items()
+            },
+            "resync": {
+                "count": coord_trans.syncs,
+                "rejected": coord_trans.aligner.rejected,
+                "heading_offset_deg": math.degrees(coord_trans.heading_offset),
+                "position_offset_cm": coord_trans.position_offset,
+            },
+        }
+
+        report["startup"] = dict(self.startup)
+
+        if self.scheduler is not None:
+            report["scheduler"] = self.scheduler.report()
+
+        if self.attitude is not None:
+            report["attitude"] = self.attitude.report()
+
+        if self.predictor is not None:
+            report["prediction"] = self.predictor.report()
+
+        # only the ZED is reopened when grabs keep failing
+        supervisor = getattr(self.camera, "supervisor", None)
+        if supervisor is not None:
+            report["camera"] = supervisor.report()
+
+        # only the ZED has spatial memory
+        area_report = getattr(self.camera, "area_report", None)
+        if config.AREA_MEMORY and area_report is not None:
+            report["area"] = area_report()
+
+        return report
+
+    @run_forever(period=config.STATS_PERIOD or 1)
+    @try_except(reraise=False)
+    def publish_stats(self) -> None:
+        """
+        Periodically publish the module's counters.
+        """
+        self.publisher.publish(STATS_TOPIC, self.stats_report())
+
+    def status_report(self) -> Dict[str, Any]:
+        """
+        Readiness of the module, why, and how long each startup step took.
+        """
+        now = time.monotonic()
+        supervisor = getattr(self.camera, "supervisor", None)
+        if not self.camera_ready:
+            if self.camera_failures:
+                state, reason = "degraded", "camera setup failed"
+            else:
+                state, reason = "starting", "setting up camera"
+        elif supervisor is not None and supervisor.state == "reconnecting":
+            state, reason = "degraded", "camera reconnecting"
+        elif self._last_pose is None:
+            if now - self._camera_ready_time > config.STATUS_STALE_TIMEOUT:
+                state, reason = "degraded", "no pose since camera setup"
+            else:
+                state, reason = "starting", "waiting for first pose"
+        elif now - self._last_pose > config.STATUS_STALE_TIMEOUT:
+            state, reason = "degraded", "poses stopped"
+        else:
+            state, reason = "tracking", ""
+
+        return {"state": state, "reason": reason, "startup": dict(self.startup)}
+
+    @run_forever(period=config.STATUS_PERIOD or 1)
+    @try_except(reraise=False)
+    def publish_status(self) -> None:
+        """
+        Periodically publish the readiness of the module.
+        """
+        status = self.status_report()
+        if status["state"] != self._status_state:
+            self._status_state = status["state"]
+            logger.info(f"Status: {status['state']} {status['reason']}".strip())
+
+        self.publisher.publish(STATUS_TOPIC, status)
 
     @run_forever(frequency=100)
     def stream_rgb_images(self) -> None:
         """
-        Constantly capture and send images from the RGB camera.
+        Constantly capture and send images from the RGB camera, and serve
+        single image requests.
         """
+        if self.image_request is not None:
+            self.serve_image_request()
+
         if self.image_stream_enabled:
+            frequency = self.image_stream_frequency
+            scale = self.image_stream_scale
+
+            if self.scheduler is not None:
+                # the pose loop goes first
+                if not self.scheduler.image_allowed():
+                    return
+                frequency, scale = self.scheduler.image_settings(frequency, scale)
+
             rate_limit(
                 lambda: self.send_rgb_image(
-                    self.image_stream_side, self.image_stream_compressed
+                    self.image_stream_side,
+                    self.image_stream_compressed,
+                    level=self.image_stream_compression_level,
+                    scale=scale,
                 ),
-                frequency=self.image_stream_frequency,
+                frequency=frequency,
             )
 
-    def run(self) -> None:
-        self.run_non_blocking()
+    def run_image_stream(self) -> None:
+        """
+        Run the image stream loop, at a lower priority than the pose loop when
+        the adaptive scheduler is enabled.
+        """
+        if self.scheduler is not None:
+            lower_thread_priority(config.SCHEDULER_IMAGE_NICE)
+
+        self.stream_rgb_images()
 
-        # setup the tracking camera
+    def setup_camera(self) -> None:
+        """
+        Set up the camera, retrying every `config.CAMERA_SETUP_RETRY_PERIOD`
+        seconds until it works.
+        """
         logger.debug("Setting up camera connection")
-        self.camera.setup()
+        while True:
+            try:
+                self.camera.setup()
+                break
+            except Exception as e:
+                self.camera_failures += 1
+                logger.error(
+                    "Camera setup failed, retrying in"
+                    + f" {config.CAMERA_SETUP_RETRY_PERIOD}s: {e}"
+                )
+                time.sleep(config.CAMERA_SETUP_RETRY_PERIOD)
+
+        self.startup["camera_s"] = process_uptime()
+        self._camera_ready_time = time.monotonic()
+        self.camera_ready = True
+        logger.success(f"Camera set up {self.startup['camera_s']:.2f}s after start")
+
+    def run(self) -> None:
+        # opening the camera and starting tracking takes seconds, so it
+        # happens while MQTT connects rather than after
+        camera_setup = threading.Thread(
+            target=self.setup_camera, name="camera-setup", daemon=True
+        )
+        camera_setup.start()
 
-        # start the image stream handler loop
-        stream_thread = threading.Thread(target=self.stream_rgb_images)
-        stream_thread.start()
+        self.run_non_blocking()
+        self.startup["mqtt_s"] = process_uptime()
+
+        # start sending messages and the image encoders, so the status
+        # is published while the camera is still being set up
+        self.publisher.start()
+        self.image_publisher.start()
+        self.image_encoder.start()
+
+        if config.STATUS_PERIOD:
+            threading.Thread(
+                target=self.publish_status, name="status", daemon=True
+            ).start()
+
+        if config.STATS_PERIOD:
+            threading.Thread(
+                target=self.publish_stats, name="stats", daemon=True
+            ).start()
+
+        if config.LATENCY_LOG_PERIOD:
+            threading.Thread(
+                target=self.log_latency, name="latency-log", daemon=True
+            ).start()
+
+        camera_setup.join()
+        if config.AREA_MEMORY:
+            self.restore_sync()
+
+        # the image stream handler loop and the gyro need the camera
+        threading.Thread(
+            target=self.run_image_stream, name="image-stream", daemon=True
+        ).start()
+
+        if self.attitude is not None:
+            threading.Thread(
+                target=self.process_imu_data, name="imu", daemon=True
+            ).start()
 
         # begin processing data
-        self.process_camera_data()
+        try:
+            if self.scheduler is not None:
+                self.process_camera_scheduled()
+            elif config.CAM_GRAB_PACED:
+                self.process_camera_frames()
+            else:
+                self.process_camera_data()
+        finally:
+            self.shutdown()
+
+    def shutdown(self) -> None:
+        """
+        Save what has to outlive the module, like the area file and recording.
+        """
+        logger.info("Shutting down")
+        self.camera.close()
+        if self.recorder is not None:
+            self.recorder.close()
 
 
 if __name__ == "__main__":
+    # shut down cleanly when the container is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
     vio = VIOModule()
     vio.run()
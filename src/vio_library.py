@@ -1,14 +1,106 @@
+from __future__ import annotations
+
 import math
-from typing import Dict, Tuple
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
 
 import config
 import numpy as np
-import transforms3d as t3d
+from alignment_library import ResyncAligner
 from bell.avr.mqtt.payloads import AVRVIOResync
 from bell.avr.utils.decorators import try_except
+from history_library import PoseHistory
 from loguru import logger
 from models import CameraFrameData
-from nptyping import Float, NDArray, Shape
+
+if TYPE_CHECKING:
+    from nptyping import Float, NDArray, Shape
+
+# same thresholds transforms3d uses for degenerate quaternions and gimbal lock
+_FLOAT_EPS = np.finfo(np.float64).eps
+_EPS4 = _FLOAT_EPS * 4.0
+
+
+def _mat2euler_rxyz(M: NDArray[Shape["4, 4"], Float]) -> Tuple[float, float, float]:
+    """
+    Closed form of `t3d.euler.mat2euler(M, axes="rxyz")` for a rigid transform.
+    Reads elements with `.item()` so no numpy scalars are created.
+    """
+    M22 = M.item(2, 2)
+    M12 = M.item(1, 2)
+    cy = math.sqrt(M22 * M22 + M12 * M12)
+    ay = -math.atan2(-M.item(0, 2), cy)
+
+    if cy > _EPS4:
+        return (
+            -math.atan2(M12, M22),
+            ay,
+            -math.atan2(M.item(0, 1), M.item(0, 0)),
+        )
+
+    return (-0.0, ay, -math.atan2(-M.item(1, 0), M.item(1, 1)))
+
+
+def _euler2mat_rxyz(
+    roll: float, pitch: float, yaw: float
+) -> NDArray[Shape["3, 3"], Float]:
+    """
+    Closed form of `t3d.euler.euler2mat(roll, pitch, yaw, axes="rxyz")`.
+    """
+    sa, ca = math.sin(roll), math.cos(roll)
+    sb, cb = math.sin(pitch), math.cos(pitch)
+    sc, cc = math.sin(yaw), math.cos(yaw)
+    return np.array(
+        (
+            (cb * cc, -cb * sc, sb),
+            (ca * sc + sa * sb * cc, ca * cc - sa * sb * sc, -sa * cb),
+            (sa * sc - ca * sb * cc, sa * cc + ca * sb * sc, ca * cb),
+        )
+    )
+
+
+def _compose(
+    translation: Any, rotation: NDArray[Shape["3, 3"], Float]
+) -> NDArray[Shape["4, 4"], Float]:
+    """
+    Same as `t3d.affines.compose(translation, rotation, np.ones(3))`.
+    """
+    H = np.eye(4)
+    H[:3, :3] = rotation
+    H[:3, 3] = translation
+    return H
+
+
+def _frozen(M: NDArray) -> NDArray:
+    """
+    Read-only copy of an array.
+    """
+    M = np.array(M, dtype=np.float64)
+    M.setflags(write=False)
+    return M
+
+
+class TransformState:
+    """
+    Immutable snapshot of the transforms that change on a resync.
+    A new snapshot is built for every resync and swapped in whole, so the camera
+    thread always sees a consistent set of matrices without taking a lock.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        H_aeroRefSync_aeroRef: NDArray[Shape["4, 4"], Float],
+        H_aeroRef_TRACKCAMRef: NDArray[Shape["4, 4"], Float],
+    ) -> None:
+        self.version = version
+        """
+        Incremented for every new snapshot.
+        """
+        self.H_aeroRefSync_aeroRef = _frozen(H_aeroRefSync_aeroRef)
+        self.H_aeroRefSync_TRACKCAMRef = _frozen(
+            self.H_aeroRefSync_aeroRef.dot(H_aeroRef_TRACKCAMRef)
+        )
 
 
 class CameraCoordinateTransformation:
@@ -20,21 +112,25 @@ class CameraCoordinateTransformation:
     def __init__(self):
         # dict to hold transformation matrixes
         self.tm: Dict[str, NDArray[Shape["4, 4, 4, 4"], Float]] = {}
+
+        # serializes writers of the transform state and the resync window.
+        # Readers of the transform state never take it.
+        self._state_lock = threading.Lock()
+        self._version = 0
+
+        # number of resyncs, and the offsets fit by the last one
+        self.syncs = 0
+        self.heading_offset = 0.0
+        self.position_offset: Tuple[float, float, float] = (0.0, 0.0, 0.0)
+
         # setup transformation matrixes
         self.setup_transforms()
 
     def setup_transforms(self) -> None:
         cam_rpy = config.CAM_ATTITUDE
 
-        H_aeroBody_TRACKCAMBody = t3d.affines.compose(
-            np.asarray(config.CAM_POS),
-            t3d.euler.euler2mat(
-                cam_rpy[0],
-                cam_rpy[1],
-                cam_rpy[2],
-                axes="rxyz",
-            ),
-            np.asarray((1, 1, 1)),
+        H_aeroBody_TRACKCAMBody = _compose(
+            config.CAM_POS, _euler2mat_rxyz(cam_rpy[0], cam_rpy[1], cam_rpy[2])
         )
         self.tm["H_aeroBody_TRACKCAMBody"] = H_aeroBody_TRACKCAMBody
         self.tm["H_TRACKCAMBody_aeroBody"] = np.linalg.inv(H_aeroBody_TRACKCAMBody)
@@ -42,27 +138,97 @@ class CameraCoordinateTransformation:
         pos = list(config.CAM_POS)
         pos[2] = -1 * config.CAM_GROUND_HEIGHT
 
-        H_aeroRef_TRACKCAMRef = t3d.affines.compose(
-            np.asarray(pos),
-            t3d.euler.euler2mat(
-                cam_rpy[0],
-                cam_rpy[1],
-                cam_rpy[2],
-                axes="rxyz",
-            ),
-            np.asarray((1, 1, 1)),
+        H_aeroRef_TRACKCAMRef = _compose(
+            pos, _euler2mat_rxyz(cam_rpy[0], cam_rpy[1], cam_rpy[2])
         )
         self.tm["H_aeroRef_TRACKCAMRef"] = H_aeroRef_TRACKCAMRef
 
-        H_aeroRefSync_aeroRef = np.eye(4)
-        self.tm["H_aeroRefSync_aeroRef"] = H_aeroRefSync_aeroRef
+        H_nwu_aeroRef = _compose((0, 0, 0), _euler2mat_rxyz(math.pi, 0, 0))
+        self.tm["H_nwu_aeroRef"] = H_nwu_aeroRef
 
-        H_nwu_aeroRef = t3d.affines.compose(
-            np.asarray((0, 0, 0)),
-            t3d.euler.euler2mat(math.pi, 0, 0),
-            np.asarray((1, 1, 1)),
+        self.set_sync_correction(np.eye(4))
+        self.aligner = ResyncAligner(
+            window=config.RESYNC_WINDOW,
+            forgetting=config.RESYNC_FORGETTING,
+            heading_weight=config.RESYNC_HEADING_WEIGHT,
+            outlier_distance=config.RESYNC_OUTLIER_DISTANCE,
+            outlier_heading=math.radians(config.RESYNC_OUTLIER_HEADING),
         )
-        self.tm["H_nwu_aeroRef"] = H_nwu_aeroRef
+        self.setup_fast_path()
+
+    def reset_resyncs(self) -> None:
+        """
+        Forget the resyncs in the window, like when the camera's tracking frame
+        changed. Called from the camera thread, while resyncs arrive on the
+        MQTT thread.
+        """
+        with self._state_lock:
+            self.aligner.reset()
+
+    @property
+    def version(self) -> int:
+        """
+        Version of the current transform state, incremented on every resync.
+        """
+        return self.state.version
+
+    def set_sync_correction(
+        self, H_aeroRefSync_aeroRef: NDArray[Shape["4, 4"], Float]
+    ) -> None:
+        """
+        Swap in a new transform state with this sync correction.
+        """
+        with self._state_lock:
+            self._version += 1
+            state = TransformState(
+                self._version, H_aeroRefSync_aeroRef, self.tm["H_aeroRef_TRACKCAMRef"]
+            )
+            # a single reference assignment, so readers see the old or new
+            # state, never a mix
+            self.state = state
+
+            self.tm["H_aeroRefSync_aeroRef"] = state.H_aeroRefSync_aeroRef
+            self.tm["H_aeroRefSync_TRACKCAMRef"] = state.H_aeroRefSync_TRACKCAMRef
+
+    def setup_fast_path(self) -> None:
+        """
+        Preallocate the buffers used by `transform_trackcamera_to_global_ned_fast`.
+        """
+        # camera pose, filled in place. The bottom row never changes.
+        self._pose = np.eye(4)
+        # copy of the latest camera pose, for `latest_camera_pose`
+        self._latest_pose = np.eye(4)
+        self._pose_published = False
+        self._pose_lock = threading.Lock()
+        # timestamped camera poses, to resync against where the camera was
+        # when the reference position was taken
+        self.pose_history = PoseHistory(config.POSE_HISTORY_SIZE)
+        # scratch space for the chained products
+        self._H_aeroRefSync_TRACKCAMBody = np.empty((4, 4))
+        self._H_aeroRefSync_aeroBody = np.eye(4)
+        # homogeneous velocity vectors. The 4th element is always 0.
+        self._velocity = np.zeros(4)
+        self._ned_vel = np.zeros(4)
+        # view of the translation column, created once so returning it is free
+        self._ned_pos = self._H_aeroRefSync_aeroBody[:3, 3]
+
+    def _publish_camera_pose(self, H: NDArray[Shape["4, 4"], Float]) -> None:
+        """
+        Make `H` the latest camera pose.
+        """
+        with self._pose_lock:
+            np.copyto(self._latest_pose, H)
+            self._pose_published = True
+
+    def latest_camera_pose(self) -> Optional[NDArray[Shape["4, 4"], Float]]:
+        """
+        Copy of the latest camera pose, safe to call from any thread.
+        """
+        with self._pose_lock:
+            if not self._pose_published:
+                return None
+
+            return self._latest_pose.copy()
 
     @try_except(reraise=False)
     def transform_trackcamera_to_global_ned(
@@ -92,6 +258,9 @@ class CameraCoordinateTransformation:
             A 3 unit list [roll,math.pitch, yaw]
 
         """
+        # only the reference paths use transforms3d, so it isn't loaded at startup
+        import transforms3d as t3d
+
         quaternion = np.array(data["rotation"])
 
         position = (
@@ -116,6 +285,13 @@ class CameraCoordinateTransformation:
         )
 
         self.tm["H_TRACKCAMRef_TRACKCAMBody"] = H_TRACKCAMRef_TRACKCAMBody
+        self._publish_camera_pose(H_TRACKCAMRef_TRACKCAMBody)
+
+        timestamp = data.get("timestamp")
+        if timestamp is not None:
+            self.pose_history.record(timestamp, data["rotation"], data["translation"])
+
+        state = self.state
 
         H_aeroRef_aeroBody = self.tm["H_aeroRef_TRACKCAMRef"].dot(
             self.tm["H_TRACKCAMRef_TRACKCAMBody"].dot(
@@ -125,32 +301,260 @@ class CameraCoordinateTransformation:
 
         self.tm["H_aeroRef_aeroBody"] = H_aeroRef_aeroBody
 
-        H_aeroRefSync_aeroBody = self.tm["H_aeroRefSync_aeroRef"].dot(
-            H_aeroRef_aeroBody
-        )
+        H_aeroRefSync_aeroBody = state.H_aeroRefSync_aeroRef.dot(H_aeroRef_aeroBody)
         self.tm["H_aeroRefSync_aeroBody"] = H_aeroRefSync_aeroBody
 
         T, R, Z, S = t3d.affines.decompose44(H_aeroRefSync_aeroBody)
         eul = t3d.euler.mat2euler(R, axes="rxyz")
 
-        H_vel = self.tm["H_aeroRefSync_aeroRef"].dot(self.tm["H_aeroRef_TRACKCAMRef"])
+        H_vel = state.H_aeroRefSync_aeroRef.dot(self.tm["H_aeroRef_TRACKCAMRef"])
 
         vel = np.transpose(H_vel.dot(velocity))
 
         return T, vel, eul
 
+    @try_except(reraise=False)
+    def transform_trackcamera_to_global_ned_fast(
+        self, data: CameraFrameData
+    ) -> Tuple[
+        NDArray[Shape["3"], Float],
+        NDArray[Shape["4"], Float],
+        Tuple[float, float, float],
+    ]:
+        """
+        Same result as `transform_trackcamera_to_global_ned`, without the
+        per-frame allocations. The quaternion is converted straight into a
+        preallocated camera pose matrix, which is chained with the products
+        precomputed in the current `TransformState`, and the euler angles are read
+        off the result in closed form.
+
+        The returned arrays are buffers owned by this object and are
+        overwritten on the next call. Copy them if they need to be kept.
+        """
+        tm = self.tm
+        # read once, so a concurrent resync can't change it halfway through
+        state = self.state
+        H = self._pose
+
+        # quaternion to rotation matrix, same convention as t3d.quaternions.quat2mat
+        w, x, y, z = data["rotation"]
+        Nq = w * w + x * x + y * y + z * z
+        if Nq < _FLOAT_EPS:
+            H[0, 0] = 1.0
+            H[0, 1] = 0.0
+            H[0, 2] = 0.0
+            H[1, 0] = 0.0
+            H[1, 1] = 1.0
+            H[1, 2] = 0.0
+            H[2, 0] = 0.0
+            H[2, 1] = 0.0
+            H[2, 2] = 1.0
+        else:
+            s = 2.0 / Nq
+            X = x * s
+            Y = y * s
+            Z = z * s
+            wX = w * X
+            wY = w * Y
+            wZ = w * Z
+            xX = x * X
+            xY = x * Y
+            xZ = x * Z
+            yY = y * Y
+            yZ = y * Z
+            zZ = z * Z
+            H[0, 0] = 1.0 - (yY + zZ)
+            H[0, 1] = xY - wZ
+            H[0, 2] = xZ + wY
+            H[1, 0] = xY + wZ
+            H[1, 1] = 1.0 - (xX + zZ)
+            H[1, 2] = yZ - wX
+            H[2, 0] = xZ - wY
+            H[2, 1] = yZ + wX
+            H[2, 2] = 1.0 - (xX + yY)
+
+        # cm
+        tx, ty, tz = data["translation"]
+        H[0, 3] = tx * 100
+        H[1, 3] = ty * 100
+        H[2, 3] = tz * 100
+
+        # make the camera pose available for sync
+        self._publish_camera_pose(H)
+
+        timestamp = data.get("timestamp")
+        if timestamp is not None:
+            self.pose_history.record(timestamp, data["rotation"], data["translation"])
+
+        np.dot(state.H_aeroRefSync_TRACKCAMRef, H, out=self._H_aeroRefSync_TRACKCAMBody)
+        np.dot(
+            self._H_aeroRefSync_TRACKCAMBody,
+            tm["H_TRACKCAMBody_aeroBody"],
+            out=self._H_aeroRefSync_aeroBody,
+        )
+
+        # cm/s
+        vx, vy, vz = data["velocity"]
+        velocity = self._velocity
+        velocity[0] = vx * 100
+        velocity[1] = vy * 100
+        velocity[2] = vz * 100
+        np.dot(state.H_aeroRefSync_TRACKCAMRef, velocity, out=self._ned_vel)
+
+        return (
+            self._ned_pos,
+            self._ned_vel,
+            _mat2euler_rxyz(self._H_aeroRefSync_aeroBody),
+        )
+
+    def transform_trackcamera_to_global_ned_batch(
+        self,
+        rotations: NDArray[Any, Float],
+        translations: NDArray[Any, Float],
+        velocities: NDArray[Any, Float],
+        H_aeroRefSync_aeroRef: Optional[NDArray] = None,
+    ) -> Tuple[
+        NDArray[Any, Float],
+        NDArray[Any, Float],
+        NDArray[Any, Float],
+    ]:
+        """
+        Vectorized version of `transform_trackcamera_to_global_ned` for
+        reprocessing recorded camera frames in one call.
+
+        Arguments:
+        --------------------------
+        rotations : Nx4 camera quaternions, same convention as `CameraFrameData`
+        translations : Nx3 camera translations in meters
+        velocities : Nx3 camera velocities in meters per second
+        H_aeroRefSync_aeroRef : Optional sync correction. Either a single 4x4
+            matrix applied to every sample, or an Nx4x4 stack with one matrix
+            per sample. Defaults to the current sync correction.
+
+        Returns:
+        --------------------------
+        pos: Nx3 NED positions [north, east, down]
+        vel: Nx3 NED velocities [Vn, Ve, Vd]
+        rpy: Nx3 euler angles [roll, pitch, yaw]
+        """
+        q = np.asarray(rotations, dtype=np.float64).reshape(-1, 4)
+        t = np.asarray(translations, dtype=np.float64).reshape(-1, 3)
+        v = np.asarray(velocities, dtype=np.float64).reshape(-1, 3)
+
+        if not len(q) == len(t) == len(v):
+            raise ValueError("rotations, translations and velocities differ in length")
+
+        if H_aeroRefSync_aeroRef is None:
+            H_aeroRefSync_aeroRef = self.state.H_aeroRefSync_aeroRef
+
+        H_sync = np.asarray(H_aeroRefSync_aeroRef, dtype=np.float64)
+        if H_sync.shape not in ((4, 4), (len(q), 4, 4)):
+            raise ValueError(
+                f"H_aeroRefSync_aeroRef must be 4x4 or {len(q)}x4x4, got {H_sync.shape}"
+            )
+
+        # quaternions to rotation matrices, same convention as t3d.quaternions.quat2mat
+        w, x, y, z = q.T
+        Nq = np.einsum("ij,ij->i", q, q)
+        degenerate = Nq < _FLOAT_EPS
+        s = 2.0 / np.where(degenerate, 1.0, Nq)
+        X = x * s
+        Y = y * s
+        Z = z * s
+
+        H = np.zeros((len(q), 4, 4))
+        H[:, 0, 0] = 1.0 - (y * Y + z * Z)
+        H[:, 0, 1] = x * Y - w * Z
+        H[:, 0, 2] = x * Z + w * Y
+        H[:, 1, 0] = x * Y + w * Z
+        H[:, 1, 1] = 1.0 - (x * X + z * Z)
+        H[:, 1, 2] = y * Z - w * X
+        H[:, 2, 0] = x * Z - w * Y
+        H[:, 2, 1] = y * Z + w * X
+        H[:, 2, 2] = 1.0 - (x * X + y * Y)
+        H[degenerate, :3, :3] = np.eye(3)
+        H[:, :3, 3] = t * 100  # cm
+        H[:, 3, 3] = 1.0
+
+        H_aeroRefSync_TRACKCAMRef = H_sync @ self.tm["H_aeroRef_TRACKCAMRef"]
+        H_aeroRefSync_aeroBody = (
+            H_aeroRefSync_TRACKCAMRef @ H @ self.tm["H_TRACKCAMBody_aeroBody"]
+        )
+
+        pos = H_aeroRefSync_aeroBody[:, :3, 3]
+
+        # cm/s, the homogeneous 4th component is 0 so only the rotation applies
+        R_vel = H_aeroRefSync_TRACKCAMRef[..., :3, :3]
+        if R_vel.ndim == 2:
+            vel = (v * 100) @ R_vel.T
+        else:
+            vel = np.einsum("nij,nj->ni", R_vel, v * 100)
+
+        # closed form of t3d.euler.mat2euler(R, axes="rxyz"), see _mat2euler_rxyz
+        M = H_aeroRefSync_aeroBody
+        cy = np.hypot(M[:, 2, 2], M[:, 1, 2])
+        regular = cy > _EPS4
+        rpy = np.empty((len(q), 3))
+        rpy[:, 0] = np.where(regular, -np.arctan2(M[:, 1, 2], M[:, 2, 2]), -0.0)
+        rpy[:, 1] = -np.arctan2(-M[:, 0, 2], cy)
+        rpy[:, 2] = np.where(
+            regular,
+            -np.arctan2(M[:, 0, 1], M[:, 0, 0]),
+            -np.arctan2(-M[:, 1, 0], M[:, 1, 1]),
+        )
+
+        return pos, vel, rpy
+
+    def camera_pose_at(self, timestamp: int) -> Optional[NDArray[Shape["4, 4"], Float]]:
+        """
+        Camera pose at `timestamp`, in nanoseconds, interpolated from the pose
+        history. None if the history does not go back that far.
+        """
+        import transforms3d as t3d
+
+        pose = self.pose_history.lookup(timestamp)
+        if pose is None:
+            return None
+
+        rotation, translation = pose
+        return t3d.affines.compose(
+            translation * 100,  # cm
+            t3d.quaternions.quat2mat(rotation),
+            np.asarray((1, 1, 1)),
+        )
+
     @try_except()
-    def sync(self, resync_data: AVRVIOResync) -> None:
+    def sync(self, resync_data: AVRVIOResync, timestamp: Optional[int] = None) -> None:
         """
-        Computes offsets between TRACKCAMera ref and "global" frames, to align coord. systems
+        Computes offsets between TRACKCAMera ref and "global" frames, to align coord. systems.
+        With a `timestamp`, in nanoseconds, of when the reference position was
+        valid, the offsets are computed against where the camera was at that
+        time, instead of the latest camera pose.
         """
-        # get current readings on where the aeroBody is, according to the sensor
-        if "H_aeroRef_aeroBody" not in self.tm:
-            raise ValueError("H_aeroRef_aeroBody transformation matrix not found")
+        # get readings on where the aeroBody is, according to the sensor.
+        # This runs on the MQTT thread, so take a consistent copy of the
+        # camera pose rather than reading the camera thread's buffers.
+        H_TRACKCAMRef_TRACKCAMBody = None
+        if timestamp is not None:
+            H_TRACKCAMRef_TRACKCAMBody = self.camera_pose_at(timestamp)
+            if H_TRACKCAMRef_TRACKCAMBody is None:
+                logger.warning(
+                    "TRACKCAM: Resync: older than pose history, using latest"
+                )
+
+        if H_TRACKCAMRef_TRACKCAMBody is None:
+            H_TRACKCAMRef_TRACKCAMBody = self.latest_camera_pose()
+
+        if H_TRACKCAMRef_TRACKCAMBody is None:
+            raise ValueError(
+                "H_TRACKCAMRef_TRACKCAMBody transformation matrix not found"
+            )
 
-        H = self.tm["H_aeroRef_aeroBody"]
-        T, R, Z, S = t3d.affines.decompose44(H)
-        eul = t3d.euler.mat2euler(R, axes="rxyz")
+        H = self.tm["H_aeroRef_TRACKCAMRef"].dot(
+            H_TRACKCAMRef_TRACKCAMBody.dot(self.tm["H_TRACKCAMBody_aeroBody"])
+        )
+        T = H[:3, 3].copy()
+        eul = _mat2euler_rxyz(H)
 
         # Find the heading offset...
         heading = eul[2]
@@ -159,32 +563,40 @@ class CameraCoordinateTransformation:
         if heading < 0:
             heading += 2 * math.pi
 
-        # compute the difference between our global reference, and what our sensor is reading for heading
-        heading_offset = resync_data.hdg - (math.degrees(heading))
-        logger.debug(f"TRACKCAM: Resync: Heading Offset:{heading_offset}")
+        # fit the heading and position offsets over the recent resyncs,
+        # so a single noisy reference does not step the output. The window
+        # can't be reset in between.
+        with self._state_lock:
+            self.aligner.add(
+                T,
+                heading,
+                np.array((resync_data.n, resync_data.e, resync_data.d)),
+                math.radians(resync_data.hdg),
+            )
+            heading_offset, pos_offset = self.aligner.solve()
+            rejected = self.aligner.rejected
 
-        # build a rotation matrix about the global Z axis to apply the heading offset we computed
-        H_rot_correction = t3d.affines.compose(
-            np.asarray((0, 0, 0)),
-            t3d.axangles.axangle2mat(np.array((0, 0, 1)), math.radians(heading_offset)),
-            np.asarray((1, 1, 1)),
-        )
+        self.syncs += 1
+        logger.debug(f"TRACKCAM: Resync: Heading Offset:{math.degrees(heading_offset)}")
+        logger.debug(f"TRACKCAM: Resync: Pos offset:{pos_offset}")
+        if rejected:
+            logger.debug(f"TRACKCAM: Resync: Ignored {rejected} outliers")
 
-        # apply the heading correction to the position data the TRACKCAM is providing
-        H = H_rot_correction.dot(H)
-        T, R, Z, S = t3d.affines.decompose44(H)
-        eul = t3d.euler.mat2euler(R, axes="rxyz")
+        self.apply_sync_offsets(heading_offset, tuple(pos_offset.tolist()))  # type: ignore
 
-        # Find the position offset
-        pos_offset = [
-            resync_data.n - T[0],
-            resync_data.e - T[1],
-            resync_data.d - T[2],
-        ]
-        logger.debug(f"TRACKCAM: Resync: Pos offset:{pos_offset}")
+    def apply_sync_offsets(
+        self, heading_offset: float, position_offset: Tuple[float, float, float]
+    ) -> None:
+        """
+        Set the sync correction from a heading offset in radians, and a position
+        offset in cm, like a previous resync fit.
+        """
+        self.heading_offset = heading_offset
+        self.position_offset = position_offset
 
-        # build a translation matrix that corrects the difference between where the sensor thinks we are and were our reference thinks we are
-        H_aeroRefSync_aeroRef = t3d.affines.compose(
-            np.asarray(pos_offset), H_rot_correction[:3, :3], np.asarray((1, 1, 1))
+        # build a matrix that rotates about the global Z axis by the heading offset,
+        # and corrects the difference between where the sensor thinks we are and were our reference thinks we are
+        H_aeroRefSync_aeroRef = _compose(
+            position_offset, _euler2mat_rxyz(0, 0, heading_offset)
         )
-        self.tm["H_aeroRefSync_aeroRef"] = H_aeroRefSync_aeroRef
+        self.set_sync_correction(H_aeroRefSync_aeroRef)
@@ -1,17 +1,25 @@
 from __future__ import annotations
 
-import sys
-from typing import TYPE_CHECKING, Literal, Optional
+import math
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Literal, Optional
 
 if TYPE_CHECKING:
     import numpy as np
 
 # Getting pyzed installed in a dev environment is very painful unless
 # you already have CUDA and the ZED SDK installed.
+import config
 import pyzed.sl as sl  # type: ignore
-from bell.avr.utils.decorators import try_except
+from bell.avr.utils.decorators import run_forever, try_except
+from capture_library import LatestFrameSlot
 from loguru import logger
-from models import CameraFrameData
+from models import CameraFrameData, ImageFrameData, ImuData
+from stats_library import LatencyTracker
+from supervisor_library import CameraSupervisor
+from velocity_library import create_velocity_estimator
 
 
 # Largely adapted from this
@@ -24,19 +32,107 @@ class ZEDCamera:
     """
 
     def __init__(self) -> None:
-        self.last_time = 0
-        self.last_pos = (0, 0, 0)
+        self.velocity_estimator = create_velocity_estimator()
+
+        # ID and image timestamp of the last successful grab
+        self.frame_id = 0
+        self.timestamp = 0
+
+        # newest gyro sample read after a grab, and the timestamp of the last
+        # one returned
+        self._imu_sample: Optional[ImuData] = None
+        self.imu_timestamp = 0
+
+        # spatial memory, see `config.AREA_MEMORY`. Whether an area file was
+        # loaded, the tracking state of the last grab, and whether and how many
+        # seconds after setup tracking relocalized in the loaded area
+        self.area_loaded = False
+        self.tracking_state: Any = None
+        self.relocalized = False
+        self.relocalization_time: Optional[float] = None
+        # area file saves, failed saves, and monotonic time of the last save
+        self.area_saves = 0
+        self.area_save_failures = 0
+        self.area_saved_at: Optional[float] = None
+        self._setup_time = time.monotonic()
+        # exports are started from the pose loop, between grabs
+        self._area_save_requested = threading.Event()
+        self._area_export_started = threading.Event()
+        self._area_export_ok = False
+        self._area_export_status: Any = None
+
+        # called from the pose thread when the tracking frame may have changed,
+        # after reconnecting or relocalizing in the area file
+        self.on_tracking_reset: Optional[Callable[[], None]] = None
+
+        # reopens the camera when grabs keep failing
+        self.supervisor = CameraSupervisor(
+            failure_limit=config.CAMERA_GRAB_FAILURE_LIMIT,
+            backoff=config.CAMERA_RECONNECT_BACKOFF,
+            max_backoff=config.CAMERA_RECONNECT_MAX_BACKOFF,
+        )
+
+        # time spent blocked in grab, fetching the pose after it,
+        # and retrieving requested images
+        self.grab_latency = LatencyTracker()
+        self.pose_latency = LatencyTracker()
+        self.capture_latency = LatencyTracker()
+
+        # images are retrieved on the pose thread into preallocated buffers,
+        # once the pose of a grab is published, and only for the sides that
+        # were recently asked for
+        self._image_views = {"left": sl.VIEW.LEFT, "right": sl.VIEW.RIGHT}
+        self._image_slots: Dict[str, LatestFrameSlot] = {}
+        self._image_demand: Dict[str, float] = {}
+        self._image_lock = threading.Lock()
+        self._captured_frame_id = 0
 
         # Create a Camera object
         self.zed = sl.Camera()
 
     @try_except(reraise=True)
     def setup(self) -> None:
+        self.open()
+        self._setup_time = time.monotonic()
+
+        # create class attributes to hold the camera data
+        # i'm not really sure, Zed API is super weird
+        self.zed_pose = sl.Pose()
+        self.zed_sensors = sl.SensorsData()
+
+        self.zed.get_position(self.zed_pose, sl.REFERENCE_FRAME.WORLD)
+        self.zed.get_sensors_data(self.zed_sensors, sl.TIME_REFERENCE.IMAGE)
+        # gyro samples are read right after each grab, into their own object
+        self.imu_sensors = sl.SensorsData()
+
+        self.runtime_parameters = sl.RuntimeParameters()
+
+        # three image buffers per side, so retrieving never waits on a reader
+        resolution = self.zed.get_camera_information().camera_resolution
+        self._image_slots = {
+            side: LatestFrameSlot(
+                lambda: sl.Mat(resolution.width, resolution.height, sl.MAT_TYPE.U8_C4)
+            )
+            for side in self._image_views
+        }
+
+        if config.AREA_MEMORY and config.AREA_SAVE_PERIOD:
+            threading.Thread(
+                target=self.save_area_periodically, name="area-saver", daemon=True
+            ).start()
+
+    def open(self, init_pos: Any = None) -> None:
+        """
+        Open the camera and enable positional tracking. Tracking starts at
+        `init_pos`, a `sl.Transform`, or with the floor as the origin
+        without one.
+        """
         # Create a InitParameters object and set configuration parameters
         init_params = sl.InitParameters()
         init_params.camera_resolution = (
             sl.RESOLUTION.HD720
         )  # Use HD720 video mode (default fps: 60)
+        init_params.camera_fps = config.CAM_FPS
         # Use a right-handed Y-up coordinate system
         init_params.coordinate_system = sl.COORDINATE_SYSTEM.RIGHT_HANDED_Y_UP
         init_params.coordinate_units = sl.UNIT.METER  # Set units in meters
@@ -44,48 +140,134 @@ class ZEDCamera:
         # Open the camera
         logger.debug("ZED Camera Loading...")
 
-        if self.zed.open(init_params) != sl.ERROR_CODE.SUCCESS:
+        status = self.zed.open(init_params)
+        if status != sl.ERROR_CODE.SUCCESS:
             logger.error("ZED Camera Loadng (FAILED!!!)")
-            sys.exit(1)
+            raise RuntimeError(f"Could not open the ZED camera: {status}")
 
         logger.success("ZED Camera Loaded")
 
         # Enable positional tracking with default parameters
         py_transform = (
-            sl.Transform()
+            sl.Transform() if init_pos is None else init_pos
         )  # First create a Transform object for TrackingParameters object
         self.tracking_parameters = sl.PositionalTrackingParameters(
             _init_pos=py_transform
         )
-        self.tracking_parameters.set_floor_as_origin = True
+        # finding the floor again would move the origin away from the last pose
+        self.tracking_parameters.set_floor_as_origin = init_pos is None
 
-        if (
-            self.zed.enable_positional_tracking(self.tracking_parameters)
-            != sl.ERROR_CODE.SUCCESS
-        ):
-            exit(1)
+        if config.AREA_MEMORY:
+            self.tracking_parameters.enable_area_memory = True
+            if os.path.isfile(config.AREA_FILE):
+                # tracking searches for where it is in the saved area,
+                # and continues in its frame once found
+                self.tracking_parameters.area_file_path = config.AREA_FILE
+                self.area_loaded = True
+                logger.info(f"Relocalizing in area file {config.AREA_FILE}")
+
+        status = self.zed.enable_positional_tracking(self.tracking_parameters)
+        if status != sl.ERROR_CODE.SUCCESS:
+            # closed again, so the next attempt can open it
+            self.zed.close()
+            raise RuntimeError(f"Could not enable ZED positional tracking: {status}")
 
         logger.debug("ZED Camera Enabled positional tracking")
 
-        # create class attributes to hold the camera data
-        # i'm not really sure, Zed API is super weird
-        self.zed_pose = sl.Pose()
-        self.zed_sensors = sl.SensorsData()
+    def reconnect(self) -> None:
+        """
+        Close the camera and open it again, with tracking continuing from the
+        pose of the last successful grab. Waits out the backoff of a failed
+        attempt first.
+        """
+        time.sleep(self.supervisor.retry_delay())
 
-        self.zed.get_position(self.zed_pose, sl.REFERENCE_FRAME.WORLD)
-        self.zed.get_sensors_data(self.zed_sensors, sl.TIME_REFERENCE.IMAGE)
+        # the pose is only updated by successful grabs. Before the first one
+        # there is no pose to continue from, so the floor is found again.
+        init_pos = self.zed_pose.pose_data(sl.Transform()) if self.frame_id else None
 
-        self.runtime_parameters = sl.RuntimeParameters()
+        self.zed.close()
+        try:
+            self.open(init_pos)
+        except RuntimeError as e:
+            delay = self.supervisor.reopen_failed()
+            logger.error(f"ZED Camera reconnect failed, retrying in {delay:.2f}s: {e}")
+            return
+
+        self.supervisor.reopened()
+        logger.success("ZED Camera reconnected")
+        self._tracking_reset()
+
+    def _tracking_reset(self) -> None:
+        if self.on_tracking_reset is not None:
+            self.on_tracking_reset()
+
+    def capture_images(self) -> None:
+        """
+        Retrieve the images of the last grab that were recently asked for.
+        This has to happen before the next grab replaces them, so the pose loop
+        calls it once the pose of the grab is published.
+        """
+        if self._captured_frame_id == self.frame_id:
+            return
+
+        self._captured_frame_id = self.frame_id
+
+        now = time.monotonic()
+        start = time.perf_counter()
+        captured = False
+
+        for side, slot in self._image_slots.items():
+            if (
+                now - self._image_demand.get(side, -math.inf)
+                > config.IMAGE_DEMAND_TIMEOUT
+            ):
+                continue
+
+            self.zed.retrieve_image(slot.back(), self._image_views[side])
+            slot.publish(self.frame_id, self.timestamp)
+            captured = True
+
+        if captured:
+            self.capture_latency.record(time.perf_counter() - start)
 
     @try_except(reraise=True)
     def get_pipe_data(self) -> Optional[CameraFrameData]:
+        if self.supervisor.state == "reconnecting":
+            self.reconnect()
+            return
+
+        start = time.perf_counter()
         if self.zed.grab(self.runtime_parameters) != sl.ERROR_CODE.SUCCESS:
             logger.warning("ZED Camera Grab Failed")
+            if self.supervisor.grab_failed():
+                logger.error(
+                    f"ZED Camera: {self.supervisor.consecutive_failures} grabs"
+                    + " failed in a row, reconnecting"
+                )
             return
+        grabbed = time.perf_counter()
+        self.grab_latency.record(grabbed - start)
+        self.frame_id += 1
+
+        if self.supervisor.state != "running":
+            recovering = self.supervisor.state == "recovering"
+            self.supervisor.grab_succeeded()
+            if recovering:
+                logger.success(
+                    f"ZED Camera recovered after {self.supervisor.recovery_time:.2f}s"
+                )
 
         # Get the pose of the left eye of the camera with reference to the world frame
-        self.zed.get_position(self.zed_pose, sl.REFERENCE_FRAME.WORLD)
+        self.update_tracking_state(
+            self.zed.get_position(self.zed_pose, sl.REFERENCE_FRAME.WORLD)
+        )
         self.zed.get_sensors_data(self.zed_sensors, sl.TIME_REFERENCE.IMAGE)
+        if config.IMU_ATTITUDE:
+            self.read_imu()
+
+        if self._area_save_requested.is_set():
+            self._start_area_export()
 
         # Retrieve the translation
         py_translation = sl.Translation()
@@ -94,17 +276,9 @@ class ZEDCamera:
         tz = self.zed_pose.get_translation(py_translation).get()[2]
 
         # Calculate Velocity
-        current_time = self.zed.get_timestamp(
-            sl.TIME_REFERENCE.IMAGE
-        ).get_milliseconds()
-        diffx = tx - self.last_pos[0]
-        diffy = ty - self.last_pos[1]
-        diffz = tz - self.last_pos[2]
-        time_diff = (current_time - self.last_time) / 1000
-
-        velocity = (diffx / time_diff, diffy / time_diff, diffz / time_diff)
-        self.last_time = current_time
-        self.last_pos = (tx, ty, tz)
+        timestamp = self.zed.get_timestamp(sl.TIME_REFERENCE.IMAGE).get_nanoseconds()
+        velocity = self.velocity_estimator.update(timestamp, (tx, ty, tz))
+        self.timestamp = timestamp
 
         # get orientation
         py_orientation = sl.Orientation()
@@ -123,24 +297,213 @@ class ZEDCamera:
         # assemble return value
         translation = (tx, ty, tz)
 
+        self.pose_latency.record(time.perf_counter() - grabbed)
+
         return CameraFrameData(
             rotation=rotation,
             translation=translation,
             velocity=velocity,
             tracker_confidence=self.zed_pose.pose_confidence,
+            timestamp=timestamp,
+            frame_id=self.frame_id,
         )
 
-    def get_rgb_image(self, side: Literal["left", "right"]) -> np.ndarray:
+    def update_tracking_state(self, state: Any) -> None:
         """
-        Return an RGB image from the camera for the specified side.
+        Record the positional tracking state of a grab, and when it relocalized
+        in the loaded area file.
+        """
+        if state == self.tracking_state:
+            return
+
+        logger.info(f"ZED tracking state {self.tracking_state} -> {state}")
+        self.tracking_state = state
+
+        # tracking searches for a known position until it relocalizes
+        if (
+            self.area_loaded
+            and not self.relocalized
+            and state == sl.POSITIONAL_TRACKING_STATE.OK
+        ):
+            self.relocalized = True
+            self.relocalization_time = time.monotonic() - self._setup_time
+            logger.success(
+                f"Relocalized in the area file after {self.relocalization_time:.1f}s"
+            )
+            self._tracking_reset()
+
+    def _area_temp_file(self) -> str:
+        """
+        Where the area file is exported to first. Next to the area file, which is
+        only replaced once complete, and with the `.area` extension the ZED SDK
+        requires, like `vio.tmp.area`.
+        """
+        root, extension = os.path.splitext(config.AREA_FILE)
+        return f"{root}.tmp{extension}"
+
+    def _start_area_export(self) -> None:
+        self._area_save_requested.clear()
+        self._area_export_status = self.zed.save_area_map(self._area_temp_file())
+        self._area_export_ok = self._area_export_status == sl.ERROR_CODE.SUCCESS
+        self._area_export_started.set()
+
+    def save_area(self, timeout: float, direct: bool = False) -> bool:
+        """
+        Save the spatial memory to the area file, and return whether it worked.
+        The export is started from the pose loop after its next grab, unless
+        `direct`, for when the pose loop is not running. The ZED SDK exports in
+        the background, so grabs never wait on it.
+        """
+        if not config.AREA_MEMORY:
+            return False
+
+        deadline = time.monotonic() + timeout
+        self._area_export_started.clear()
+        if direct:
+            self._start_area_export()
+        else:
+            self._area_save_requested.set()
+
+        state = None
+        if not self._area_export_started.wait(timeout):
+            state = "export not started"
+        elif not self._area_export_ok:
+            # the SDK refused the export, like for a bad path
+            state = self._area_export_status
+        else:
+            while time.monotonic() < deadline:
+                state = self.zed.get_area_export_state()
+                if state == sl.AREA_EXPORTING_STATE.SUCCESS:
+                    try:
+                        os.replace(self._area_temp_file(), config.AREA_FILE)
+                    except OSError as e:
+                        state = e
+                        break
+
+                    self.area_saves += 1
+                    self.area_saved_at = time.monotonic()
+                    logger.debug(f"Saved area file {config.AREA_FILE}")
+                    return True
+
+                if state not in (
+                    sl.AREA_EXPORTING_STATE.RUNNING,
+                    sl.AREA_EXPORTING_STATE.NOT_STARTED,
+                ):
+                    break
+
+                time.sleep(0.1)
+
+        self._area_save_requested.clear()
+        self.area_save_failures += 1
+        logger.warning(f"Saving area file {config.AREA_FILE} failed: {state}")
+        return False
+
+    @run_forever(period=config.AREA_SAVE_PERIOD or 1)
+    @try_except(reraise=False)
+    def save_area_periodically(self) -> None:
+        """
+        Periodically refresh the area file with what tracking learned since.
+        """
+        self.save_area(config.AREA_SAVE_TIMEOUT)
+
+    def area_report(self) -> Dict[str, Any]:
+        """
+        Spatial memory and relocalization state.
+        """
+        return {
+            "loaded": self.area_loaded,
+            "tracking_state": str(self.tracking_state),
+            "relocalized": self.relocalized,
+            "relocalization_s": self.relocalization_time,
+            "saves": self.area_saves,
+            "save_failures": self.area_save_failures,
+            "last_save_age_s": (
+                None
+                if self.area_saved_at is None
+                else time.monotonic() - self.area_saved_at
+            ),
+        }
+
+    def close(self) -> None:
         """
-        image = sl.Mat()
+        Save the area file, then stop tracking and close the camera.
+        """
+        if config.AREA_MEMORY:
+            self.save_area(config.AREA_SAVE_TIMEOUT, direct=True)
+
+        self.zed.disable_positional_tracking()
+        self.zed.close()
+
+    def read_imu(self) -> None:
+        """
+        Read the newest gyro sample of the camera's IMU, for `get_imu_data`.
+        The ZED SDK is not made to be called from several threads at once,
+        so this is done by the pose loop right after each grab. The sample is
+        newer than the image, so the attitude still runs ahead of the frame.
+        """
+        if (
+            self.zed.get_sensors_data(self.imu_sensors, sl.TIME_REFERENCE.CURRENT)
+            != sl.ERROR_CODE.SUCCESS
+        ):
+            return
+
+        imu_data = self.imu_sensors.get_imu_data()
+        wx, wy, wz = imu_data.get_angular_velocity()
+        # deg/s, with the same y rotation fix as the orientation
+        self._imu_sample = ImuData(
+            angular_velocity=(math.radians(wx), -math.radians(wy), math.radians(wz)),
+            timestamp=imu_data.timestamp.get_nanoseconds(),
+        )
 
-        zed_view = None
-        if side == "left":
-            zed_view = sl.VIEW.LEFT
-        elif side == "right":
-            zed_view = sl.VIEW.RIGHT
+    def get_imu_data(self) -> Optional[ImuData]:
+        """
+        Newest gyro sample of the camera's IMU, if there is a new one. Samples
+        are read by the pose loop, so this never calls the SDK and can be
+        polled from another thread.
+        """
+        sample = self._imu_sample
+        if sample is None or sample["timestamp"] == self.imu_timestamp:
+            return
+
+        self.imu_timestamp = sample["timestamp"]
+        return sample
+
+    def get_image_frame(
+        self, side: Literal["left", "right"]
+    ) -> Optional[ImageFrameData]:
+        """
+        Return the latest image captured from the camera for the specified side,
+        with the ID of the frame it belongs to. Never waits, so if images of that
+        side were not being captured, returns None until the pose loop captured
+        one after the next grab.
+        """
+        now = time.monotonic()
+        demanded = (
+            now - self._image_demand.get(side, -math.inf) <= config.IMAGE_DEMAND_TIMEOUT
+        )
+        self._image_demand[side] = now
+
+        # anything captured before the demand lapsed is stale, the last grab
+        # is still retrieved before the next one
+        min_frame_id = 0 if demanded else self.frame_id
+
+        with self._image_lock:
+            latest = self._image_slots[side].latest(min_frame_id)
+            if latest is None:
+                return
+
+            image, frame_id, timestamp = latest
+            # copy, as the pose thread will reuse the buffer
+            return ImageFrameData(
+                image=image.get_data().copy(), frame_id=frame_id, timestamp=timestamp
+            )
+
+    def get_rgb_image(self, side: Literal["left", "right"]) -> Optional[np.ndarray]:
+        """
+        Return an RGB image from the camera for the specified side.
+        """
+        image_frame = self.get_image_frame(side)
+        if image_frame is None:
+            return
 
-        self.zed.retrieve_image(image, zed_view)
-        return image.get_data()
+        return image_frame["image"]
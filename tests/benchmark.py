@@ -0,0 +1,327 @@
+"""
+Benchmarks of the VIO hot path.
+
+Run the benchmarks and save the results as a baseline:
+
+    python tests/benchmark.py run --output baseline.json
+
+Then after a change, compare against it:
+
+    python tests/benchmark.py run --output current.json
+    python tests/benchmark.py compare baseline.json current.json
+
+`compare` exits with a non-zero status if any benchmark got slower than the
+threshold allows. Baselines are only comparable on the same hardware.
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from unittest.mock import MagicMock
+
+import numpy as np
+
+# same setup as tests/conftest.py, the ZED SDK is mocked out
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.modules["pyzed"] = MagicMock()
+sys.modules["pyzed.sl"] = MagicMock()
+
+Benchmark = Callable[[], Tuple[Callable[[], object], int]]
+"""
+Sets up a benchmark, and returns the function to time and how many times to call
+it per round.
+"""
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str) -> Callable[[Benchmark], Benchmark]:
+    def decorator(setup: Benchmark) -> Benchmark:
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def _camera_frames(count: int) -> List[dict]:
+    rng = np.random.default_rng(15)
+    return [
+        {
+            "rotation": tuple(rng.normal(size=4).tolist()),
+            "translation": tuple(rng.uniform(-10, 10, size=3).tolist()),
+            "velocity": tuple(rng.uniform(-2, 2, size=3).tolist()),
+            "tracker_confidence": 1.0,
+            "timestamp": 1_700_000_000_000_000_000 + i * 16_666_667,
+            "frame_id": i + 1,
+        }
+        for i in range(count)
+    ]
+
+
+def _cycle(items: list) -> Callable[[], object]:
+    return itertools.cycle(items).__next__
+
+
+@benchmark("transform_trackcamera_to_global_ned")
+def bench_transform() -> Tuple[Callable[[], object], int]:
+    from vio_library import CameraCoordinateTransformation
+
+    coord_trans = CameraCoordinateTransformation()
+    frames = _cycle(_camera_frames(100))
+    return lambda: coord_trans.transform_trackcamera_to_global_ned(frames()), 200
+
+
+@benchmark("transform_trackcamera_to_global_ned_fast")
+def bench_transform_fast() -> Tuple[Callable[[], object], int]:
+    from vio_library import CameraCoordinateTransformation
+
+    coord_trans = CameraCoordinateTransformation()
+    # fresh timestamps, so the pose history keeps recording
+    frames = iter(_camera_frames(200_000))
+    return (
+        lambda: coord_trans.transform_trackcamera_to_global_ned_fast(next(frames)),
+        2000,
+    )
+
+
+@benchmark("transform_trackcamera_to_global_ned_batch_1000")
+def bench_transform_batch() -> Tuple[Callable[[], object], int]:
+    from vio_library import CameraCoordinateTransformation
+
+    coord_trans = CameraCoordinateTransformation()
+    frames = _camera_frames(1000)
+    rotations = np.array([frame["rotation"] for frame in frames])
+    translations = np.array([frame["translation"] for frame in frames])
+    velocities = np.array([frame["velocity"] for frame in frames])
+    return (
+        lambda: coord_trans.transform_trackcamera_to_global_ned_batch(
+            rotations, translations, velocities
+        ),
+        10,
+    )
+
+
+@benchmark("sync")
+def bench_sync() -> Tuple[Callable[[], object], int]:
+    from bell.avr.mqtt.payloads import AVRVIOResync
+    from loguru import logger
+    from vio_library import CameraCoordinateTransformation
+
+    # logging would dominate
+    logger.remove()
+
+    coord_trans = CameraCoordinateTransformation()
+    for frame in _camera_frames(100):
+        coord_trans.transform_trackcamera_to_global_ned_fast(frame)  # type: ignore
+
+    payloads = _cycle(
+        [AVRVIOResync(n=i, e=-i, d=i / 2, hdg=i * 7 % 360) for i in range(100)]
+    )
+    return lambda: coord_trans.sync(payloads()), 100
+
+
+@benchmark("publish_updates")
+def bench_publish_updates() -> Tuple[Callable[[], object], int]:
+    from vio import VIOModule
+
+    vio = VIOModule()
+    vio.send_message = lambda topic, payload: None  # type: ignore
+    return (
+        lambda: vio.publish_updates(
+            (1.0, 2.0, 3.0), (4.0, 5.0, 6.0), (0.1, 0.2, 0.3), 1.0, time.time_ns()
+        ),
+        500,
+    )
+
+
+@benchmark("zed_get_pipe_data")
+def bench_zed_get_pipe_data() -> Tuple[Callable[[], object], int]:
+    from zed_library import ZEDCamera, sl
+
+    sl.ERROR_CODE.SUCCESS = True
+
+    camera = ZEDCamera()
+    camera.zed = MagicMock()
+    camera.zed.open.return_value = True
+    camera.zed.grab.return_value = True
+    camera.zed.enable_positional_tracking.return_value = True
+    camera.setup()
+
+    camera.zed_pose.get_translation.return_value.get.return_value = (1.0, 2.0, 3.0)
+    camera.zed_pose.pose_confidence = 1.0
+    sl.Orientation.return_value.get.return_value = (1.0, 0.0, 0.0, 0.0)
+    camera.zed.get_timestamp.return_value.get_nanoseconds.side_effect = itertools.count(
+        1_700_000_000_000_000_000, 16_666_667
+    ).__next__
+
+    return camera.get_pipe_data, 500
+
+
+def _hd720_image() -> np.ndarray:
+    rng = np.random.default_rng(15)
+    # smooth enough to compress like a real frame
+    row = rng.integers(0, 255, (1, 1280, 4), dtype=np.uint8)
+    return np.repeat(row, 720, axis=0)
+
+
+@benchmark("serialize_image_720p")
+def bench_serialize_image() -> Tuple[Callable[[], object], int]:
+    from bell.avr.utils.images import serialize_image
+
+    image = _hd720_image()
+    return lambda: serialize_image(image), 2
+
+
+@benchmark("serialize_image_720p_compressed")
+def bench_serialize_image_compressed() -> Tuple[Callable[[], object], int]:
+    from bell.avr.utils.images import serialize_image
+
+    image = _hd720_image()
+    return lambda: serialize_image(image, compress=True), 2
+
+
+@benchmark("encode_image_720p_compressed")
+def bench_encode_image_compressed() -> Tuple[Callable[[], object], int]:
+    import config
+    from image_library import encode_image
+
+    image = _hd720_image()
+    return (
+        lambda: encode_image(
+            image, compress=True, level=config.IMAGE_COMPRESSION_LEVEL
+        ),
+        10,
+    )
+
+
+def run(names: List[str], rounds: int) -> Dict[str, Dict[str, float]]:
+    """
+    Run benchmarks, and return the time per call of each, in microseconds.
+    """
+    results = {}
+    for name in names:
+        func, number = BENCHMARKS[name]()
+
+        # warm up
+        for _ in range(number):
+            func()
+
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            times.append((time.perf_counter() - start) / number * 1e6)
+
+        results[name] = {
+            "median_us": statistics.median(times),
+            "min_us": min(times),
+            "max_us": max(times),
+        }
+        print(f"{name:<50} {results[name]['median_us']:>12.1f} us")
+
+    return results
+
+
+def compare(
+    baseline: Dict[str, Dict[str, float]],
+    current: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> List[str]:
+    """
+    Print how each benchmark changed, and return the ones that got slower
+    by more than `threshold`, a fraction of the baseline.
+    """
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before = baseline[name]["median_us"]
+        after = current[name]["median_us"]
+        change = after / before - 1
+
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:<50} {before:>12.1f} {after:>12.1f} {change:>+8.1%}{flag}")
+
+    for name in sorted(set(baseline) ^ set(current)):
+        print(f"{name:<50} only in {'baseline' if name in baseline else 'current'}")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks")
+    run_parser.add_argument("--output", help="JSON file to save the results to")
+    run_parser.add_argument(
+        "--rounds", type=int, default=7, help="timed rounds of each benchmark"
+    )
+    run_parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        help=f"benchmarks to run, defaults to all of them: {', '.join(BENCHMARKS)}",
+    )
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare results against a baseline"
+    )
+    compare_parser.add_argument("baseline", help="JSON file of the baseline results")
+    compare_parser.add_argument("current", help="JSON file of the new results")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fraction slower than the baseline that counts as a regression",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        unknown = set(args.benchmarks) - set(BENCHMARKS)
+        if unknown:
+            parser.error(f"unknown benchmarks {', '.join(sorted(unknown))}")
+
+        results = run(args.benchmarks or list(BENCHMARKS), args.rounds)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(
+                    {
+                        "machine": platform.machine(),
+                        "python": platform.python_version(),
+                        "results": results,
+                    },
+                    f,
+                    indent=2,
+                )
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline["machine"] != current["machine"]:
+        print(f"Comparing {baseline['machine']} against {current['machine']}")
+
+    regressions = compare(baseline["results"], current["results"], args.threshold)
+    if regressions:
+        print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
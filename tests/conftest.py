@@ -20,6 +20,7 @@ def config(mocker: MockerFixture) -> None:
 
     # make these constant
     mocker.patch("config.CAM_UPDATE_FREQ", 10)
+    mocker.patch("config.CAM_FPS", 60)
     mocker.patch("config.CAM_POS", [15, 10, 10])
     mocker.patch("config.CAM_ATTITUDE", [0, -math.pi / 2, math.pi / 2])
     mocker.patch("config.CAM_GROUND_HEIGHT", 10)
@@ -39,7 +40,7 @@ def camera_coordinate_transformation(config: None) -> CameraCoordinateTransforma
 
 
 @pytest.fixture
-def zed_camera(mocker: MockerFixture) -> ZEDCamera:
+def zed_camera(config: None, mocker: MockerFixture) -> ZEDCamera:
     # mock the pyzed package
     sys.modules["pyzed"] = mocker.MagicMock()
     sys.modules["pyzed.sl"] = mocker.MagicMock()
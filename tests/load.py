@@ -0,0 +1,426 @@
+"""
+End-to-end load test of the whole module.
+
+Runs `VIOModule` against an in-process stand-in for the MQTT broker, with the
+synthetic camera or a replayed recording, across a sweep of pose rates and
+image stream settings:
+
+    python tests/load.py sweep --rates 10 30 60 120 --streams off left:raw:1
+
+Image streams are given as `side:raw|compressed:frequency`, or `off`.
+Every sweep point runs in its own process, as the pose loop rate is read from
+the config when the module is imported. For each point this reports the
+publish rate achieved on each topic, end-to-end latency percentiles, the CPU
+used by each thread, and dropped frames. Per thread CPU is read from /proc,
+so this only runs on Linux.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Union
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+POSE_TOPIC = "avr/vio/position/local"
+IMAGE_TOPIC = "avr/vio/image/capture"
+
+
+class LoopbackMessage:
+    """
+    Stand-in for `paho.mqtt.client.MQTTMessage`.
+    """
+
+    def __init__(self, topic: str, payload: bytes) -> None:
+        self.topic = topic
+        self.payload = payload
+
+
+class LoopbackBroker:
+    """
+    In-process stand-in for the paho client of a module and the broker behind
+    it. Counts every message published on each topic, and delivers messages on
+    topics the module subscribed to straight back to it.
+    """
+
+    def __init__(self) -> None:
+        self.on_connect: Any = None
+        self.on_message: Any = None
+
+        self.subscriptions = set()
+        self.messages: Dict[str, int] = {}
+        self.bytes: Dict[str, int] = {}
+
+        self._lock = threading.Lock()
+
+    def connect(self, host: str, port: int, keepalive: int) -> None:
+        pass
+
+    def loop_start(self) -> None:
+        self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self) -> None:
+        pass
+
+    def disconnect(self) -> None:
+        pass
+
+    def subscribe(self, topic: str) -> None:
+        self.subscriptions.add(topic)
+
+    def publish(self, topic: str, payload: Union[str, bytes]) -> None:
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        with self._lock:
+            self.messages[topic] = self.messages.get(topic, 0) + 1
+            self.bytes[topic] = self.bytes.get(topic, 0) + len(payload)
+
+        if topic in self.subscriptions:
+            self.on_message(self, None, LoopbackMessage(topic, payload))
+
+    def counters(self) -> Dict[str, Dict[str, int]]:
+        """
+        Messages and bytes published on each topic so far.
+        """
+        with self._lock:
+            return {
+                topic: {"messages": count, "bytes": self.bytes[topic]}
+                for topic, count in self.messages.items()
+            }
+
+
+def thread_cpu_times() -> Dict[str, float]:
+    """
+    CPU seconds used by each thread of this process so far, by thread name.
+    Threads not started from Python are added up as "other".
+    """
+    names = {thread.native_id: thread.name for thread in threading.enumerate()}
+
+    times: Dict[str, float] = {}
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as f:
+                stat = f.read()
+        except FileNotFoundError:
+            # exited in the meantime
+            continue
+
+        # the command name can contain spaces, so split after it.
+        # utime and stime are the 14th and 15th fields.
+        fields = stat[stat.rindex(")") + 2 :].split()
+        seconds = (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+
+        name = names.get(int(tid), "other")
+        times[name] = times.get(name, 0.0) + seconds
+
+    return times
+
+
+def parse_stream(value: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse an image stream setting like `left:compressed:5`. `off` is None.
+    """
+    if value == "off":
+        return None
+
+    try:
+        side, encoding, frequency = value.split(":")
+        if side not in ("left", "right") or encoding not in ("raw", "compressed"):
+            raise ValueError(value)
+
+        return {
+            "side": side,
+            "compressed": encoding == "compressed",
+            "frequency": int(frequency),
+        }
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"{value} is not off or side:raw|compressed:frequency"
+        )
+
+
+def run_point(
+    rate: int,
+    stream: str,
+    duration: float,
+    warmup: float,
+    camera: str,
+    fps: Optional[int] = None,
+    replay_file: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run the module polling the camera `rate` times per second for `duration`
+    seconds, and measure it. The camera runs at `fps`, by default the same
+    as `rate`, so every frame it misses counts as dropped.
+    Has to run in a fresh process, before the module is imported.
+    """
+    import config
+
+    config.CAMERA_BACKEND = camera
+    config.CAM_UPDATE_FREQ = rate
+    config.CAM_FPS = fps or rate
+    config.SYNTHETIC_FPS = fps or rate
+    config.REPLAY_LOOP = True
+    if replay_file:
+        config.REPLAY_FILE = replay_file
+
+    from bell.avr.mqtt.payloads import AVRVIOImageStreamEnable
+    from loguru import logger
+    from vio import VIOModule
+
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    module = VIOModule()
+    broker = LoopbackBroker()
+    broker.on_connect = module.on_connect
+    module._mqtt_client = broker  # type: ignore
+
+    threading.Thread(target=module.run, name="pose", daemon=True).start()
+
+    # the module connects while the camera is set up, so wait for it to
+    # subscribe before sending it anything
+    deadline = time.monotonic() + 10
+    while not broker.subscriptions and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+    settings = parse_stream(stream)
+    if settings is not None:
+        # sent through the broker, like any other module would
+        module.send_message(
+            "avr/vio/image/stream/enable", AVRVIOImageStreamEnable(**settings)
+        )
+
+    time.sleep(warmup)
+
+    for tracker in module.latency.values():
+        tracker.reset()
+    for tracker in (
+        module.publisher.queue_latency,
+        module.publisher.send_latency,
+        module.image_encoder.encode_latency,
+    ):
+        tracker.reset()
+
+    frame_stats = module.frame_stats
+    start_frames = (frame_stats.frames, frame_stats.dropped, frame_stats.lagged)
+    start_counters = broker.counters()
+    start_cpu = thread_cpu_times()
+    start = time.perf_counter()
+
+    time.sleep(duration)
+
+    elapsed = time.perf_counter() - start
+    end_cpu = thread_cpu_times()
+    end_counters = broker.counters()
+    end_frames = (frame_stats.frames, frame_stats.dropped, frame_stats.lagged)
+
+    topics = {}
+    for topic, counters in end_counters.items():
+        before = start_counters.get(topic, {"messages": 0, "bytes": 0})
+        topics[topic] = {
+            "rate_hz": (counters["messages"] - before["messages"]) / elapsed,
+            "bytes_per_s": (counters["bytes"] - before["bytes"]) / elapsed,
+        }
+
+    report = module.latency_report()
+
+    return {
+        "rate": rate,
+        "stream": stream,
+        "camera": camera,
+        "duration": elapsed,
+        "topics": topics,
+        "latency_ms": {
+            stage: report[stage]
+            for stage in (
+                "grab",
+                "transform",
+                "end_to_end",
+                "publish_queue",
+                "publish_send",
+                "image_encode",
+            )
+        },
+        "cpu_percent": {
+            name: (seconds - start_cpu.get(name, 0.0)) / elapsed * 100
+            for name, seconds in end_cpu.items()
+        },
+        "frames": {
+            "grabbed": end_frames[0] - start_frames[0],
+            "dropped": end_frames[1] - start_frames[1],
+            "lagged": end_frames[2] - start_frames[2],
+        },
+        "publisher": {
+            "coalesced": module.publisher.coalesced,
+            "failed": module.publisher.failed,
+            "max_depth": module.publisher.max_depth,
+        },
+        "images": {
+            "encoded": module.image_encoder.encoded,
+            "dropped": module.image_encoder.dropped,
+            "failed": module.image_encoder.failed,
+        },
+    }
+
+
+def sweep(
+    rates: List[int],
+    streams: List[str],
+    duration: float,
+    warmup: float,
+    camera: str,
+    fps: Optional[int] = None,
+    replay_file: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Run every combination of pose rate and image stream, each in its own process.
+    """
+    results = []
+
+    print(
+        f"{'rate':>5} {'stream':<20} {'pose Hz':>8} {'image Hz':>9} "
+        + f"{'e2e p50':>8} {'p95':>7} {'p99':>7} {'CPU %':>6} "
+        + f"{'busiest thread':<22} {'dropped':>7} {'lagged':>6}"
+    )
+
+    for rate in rates:
+        for stream in streams:
+            command = [
+                sys.executable,
+                __file__,
+                "point",
+                "--rate",
+                str(rate),
+                "--stream",
+                stream,
+                "--duration",
+                str(duration),
+                "--warmup",
+                str(warmup),
+                "--camera",
+                camera,
+            ]
+            if fps:
+                command += ["--fps", str(fps)]
+            if replay_file:
+                command += ["--replay-file", replay_file]
+
+            process = subprocess.run(
+                command,
+                capture_output=True,
+                text=True,
+                timeout=duration + warmup + 60,
+            )
+            if process.returncode != 0:
+                print(process.stderr, file=sys.stderr)
+                raise RuntimeError(f"Sweep point {rate} Hz {stream} failed")
+
+            result = json.loads(process.stdout.splitlines()[-1])
+            results.append(result)
+
+            end_to_end = result["latency_ms"]["end_to_end"]
+            cpu = result["cpu_percent"]
+            busiest = max(cpu, key=cpu.get)
+            print(
+                f"{rate:>5} {stream:<20} "
+                + f"{result['topics'].get(POSE_TOPIC, {}).get('rate_hz', 0):>8.1f} "
+                + f"{result['topics'].get(IMAGE_TOPIC, {}).get('rate_hz', 0):>9.1f} "
+                + f"{end_to_end['p50']:>8.2f} {end_to_end['p95']:>7.2f} "
+                + f"{end_to_end['p99']:>7.2f} {sum(cpu.values()):>6.1f} "
+                + f"{busiest + f' {cpu[busiest]:.0f}%':<22} "
+                + f"{result['frames']['dropped']:>7} {result['frames']['lagged']:>6}"
+            )
+
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument(
+            "--duration", type=float, default=10, help="seconds to measure"
+        )
+        subparser.add_argument(
+            "--warmup", type=float, default=2, help="seconds to run before measuring"
+        )
+        subparser.add_argument(
+            "--camera",
+            choices=("synthetic", "replay"),
+            default="synthetic",
+            help="camera backend to run against",
+        )
+        subparser.add_argument(
+            "--fps", type=int, help="camera frame rate, defaults to the pose rate"
+        )
+        subparser.add_argument("--replay-file", help="recording for the replay camera")
+
+    sweep_parser = subparsers.add_parser("sweep", help="run a sweep")
+    add_common(sweep_parser)
+    sweep_parser.add_argument(
+        "--rates", type=int, nargs="+", default=[10, 30, 60, 120], help="pose rates"
+    )
+    sweep_parser.add_argument(
+        "--streams",
+        nargs="+",
+        default=["off", "left:raw:1", "left:compressed:5"],
+        help="image stream settings",
+    )
+    sweep_parser.add_argument("--output", help="JSON file to save the results to")
+
+    point_parser = subparsers.add_parser("point", help="run a single sweep point")
+    add_common(point_parser)
+    point_parser.add_argument("--rate", type=int, required=True, help="pose rate")
+    point_parser.add_argument("--stream", default="off", help="image stream setting")
+
+    args = parser.parse_args(argv)
+
+    for stream in args.streams if args.command == "sweep" else [args.stream]:
+        try:
+            parse_stream(stream)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+
+    if args.command == "point":
+        result = run_point(
+            args.rate,
+            args.stream,
+            args.duration,
+            args.warmup,
+            args.camera,
+            fps=args.fps,
+            replay_file=args.replay_file,
+        )
+        print(json.dumps(result), flush=True)
+        # the module's threads never stop on their own
+        os._exit(0)
+
+    results = sweep(
+        args.rates,
+        args.streams,
+        args.duration,
+        args.warmup,
+        args.camera,
+        fps=args.fps,
+        replay_file=args.replay_file,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
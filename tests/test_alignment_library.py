@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import math
+import time
+
+import numpy as np
+import pytest
+
+from src.alignment_library import ResyncAligner
+
+
+def _rotate(yaw: float, points: np.ndarray) -> np.ndarray:
+    c = math.cos(yaw)
+    s = math.sin(yaw)
+    return points.dot(np.array(((c, -s, 0), (s, c, 0), (0, 0, 1))).T)
+
+
+def _fill(
+    aligner: ResyncAligner,
+    count: int,
+    yaw: float,
+    translation: np.ndarray,
+    position_noise: float = 0.0,
+    heading_noise: float = 0.0,
+    seed: int = 14,
+) -> None:
+    rng = np.random.default_rng(seed)
+    sensor = rng.uniform(-500, 500, (count, 3))
+    sensor_heading = rng.uniform(0, 2 * math.pi, count)
+
+    reference = _rotate(yaw, sensor) + translation
+    reference += rng.normal(0, position_noise, reference.shape)
+    reference_heading = sensor_heading + yaw + rng.normal(0, heading_noise, count)
+
+    for i in range(count):
+        aligner.add(sensor[i], sensor_heading[i], reference[i], reference_heading[i])
+
+
+def test_single_pair() -> None:
+    aligner = ResyncAligner()
+
+    # same as correcting from this resync alone
+    aligner.add(
+        np.array((100.0, 0.0, 5.0)), math.radians(350), np.zeros(3), math.radians(20)
+    )
+    yaw, translation = aligner.solve()
+
+    assert yaw == pytest.approx(math.radians(30))
+    assert np.allclose(translation, -_rotate(yaw, np.array((100.0, 0.0, 5.0))))
+
+
+def test_exact_fit() -> None:
+    aligner = ResyncAligner(window=50)
+    _fill(aligner, 50, 2.0, np.array((10.0, -20.0, 3.0)))
+
+    yaw, translation = aligner.solve()
+    assert yaw == pytest.approx(2.0)
+    assert np.allclose(translation, (10, -20, 3))
+
+
+def test_noise() -> None:
+    truth = np.array((10.0, -20.0, 3.0))
+
+    window = ResyncAligner(window=50)
+    _fill(window, 50, 0.5, truth, position_noise=20, heading_noise=0.05)
+    single = ResyncAligner(window=1)
+    _fill(single, 50, 0.5, truth, position_noise=20, heading_noise=0.05)
+
+    yaw, translation = window.solve()
+    single_yaw, single_translation = single.solve()
+
+    assert abs(yaw - 0.5) < abs(single_yaw - 0.5) / 3
+    assert np.linalg.norm(translation - truth) < np.linalg.norm(
+        single_translation - truth
+    )
+
+
+def test_outliers() -> None:
+    aligner = ResyncAligner(window=20, outlier_distance=50, outlier_heading=0.3)
+    _fill(aligner, 19, 0.5, np.array((10.0, -20.0, 3.0)), position_noise=5)
+
+    # a reference 10m off
+    aligner.add(np.zeros(3), 0.0, np.array((1000.0, 0.0, 0.0)), 0.5)
+
+    yaw, translation = aligner.solve()
+    assert aligner.rejected == 1
+    assert yaw == pytest.approx(0.5, abs=0.01)
+    assert np.allclose(translation, (10, -20, 3), atol=5)
+
+
+def test_heading_wrap() -> None:
+    aligner = ResyncAligner()
+
+    # offsets either side of 0 average to 0, not pi
+    aligner.add(np.zeros(3), math.radians(359), np.zeros(3), math.radians(1))
+    aligner.add(np.zeros(3), math.radians(1), np.zeros(3), math.radians(359))
+
+    yaw, _ = aligner.solve()
+    assert yaw == pytest.approx(0, abs=1e-9)
+
+
+def test_forgetting() -> None:
+    aligner = ResyncAligner(window=20, forgetting=0.5)
+    _fill(aligner, 20, 0.0, np.zeros(3))
+
+    # the camera drifted, newer resyncs quickly take over
+    _fill(aligner, 8, 0.0, np.array((50.0, 0.0, 0.0)), seed=15)
+
+    _, translation = aligner.solve()
+    assert translation[0] == pytest.approx(50, abs=1)
+
+
+def test_empty() -> None:
+    with pytest.raises(ValueError):
+        ResyncAligner().solve()
+
+
+def test_reset() -> None:
+    aligner = ResyncAligner(window=20)
+    _fill(aligner, 20, 0.0, np.zeros(3))
+
+    # after a reset only the new tracking frame's pairs are fit
+    aligner.reset()
+    with pytest.raises(ValueError):
+        aligner.solve()
+
+    _fill(aligner, 3, 0.5, np.array((50.0, 0.0, 0.0)), seed=15)
+    assert aligner.count == 3
+    yaw, translation = aligner.solve()
+    assert yaw == pytest.approx(0.5)
+    assert translation[0] == pytest.approx(50)
+
+
+def test_solve_time() -> None:
+    aligner = ResyncAligner(window=50, outlier_distance=50, outlier_heading=0.3)
+    _fill(aligner, 50, 0.5, np.zeros(3), position_noise=5)
+
+    start = time.perf_counter()
+    for _ in range(100):
+        aligner.solve()
+
+    # comfortably fast enough to solve on every resync at 50Hz
+    assert (time.perf_counter() - start) / 100 < 0.002
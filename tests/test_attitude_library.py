@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+import pytest
+
+START = 1_700_000_000_000_000_000
+# 400Hz, like the ZED's IMU
+IMU_PERIOD = 2_500_000
+
+
+def test_rotation_exp_log() -> None:
+    from src.attitude_library import rotation_exp, rotation_log
+
+    for v in (np.zeros(3), np.array((0.1, -0.2, 0.3)), np.array((0.0, 0.0, 2.5))):
+        R = rotation_exp(v)
+        assert np.allclose(R.dot(R.T), np.eye(3))
+        assert np.allclose(rotation_log(R), v)
+
+
+def test_attitude_propagator_integrates(config: None) -> None:
+    from src.attitude_library import AttitudePropagator
+    from src.vio_library import CameraCoordinateTransformation
+
+    R_aeroBody_TRACKCAMBody = CameraCoordinateTransformation().tm[
+        "H_aeroBody_TRACKCAMBody"
+    ][:3, :3]
+    propagator = AttitudePropagator(R_aeroBody_TRACKCAMBody)
+
+    # yawing at 0.5 rad/s, as the camera sees it
+    rate = tuple(R_aeroBody_TRACKCAMBody.T.dot((0.0, 0.0, 0.5)).tolist())
+
+    # nothing to propagate before the first camera frame
+    assert propagator.propagate(rate, START) is None
+    assert not propagator.active()
+
+    propagator.correct((0.0, 0.0, 0.0), START)
+    for i in range(1, 401):
+        rpy = propagator.propagate(rate, START + i * IMU_PERIOD)
+
+    assert rpy is not None
+    assert rpy[0] == pytest.approx(0, abs=1e-9)
+    assert rpy[1] == pytest.approx(0, abs=1e-9)
+    assert rpy[2] == pytest.approx(0.5)
+    assert propagator.propagated == 400
+    assert propagator.active()
+
+
+def test_attitude_propagator_rejects(config: None) -> None:
+    from src.attitude_library import AttitudePropagator
+
+    propagator = AttitudePropagator(np.eye(3), max_gap=0.1)
+    propagator.correct((0.0, 0.0, 0.0), START)
+
+    assert propagator.propagate((0.0, 0.0, 1.0), START) is None
+    assert propagator.propagate((math.nan, 0.0, 1.0), START + IMU_PERIOD) is None
+    # not integrated across a gap
+    assert propagator.propagate((0.0, 0.0, 1.0), START + 500_000_000) is None
+    assert propagator.rejected == 3
+
+    rpy = propagator.propagate((0.0, 0.0, 1.0), START + 500_000_000 + IMU_PERIOD)
+    assert rpy is not None
+    assert rpy[2] == pytest.approx(IMU_PERIOD / 1e9)
+
+
+def test_attitude_propagator_corrects_at_frame_time(config: None) -> None:
+    from src.attitude_library import AttitudePropagator
+
+    propagator = AttitudePropagator(np.eye(3), gain=0.5, bias_gain=0.0)
+    propagator.correct((0.0, 0.0, 0.0), START)
+    for i in range(1, 201):
+        propagator.propagate((0.0, 0.0, 1.0), START + i * IMU_PERIOD)
+
+    # a frame from halfway through, 0.1 rad off what was propagated back then,
+    # moves the current attitude by half of that
+    propagator.correct((0.0, 0.0, 0.35), START + 100 * IMU_PERIOD)
+    assert propagator.euler()[2] == pytest.approx(0.55)
+    assert propagator.correction == pytest.approx(0.1)
+
+    # later frames are compared against the corrected history
+    propagator.correct((0.0, 0.0, 0.425), START + 150 * IMU_PERIOD)
+    assert propagator.correction == pytest.approx(0.0, abs=1e-9)
+
+
+def test_attitude_propagator_resync_jump(config: None) -> None:
+    from src.attitude_library import AttitudePropagator
+
+    propagator = AttitudePropagator(np.eye(3))
+    frame_period = 1_000_000_000 // 60
+    yaws = []
+
+    # hovering, until a resync steps the heading by 90 degrees after 1s
+    for frame in range(120):
+        timestamp = START + frame * frame_period
+        yaw = math.pi / 2 if frame >= 60 else 0.0
+        propagator.correct((0.0, 0.0, yaw), timestamp)
+
+        t = timestamp + IMU_PERIOD
+        while t < timestamp + frame_period:
+            rpy = propagator.propagate((0.0, 0.0, 0.0), t)
+            if frame >= 60 and rpy is not None:
+                yaws.append(rpy[2])
+            t += IMU_PERIOD
+
+    # jumped straight to the new heading, without overshooting or a bias
+    assert propagator.jumps == 1
+    assert max(yaws) == pytest.approx(math.pi / 2)
+    assert min(yaws) == pytest.approx(math.pi / 2)
+    assert np.linalg.norm(propagator.bias) < 1e-9
+
+    # small steps jump too when asked to, like on a resync
+    propagator.correct(
+        (0.0, 0.0, math.pi / 2 + 0.05), START + 120 * frame_period, jump=True
+    )
+    assert propagator.euler()[2] == pytest.approx(math.pi / 2 + 0.05)
+    assert propagator.jumps == 2
+    assert np.linalg.norm(propagator.bias) < 1e-9
+
+
+@pytest.mark.parametrize("gain, bias_gain", [(0.0, 0.0), (0.1, 0.02)])
+def test_attitude_propagator_synthetic(
+    config: None, gain: float, bias_gain: float
+) -> None:
+    from src.attitude_library import AttitudePropagator
+    from src.synthetic_library import SyntheticCamera, trajectory_point
+    from src.vio_library import CameraCoordinateTransformation
+
+    camera = SyntheticCamera(
+        "figure8",
+        fps=30,
+        speed=0,
+        period=8.0,
+        imu_rate=400,
+        gyro_noise=0.01,
+        gyro_bias=0.02,
+        seed=21,
+    )
+    camera.setup()
+    coord_trans = CameraCoordinateTransformation()
+    propagator = AttitudePropagator(
+        coord_trans.tm["H_aeroBody_TRACKCAMBody"][:3, :3],
+        gain=gain,
+        bias_gain=bias_gain,
+    )
+
+    errors = []
+    for _ in range(8 * 30):
+        data = camera.get_pipe_data()
+        assert data is not None
+        _, _, rpy = coord_trans.transform_trackcamera_to_global_ned_fast(data)
+        if gain or not propagator.initialized:
+            propagator.correct(rpy, data["timestamp"])
+
+        # the gyro samples up to the next frame arrive before it
+        while (imu_data := camera.get_imu_data()) is not None:
+            estimate = propagator.propagate(
+                imu_data["angular_velocity"], imu_data["timestamp"]
+            )
+            if estimate is None:
+                # the first sample is as old as the first frame
+                continue
+
+            t = (imu_data["timestamp"] - camera._start_ns) / 1e9
+            _, _, heading = trajectory_point("figure8", t, 2.0, 8.0, 1.0)
+            errors.append(abs(math.remainder(estimate[2] - heading, math.tau)))
+
+    assert propagator.rejected == 1
+
+    # the last lap, once the bias estimate settled
+    error = max(errors[-400:])
+    if gain:
+        assert error < math.radians(1)
+        # a bias of 0.02 rad/s on every camera axis
+        assert np.linalg.norm(propagator.bias) == pytest.approx(
+            math.sqrt(3) * 0.02, rel=0.25
+        )
+    else:
+        # integrating the bias alone drifts by degrees
+        assert error > math.radians(5)
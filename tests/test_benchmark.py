@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+
+def test_compare() -> None:
+    from tests.benchmark import compare
+
+    baseline = {
+        "a": {"median_us": 100.0, "min_us": 90.0, "max_us": 110.0},
+        "b": {"median_us": 100.0, "min_us": 90.0, "max_us": 110.0},
+        "c": {"median_us": 100.0, "min_us": 90.0, "max_us": 110.0},
+    }
+    current = {
+        "a": {"median_us": 105.0, "min_us": 95.0, "max_us": 115.0},
+        "b": {"median_us": 125.0, "min_us": 115.0, "max_us": 135.0},
+        "d": {"median_us": 500.0, "min_us": 400.0, "max_us": 600.0},
+    }
+
+    assert compare(baseline, current, threshold=0.1) == ["b"]
+    assert compare(baseline, current, threshold=0.3) == []
+
+
+def test_main_round_trip(tmp_path: Path) -> None:
+    from tests.benchmark import main
+
+    baseline = tmp_path / "baseline.json"
+    assert (
+        main(
+            [
+                "run",
+                "--rounds",
+                "1",
+                "--output",
+                str(baseline),
+                "transform_trackcamera_to_global_ned",
+            ]
+        )
+        == 0
+    )
+
+    results = json.loads(baseline.read_text())
+    assert set(results["results"]) == {"transform_trackcamera_to_global_ned"}
+
+    # twice as slow
+    results["results"]["transform_trackcamera_to_global_ned"]["median_us"] *= 2
+    current = tmp_path / "current.json"
+    current.write_text(json.dumps(results))
+
+    assert main(["compare", str(baseline), str(baseline)]) == 0
+    assert main(["compare", str(baseline), str(current)]) == 1
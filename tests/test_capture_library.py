@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import threading
+
+import numpy as np
+
+from src.capture_library import LatestFrameSlot
+
+
+def test_latest_frame_slot() -> None:
+    slot = LatestFrameSlot(lambda: np.zeros(4))
+
+    # nothing published yet
+    assert slot.latest() is None
+
+    slot.back()[:] = 1
+    slot.publish(1, 100)
+
+    image, frame_id, timestamp = slot.latest()  # type: ignore
+    assert (image == 1).all()
+    assert (frame_id, timestamp) == (1, 100)
+
+    # frames that were never read are overwritten, not queued
+    for i in range(2, 5):
+        slot.back()[:] = i
+        slot.publish(i, i * 100)
+
+    image, frame_id, _ = slot.latest()  # type: ignore
+    assert (image == 4).all()
+    assert frame_id == 4
+    assert slot.published == 4
+    assert slot.overwritten == 2
+
+    # reading again without a new frame returns the same one
+    assert slot.latest()[1] == 4  # type: ignore
+
+    # waiting for a frame that never comes
+    assert slot.latest(min_frame_id=5, timeout=0.01) is None
+
+
+def test_latest_frame_slot_wait() -> None:
+    slot = LatestFrameSlot(lambda: np.zeros(4))
+
+    timer = threading.Timer(0.01, slot.publish, (1, 100))
+    timer.start()
+
+    assert slot.latest(min_frame_id=1, timeout=5) is not None
+    timer.join()
+
+
+def test_latest_frame_slot_concurrent() -> None:
+    slot = LatestFrameSlot(lambda: np.zeros(1024))
+    frames = 10_000
+    torn = []
+
+    def produce() -> None:
+        for i in range(1, frames + 1):
+            slot.back()[:] = i
+            slot.publish(i, i)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+
+    last_frame_id = 0
+    while last_frame_id < frames:
+        latest = slot.latest(min_frame_id=last_frame_id, timeout=1)
+        assert latest is not None
+
+        image, frame_id, timestamp = latest
+        # the buffer being read is never written to
+        if not (image == frame_id).all() or timestamp != frame_id:
+            torn.append(frame_id)
+
+        assert frame_id >= last_frame_id
+        last_frame_id = frame_id
+
+    producer.join()
+    assert not torn
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+import pytest
+import transforms3d as t3d
+
+from src.history_library import PoseHistory, slerp
+
+
+def _yaw(angle: float) -> np.ndarray:
+    return t3d.quaternions.axangle2quat((0, 0, 1), angle)
+
+
+def test_slerp() -> None:
+    q0 = _yaw(0)
+    q1 = _yaw(math.pi / 2)
+
+    assert np.allclose(slerp(q0, q1, 0), q0)
+    assert np.allclose(slerp(q0, q1, 1), q1)
+    assert np.allclose(slerp(q0, q1, 0.5), _yaw(math.pi / 4))
+
+    # the same rotation with the opposite sign takes the short way around
+    assert np.allclose(slerp(q0, -q1, 0.5), _yaw(math.pi / 4))
+
+    # nearly identical quaternions stay normalized
+    q = slerp(q0, _yaw(1e-6), 0.5)
+    assert np.linalg.norm(q) == pytest.approx(1)
+
+
+def test_pose_history_lookup() -> None:
+    history = PoseHistory(capacity=8)
+    assert history.lookup(0) is None
+    assert history.latest_timestamp() is None
+
+    # 100ms apart, moving 1m and turning 10 degrees each time.
+    # Enough to wrap around the ring.
+    for i in range(20):
+        history.record(
+            i * 100_000_000, tuple(_yaw(math.radians(i * 10))), (float(i), 0.0, 0.0)
+        )
+
+    assert history.count == 8
+    assert history.latest_timestamp() == 1_900_000_000
+
+    # exact and in between poses
+    for timestamp, expected in ((1_500_000_000, 15), (1_525_000_000, 15.25)):
+        rotation, translation = history.lookup(timestamp)  # type: ignore
+        assert np.allclose(translation, (expected, 0, 0))
+        assert np.allclose(rotation, _yaw(math.radians(expected * 10)))
+
+    # newer than the newest pose
+    rotation, translation = history.lookup(5_000_000_000)  # type: ignore
+    assert np.allclose(translation, (19, 0, 0))
+
+    # older than anything kept
+    assert history.lookup(1_100_000_000) is None
+
+
+def test_pose_history_ignores_old_timestamps() -> None:
+    history = PoseHistory(capacity=8)
+    history.record(100, (1.0, 0.0, 0.0, 0.0), (1.0, 0.0, 0.0))
+    history.record(100, (1.0, 0.0, 0.0, 0.0), (2.0, 0.0, 0.0))
+    history.record(50, (1.0, 0.0, 0.0, 0.0), (3.0, 0.0, 0.0))
+
+    assert history.count == 1
+    assert history.lookup(100)[1][0] == 1  # type: ignore
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import pytest
+from bell.avr.utils.images import ImageData, deserialize_image, serialize_image
+
+
+def _image() -> np.ndarray:
+    rng = np.random.default_rng(8)
+    return rng.integers(0, 255, (72, 128, 4), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_encode_image(config: None, compress: bool) -> None:
+    from src.image_library import encode_image
+
+    image = _image()
+    assert encode_image(image, compress=compress) == serialize_image(
+        image, compress=compress
+    )
+
+
+def test_encode_image_fallback(config: None) -> None:
+    from src.image_library import encode_image
+
+    image = np.array([[1.2, 2.7], [3.0, 250.4]])
+    assert encode_image(image) == serialize_image(image)
+
+
+def test_encode_image_scaled(config: None) -> None:
+    from src.image_library import encode_image, scale_image
+
+    image = _image()
+    scaled = scale_image(image, 4)
+    assert scaled.shape == (18, 32, 4)
+    assert (
+        deserialize_image(encode_image(scaled, compress=True, level=1)) == scaled
+    ).all()
+
+
+def test_image_encoder_pool_inline(config: None) -> None:
+    from src.image_library import ImageEncoderPool
+
+    sent: List[Tuple[str, ImageData]] = []
+    pool = ImageEncoderPool(lambda tag, data: sent.append((tag, data)))
+
+    pool.submit("left", _image(), scale=2)
+
+    assert len(sent) == 1
+    assert sent[0][0] == "left"
+    assert sent[0][1]["shape"] == [36, 64, 4]
+    assert pool.encoded == 1
+    assert pool.encode_latency.count == 1
+
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_image_encoder_pool(config: None, processes: bool) -> None:
+    from src.image_library import ImageEncoderPool
+
+    release = threading.Event()
+    done = threading.Event()
+    sent: List[str] = []
+
+    def callback(tag: str, image_data: ImageData) -> None:
+        # hold up the only worker on the first image
+        release.wait(5)
+        sent.append(tag)
+        if len(sent) == 3:
+            done.set()
+
+    pool = ImageEncoderPool(callback, workers=1, max_queue=2, processes=processes)
+    pool.start()
+
+    pool.submit("1", _image())
+    # wait for the worker to pick the first image up
+    while pool._queue or pool.encode_latency.count == 0:
+        threading.Event().wait(0.001)
+
+    # only the latest 2 of these fit in the queue
+    for tag in ("2", "3", "4", "5"):
+        pool.submit(tag, _image())
+
+    release.set()
+    assert done.wait(5)
+    pool.close()
+
+    assert sent == ["1", "4", "5"]
+    assert pool.submitted == 5
+    assert pool.encoded == 3
+    assert pool.dropped == 2
+
+
+def test_image_encoder_pool_failed(config: None) -> None:
+    from src.image_library import ImageEncoderPool
+
+    def callback(tag: str, image_data: ImageData) -> None:
+        raise RuntimeError("broker went away")
+
+    pool = ImageEncoderPool(callback)
+    pool.submit("left", _image())
+
+    assert pool.failed == 1
+    assert pool.encoded == 0
+
+
+def test_apply_image_options(config: None) -> None:
+    from src.image_library import apply_image_options, parse_image_options
+
+    image = np.zeros((720, 1280, 4), dtype=np.uint8)
+
+    # defaults leave the image alone
+    assert apply_image_options(image, parse_image_options({})) is image
+
+    options = parse_image_options(
+        {"roi": [320, 180, 640, 360], "scale": 4, "grayscale": True}
+    )
+    view = apply_image_options(image, options)
+    assert view.shape == (90, 160)
+    # zero-copy
+    assert np.shares_memory(view, image)
+
+    view = apply_image_options(image, parse_image_options({"channels": 3}))
+    assert view.shape == (720, 1280, 3)
+    assert np.shares_memory(view, image)
+
+    # a quarter resolution grayscale stream is well over 10x smaller
+    options = parse_image_options({"scale": 4, "grayscale": True})
+    assert image.nbytes / apply_image_options(image, options).nbytes == 64
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        {"scale": 0},
+        {"scale": 1.5},
+        {"roi": [0, 0, 10]},
+        {"roi": [-1, 0, 10, 10]},
+        {"roi": [0, 0, 0, 10]},
+        {"channels": 0},
+        {"resolution": "HD720"},
+    ],
+)
+def test_parse_image_options_invalid(config: None, payload: dict) -> None:
+    from src.image_library import parse_image_options
+
+    with pytest.raises(ValueError):
+        parse_image_options(payload)
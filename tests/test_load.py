@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+
+
+def test_loopback_broker() -> None:
+    from tests.load import LoopbackBroker
+
+    broker = LoopbackBroker()
+    connected = []
+    received = []
+    broker.on_connect = lambda client, userdata, flags, rc: connected.append(rc)
+    broker.on_message = lambda client, userdata, msg: received.append(
+        (msg.topic, msg.payload)
+    )
+
+    broker.loop_start()
+    assert connected == [0]
+
+    broker.subscribe("avr/vio/resync")
+    broker.publish("avr/vio/heading", '{"hdg": 1.0}')
+    broker.publish("avr/vio/heading", '{"hdg": 2.0}')
+    broker.publish("avr/vio/resync", b"{}")
+
+    # only subscribed topics are delivered back
+    assert received == [("avr/vio/resync", b"{}")]
+    assert broker.counters() == {
+        "avr/vio/heading": {"messages": 2, "bytes": 24},
+        "avr/vio/resync": {"messages": 1, "bytes": 2},
+    }
+
+
+def test_thread_cpu_times() -> None:
+    from tests.load import thread_cpu_times
+
+    stop = threading.Event()
+
+    def spin() -> None:
+        while not stop.is_set():
+            pass
+
+    thread = threading.Thread(target=spin, name="spinner")
+    thread.start()
+    time.sleep(0.3)
+    times = thread_cpu_times()
+    stop.set()
+    thread.join()
+
+    assert times["spinner"] > 0
+    assert "MainThread" in times
+
+
+def test_parse_stream() -> None:
+    from tests.load import parse_stream
+
+    assert parse_stream("off") is None
+    assert parse_stream("right:compressed:5") == {
+        "side": "right",
+        "compressed": True,
+        "frequency": 5,
+    }
+
+    for value in ("left", "up:raw:1", "left:jpeg:1", "left:raw:fast"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_stream(value)
+
+
+def test_load_point() -> None:
+    command: List[str] = [
+        sys.executable,
+        str(Path(__file__).parent / "load.py"),
+        "point",
+        "--rate",
+        "60",
+        "--stream",
+        "left:compressed:5",
+        "--duration",
+        "1",
+        "--warmup",
+        "0.5",
+    ]
+    process = subprocess.run(command, capture_output=True, text=True, timeout=60)
+    assert process.returncode == 0, process.stderr
+
+    result = json.loads(process.stdout.splitlines()[-1])
+    assert result["topics"]["avr/vio/position/local"]["rate_hz"] > 20
+    assert result["topics"]["avr/vio/image/capture"]["rate_hz"] > 0
+    assert result["latency_ms"]["end_to_end"]["p50"] > 0
+    assert result["cpu_percent"]["pose"] > 0
+    assert result["frames"]["grabbed"] > 20
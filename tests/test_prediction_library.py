@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import math
+
+import pytest
+
+START = 1_700_000_000_000_000_000
+# 30fps
+PERIOD = 33_333_333
+
+
+def test_pose_predictor_extrapolates(config: None) -> None:
+    from src.prediction_library import PosePredictor
+
+    predictor = PosePredictor(horizon=0.1)
+
+    # no turn rate until the second frame
+    pos, rpy = predictor.predict(
+        (0.0, 0.0, -100.0),
+        (100.0, 0.0, 0.0),
+        (0.0, 0.0, 0.0),
+        START,
+        START + 20_000_000,
+    )
+    assert pos == pytest.approx((2.0, 0.0, -100.0))
+    assert rpy == pytest.approx((0.0, 0.0, 0.0))
+
+    # turning at 1.5 rad/s
+    pos, rpy = predictor.predict(
+        (3.0, 0.0, -100.0),
+        (100.0, 0.0, 0.0),
+        (0.0, 0.0, 0.05),
+        START + PERIOD,
+        START + PERIOD + 20_000_000,
+    )
+    assert pos == pytest.approx((5.0, 0.0, -100.0))
+    assert rpy[2] == pytest.approx(0.05 + 1.5 * 0.02, rel=1e-3)
+
+    report = predictor.report()
+    assert report["predicted"] == 2
+    assert report["clamped"] == 0
+    assert report["lead_ms"] == pytest.approx(20)
+    assert report["position_correction_cm"] == pytest.approx(2)
+    assert report["angle_correction_deg"] == pytest.approx(math.degrees(0.03), rel=1e-3)
+
+
+def test_pose_predictor_clamps(config: None) -> None:
+    from src.prediction_library import PosePredictor
+
+    predictor = PosePredictor(horizon=0.05, max_position=3.0, max_angle=math.radians(1))
+    predictor.predict((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), START)
+
+    # a second late, with a fast turn
+    pos, rpy = predictor.predict(
+        (0.0, 0.0, 0.0),
+        (100.0, 0.0, 0.0),
+        (0.0, 0.0, 0.5),
+        START + PERIOD,
+        START + PERIOD + 1_000_000_000,
+    )
+    assert pos == pytest.approx((3.0, 0.0, 0.0))
+    assert rpy[2] == pytest.approx(0.5 + math.radians(1))
+    assert predictor.lead == pytest.approx(0.05)
+    assert predictor.clamped == 2
+
+
+def test_pose_predictor_passes_through(config: None) -> None:
+    from src.prediction_library import PosePredictor
+
+    predictor = PosePredictor()
+
+    # frames from the future aren't moved back
+    pos, rpy = predictor.predict(
+        (1.0, 2.0, 3.0), (100.0, 0.0, 0.0), (0.0, 0.0, 0.1), START, START - 1
+    )
+    assert pos == (1.0, 2.0, 3.0)
+    assert rpy == (0.0, 0.0, 0.1)
+
+    # and NaNs are left to be rejected
+    pos, rpy = predictor.predict(
+        (math.nan, 2.0, 3.0), (100.0, 0.0, 0.0), (0.0, 0.0, 0.1), START + PERIOD
+    )
+    assert math.isnan(pos[0])
+    assert predictor.predicted == 0
+
+
+def test_pose_predictor_reset(config: None) -> None:
+    from src.prediction_library import PosePredictor
+
+    predictor = PosePredictor(horizon=0.1)
+    predictor.predict((0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 0, 0)
+
+    # the rate is measured again from the frame after a reset
+    predictor.reset()
+    _, rpy = predictor.predict(
+        (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.5), 10_000_000, 50_000_000
+    )
+    assert rpy == pytest.approx((0.0, 0.0, 0.5))
+    assert predictor.angle_correction == 0
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+def _busy_work() -> int:
+    return sum(i * i for i in range(100_000))
+
+
+class Worker:
+    def __init__(self) -> None:
+        self.calls = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="worker")
+
+    def step(self) -> None:
+        _busy_work()
+        self.calls += 1
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # looked up on every call, like the module's loops
+            self.step()
+            time.sleep(0.001)
+
+    def __enter__(self) -> Worker:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def test_parse_profile_request(config: None) -> None:
+    from src.profile_library import parse_profile_request
+
+    assert parse_profile_request({}) == {
+        "mode": "sampling",
+        "duration": 10.0,
+        "interval": 0.005,
+        "top": 20,
+    }
+    assert parse_profile_request({"mode": "cprofile", "duration": 2, "top": 5}) == {
+        "mode": "cprofile",
+        "duration": 2.0,
+        "interval": 0.005,
+        "top": 5,
+    }
+
+    for payload in (
+        {"mode": "perf"},
+        {"duration": 0},
+        {"duration": 3600},
+        {"interval": -1},
+        {"top": 0},
+        {"threads": ["pose"]},
+    ):
+        with pytest.raises(ValueError):
+            parse_profile_request(payload)
+
+
+def test_sampling_profile(config: None, tmp_path: Path) -> None:
+    from src.profile_library import ProfileSession, parse_profile_request
+
+    request = parse_profile_request({"duration": 0.3, "interval": 0.001, "top": 50})
+    with Worker():
+        summary = ProfileSession(request, str(tmp_path), []).run()
+
+    assert summary["mode"] == "sampling"
+    assert summary["threads"]["worker"] > 10
+    functions = {entry["function"].split()[0] for entry in summary["functions"]}
+    assert "_busy_work" in functions or "<genexpr>" in functions
+
+    # collapsed stacks, one per line, for flame graphs
+    with open(summary["file"]) as f:
+        lines = f.read().splitlines()
+    assert any(
+        line.startswith("worker;") and "step (test_profile_library.py" in line
+        for line in lines
+    )
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_cprofile_profile(config: None, tmp_path: Path) -> None:
+    import pstats
+
+    from src.profile_library import ProfileSession, parse_profile_request
+
+    request = parse_profile_request({"mode": "cprofile", "duration": 0.3})
+    with Worker() as worker:
+        session = ProfileSession(request, str(tmp_path), [(worker, "step")])
+        summary = session.run()
+
+        # unhooked again once done
+        assert "step" not in vars(worker)
+        calls = worker.calls
+
+    assert session.done
+    assert summary["mode"] == "cprofile"
+    assert os.path.splitext(summary["file"])[1] == ".prof"
+
+    entries = {entry["function"].split()[0]: entry for entry in summary["functions"]}
+    assert 0 < entries["step"]["calls"] <= calls
+    assert entries["step"]["total_s"] >= entries["step"]["self_s"]
+
+    stats = pstats.Stats(summary["file"])
+    assert any(name == "_busy_work" for _, _, name in stats.stats)  # type: ignore
+
+
+def test_start_profile(config: None, tmp_path: Path) -> None:
+    from src.profile_library import parse_profile_request, start_profile
+
+    done = threading.Event()
+    summaries = []
+
+    def callback(summary: dict) -> None:
+        summaries.append(summary)
+        done.set()
+
+    session = start_profile(
+        parse_profile_request({"duration": 0.05}), [], callback, str(tmp_path)
+    )
+    assert done.wait(5)
+    assert session.done
+    assert summaries[0]["file"].startswith(str(tmp_path))
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+
+def test_topic_throttle_decimation(config: None) -> None:
+    from src.publish_library import TopicThrottle
+
+    throttle = TopicThrottle(decimation=3)
+    assert [throttle.ready((i,)) for i in range(7)] == [
+        True,
+        False,
+        False,
+        True,
+        False,
+        False,
+        True,
+    ]
+    assert throttle.suppressed == 4
+
+    never = TopicThrottle(decimation=0)
+    assert not any(never.ready((i,)) for i in range(3))
+
+
+def test_topic_throttle_deadband(config: None) -> None:
+    from src.publish_library import TopicThrottle
+
+    throttle = TopicThrottle(deadband=0.1, max_period=1.0)
+
+    assert throttle.ready((1.0, 2.0), now=0.0)
+    # within the deadband of the last published values
+    assert not throttle.ready((1.05, 2.0), now=0.1)
+    assert not throttle.ready((1.09, 1.95), now=0.2)
+    # one value moved far enough
+    assert throttle.ready((1.0, 2.15), now=0.3)
+    # nothing changed, but it has been too long
+    assert not throttle.ready((1.0, 2.15), now=1.2)
+    assert throttle.ready((1.0, 2.15), now=1.3)
+
+
+def test_topic_throttle_on_change(config: None) -> None:
+    from src.publish_library import TopicThrottle
+
+    throttle = TopicThrottle(deadband=0.0)
+
+    assert throttle.ready((1.0,), now=0.0)
+    assert not throttle.ready((1.0,), now=100.0)
+    assert throttle.ready((0.5,), now=100.0)
+
+
+def test_topic_throttle_threads(config: None) -> None:
+    import threading
+
+    from src.publish_library import TopicThrottle
+
+    # the pose loop and the IMU thread update the attitude throttle together
+    throttle = TopicThrottle(decimation=2)
+    published = []
+
+    def update() -> None:
+        published.append(sum(throttle.ready((0.0,)) for _ in range(10_000)))
+
+    threads = [threading.Thread(target=update) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(published) == 20_000
+    assert throttle.suppressed == 20_000
+
+
+def test_create_topic_throttles(config: None, mocker: MockerFixture) -> None:
+    mocker.patch("config.TOPIC_THROTTLE", {"a": {"decimation": 2}})
+
+    from src.publish_library import create_topic_throttles
+
+    throttles = create_topic_throttles(["a", "b"])
+    assert throttles["a"].decimation == 2
+    assert throttles["b"].decimation == 1
+    assert throttles["b"].deadband is None
+
+
+def test_create_topic_throttles_invalid(config: None, mocker: MockerFixture) -> None:
+    mocker.patch("config.TOPIC_THROTTLE", {"a": {"rate": 2}})
+
+    from src.publish_library import create_topic_throttles
+
+    with pytest.raises(TypeError):
+        create_topic_throttles(["a"])
+
+
+def test_coalescing_publisher_inline(config: None, mocker: MockerFixture) -> None:
+    from src.publish_library import CoalescingPublisher
+
+    send = mocker.Mock()
+    publisher = CoalescingPublisher(send)
+
+    # not started, so sent right away
+    publisher.publish("a", 1)
+    send.assert_called_once_with("a", 1)
+    assert publisher.sent == 1
+    assert publisher.send_latency.count == 1
+
+
+def test_coalescing_publisher(config: None) -> None:
+    import threading
+
+    from src.publish_library import CoalescingPublisher
+
+    release = threading.Event()
+    sending = threading.Event()
+    sent = []
+
+    def send(topic: str, payload: int) -> None:
+        sending.set()
+        # a broker that stalls on the first message
+        release.wait(5)
+        sent.append((topic, payload))
+
+    publisher = CoalescingPublisher(send)
+    publisher.start()
+
+    publisher.publish("pose", 0)
+    assert sending.wait(5)
+
+    # publishing never waits on the stalled broker
+    for i in range(1, 100):
+        publisher.publish("pose", i)
+        publisher.publish("confidence", i)
+
+    assert publisher.depth == 2
+    assert publisher.coalesced == 196
+
+    release.set()
+    publisher.close()
+
+    # only the newest message of each topic, in the order last published
+    assert sent == [("pose", 0), ("pose", 99), ("confidence", 99)]
+    assert publisher.sent == 3
+    assert publisher.max_depth == 2
+    assert publisher.queue_latency.count == 3
+
+
+def test_coalescing_publisher_failed(config: None) -> None:
+    from src.publish_library import CoalescingPublisher
+
+    def send(topic: str, payload: int) -> None:
+        raise ConnectionError("broker went away")
+
+    publisher = CoalescingPublisher(send)
+    publisher.start()
+    publisher.publish("pose", 1)
+    publisher.close()
+
+    assert publisher.failed == 1
+    assert publisher.sent == 0
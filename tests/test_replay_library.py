@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pytest
+
+from src.models import CameraFrameData
+
+
+def _camera_frames(count: int, period_ns: int = 10_000_000) -> List[CameraFrameData]:
+    return [
+        CameraFrameData(
+            rotation=(1.0, 0.0, 0.0, i / 10),
+            translation=(i, i * 2, i * 3),
+            velocity=(i / 2, 0.0, -i / 2),
+            tracker_confidence=float(i % 100),
+            timestamp=1_000_000_000 + i * period_ns,
+            frame_id=i + 1,
+        )
+        for i in range(count)
+    ]
+
+
+def _record(path: Path, frames: List[CameraFrameData]) -> None:
+    from src.replay_library import FrameRecorder
+
+    recorder = FrameRecorder(str(path))
+    for frame in frames:
+        recorder.record(frame)
+    recorder.close()
+
+    assert recorder.recorded == len(frames)
+    assert recorder.dropped == 0
+
+
+def test_frame_recorder(config: None, tmp_path: Path) -> None:
+    from src.replay_library import FRAME_RECORD_DTYPE, load_recording
+
+    path = tmp_path / "recording.bin"
+    frames = _camera_frames(300)
+
+    _record(path, frames[:200])
+    # appending to an existing recording keeps the single header
+    _record(path, frames[200:])
+
+    recording = load_recording(str(path))
+    assert recording.dtype == FRAME_RECORD_DTYPE
+    assert len(recording) == len(frames)
+
+    for record, frame in zip(recording, frames):
+        assert tuple(record["rotation"]) == frame["rotation"]
+        assert tuple(record["translation"]) == frame["translation"]
+        assert tuple(record["velocity"]) == frame["velocity"]
+        assert record["tracker_confidence"] == frame["tracker_confidence"]
+        assert record["timestamp"] == frame["timestamp"]
+
+    assert np.all(np.diff(recording["timestamp"][:200]) == 10_000_000)
+
+
+def test_load_recording_invalid(config: None, tmp_path: Path) -> None:
+    from src.replay_library import load_recording
+
+    path = tmp_path / "recording.bin"
+    path.write_bytes(b"not a recording at all")
+
+    with pytest.raises(ValueError):
+        load_recording(str(path))
+
+
+def test_load_recording_partial_record(config: None, tmp_path: Path) -> None:
+    from src.replay_library import load_recording
+
+    path = tmp_path / "recording.bin"
+    _record(path, _camera_frames(5))
+
+    # simulate the process being killed halfway through a write
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 7)
+
+    assert len(load_recording(str(path))) == 5
+
+
+def test_replay_camera(config: None, tmp_path: Path) -> None:
+    from src.replay_library import ReplayCamera
+
+    path = tmp_path / "recording.bin"
+    frames = _camera_frames(10)
+    _record(path, frames)
+
+    camera = ReplayCamera(str(path), speed=0)
+    camera.setup()
+
+    # everything but the timestamp is played back as recorded, and as fast
+    # as possible every frame is timestamped when it is played back
+    played = []
+    for frame in frames:
+        before = time.time_ns()
+        data = camera.get_pipe_data()
+        assert data is not None
+        assert before <= data["timestamp"] <= time.time_ns()
+        assert {**data, "timestamp": frame["timestamp"]} == frame
+        played.append(data)
+
+    # end of the recording
+    assert camera.get_pipe_data() is None
+
+    assert camera.get_rgb_image("left").shape == (720, 1280, 4)
+
+    image_frame = camera.get_image_frame("left")
+    assert image_frame["frame_id"] == frames[-1]["frame_id"]
+    assert image_frame["timestamp"] == played[-1]["timestamp"]
+
+
+def test_replay_camera_loop(config: None, tmp_path: Path) -> None:
+    from src.replay_library import ReplayCamera
+
+    path = tmp_path / "recording.bin"
+    frames = _camera_frames(3)
+    _record(path, frames)
+
+    camera = ReplayCamera(str(path), speed=0, loop=True)
+    camera.setup()
+
+    # frame IDs and timestamps keep counting up when the recording starts over
+    played = [camera.get_pipe_data() for _ in range(6)]
+    assert [{**data, "timestamp": 0} for data in played] == [  # type: ignore
+        {**frame, "frame_id": i + 1, "timestamp": 0}
+        for i, frame in enumerate(frames + frames)
+    ]
+    assert all(
+        a["timestamp"] <= b["timestamp"]  # type: ignore
+        for a, b in zip(played, played[1:])
+    )
+
+
+@pytest.mark.parametrize("speed", [1, 4])
+def test_replay_camera_speed(config: None, tmp_path: Path, speed: float) -> None:
+    from src.replay_library import ReplayCamera
+
+    path = tmp_path / "recording.bin"
+    # 200ms of recording
+    _record(path, _camera_frames(21))
+
+    # playback starts in setup
+    start_ns = time.time_ns()
+    start = time.monotonic()
+    camera = ReplayCamera(str(path), speed=speed)
+    camera.setup()
+
+    timestamps = []
+    while (data := camera.get_pipe_data()) is not None:
+        timestamps.append(data["timestamp"])
+
+    assert time.monotonic() - start >= 0.2 / speed
+
+    # moved to the current clock, 10ms of recording apart scaled by the speed
+    assert timestamps[0] >= start_ns
+    assert np.all(np.diff(timestamps) == 10_000_000 // speed)
@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import os
+import threading
+
+import pytest
+
+
+def _run_window(scheduler, now: float, duration: float) -> float:  # type: ignore
+    """
+    Run pose iterations that each take `duration` seconds to process until
+    the scheduler makes its next decision, and return the time then.
+    """
+    window_start = scheduler._window_start
+    while scheduler._window_start == window_start:
+        now += scheduler.next_pose_delay(now)
+        scheduler.pose_started()
+        scheduler.pose_done(duration, now + duration)
+        now += duration
+    return now
+
+
+def test_pose_deadlines(config: None) -> None:
+    from src.scheduler_library import AdaptiveScheduler
+
+    scheduler = AdaptiveScheduler(base_rate=10, max_rate=10)
+
+    assert scheduler.next_pose_delay(100.0) == 0
+    # due a period after the last, however long the iteration took
+    assert scheduler.next_pose_delay(100.03) == pytest.approx(0.07)
+    assert scheduler.next_pose_delay(100.21) == 0
+    assert scheduler.misses == 0
+
+    # a whole period behind starts over from now, and counts as a miss
+    assert scheduler.next_pose_delay(101.0) == 0
+    assert scheduler.misses == 1
+    assert scheduler.next_pose_delay(101.0) == pytest.approx(0.1)
+
+    # so does processing for longer than the budget of the period
+    scheduler.pose_done(0.04, 101.0)
+    assert scheduler.misses == 1
+    scheduler.pose_done(0.06, 101.1)
+    assert scheduler.misses == 2
+    assert scheduler.iterations == 2
+
+
+def test_adapt(config: None) -> None:
+    from src.scheduler_library import IMAGE_LEVELS, AdaptiveScheduler
+
+    scheduler = AdaptiveScheduler(base_rate=10, max_rate=30, window=1.0)
+    scheduler._window_start = 0.0
+    scheduler.images_streaming = True
+
+    # plenty of headroom raises the pose rate up to the camera rate
+    now = 0.0
+    for _ in range(10):
+        now = _run_window(scheduler, now, 0.001)
+    assert scheduler.pose_rate == 30
+    assert scheduler.image_level == 0
+    assert scheduler.last_decision == "raised pose rate to 30.0 Hz"
+
+    # missed deadlines back off the image stream first
+    for level in range(1, len(IMAGE_LEVELS)):
+        now = _run_window(scheduler, now, 0.02)
+        assert scheduler.image_level == level
+        assert scheduler.pose_rate == 30
+
+    assert scheduler.image_settings(5, 1) == (1.25, 4)
+
+    # then lower the pose rate, not below where it started
+    for _ in range(10):
+        now = _run_window(scheduler, now, 0.06)
+    assert scheduler.image_level == len(IMAGE_LEVELS) - 1
+    assert scheduler.pose_rate == 10
+
+    # with headroom again, the image stream is restored before the pose rate
+    now = _run_window(scheduler, now, 0.001)
+    assert scheduler.image_level == len(IMAGE_LEVELS) - 2
+    assert scheduler.pose_rate == 10
+
+    report = scheduler.report()
+    assert report["image_level"] == len(IMAGE_LEVELS) - 2
+    assert report["image_frequency_divisor"] == IMAGE_LEVELS[-2][0]
+    assert report["image_scale_factor"] == IMAGE_LEVELS[-2][1]
+    assert report["utilization"] == pytest.approx(0.01)
+
+
+def test_adapt_without_images(config: None) -> None:
+    from src.scheduler_library import AdaptiveScheduler
+
+    scheduler = AdaptiveScheduler(base_rate=10, max_rate=30, window=1.0)
+    scheduler._window_start = 0.0
+    scheduler.pose_rate = 20
+
+    # nothing to back off, so the pose rate drops right away
+    _run_window(scheduler, 0.0, 0.04)
+    assert scheduler.image_level == 0
+    assert scheduler.pose_rate == 16
+
+
+def test_image_allowed(config: None) -> None:
+    from src.scheduler_library import AdaptiveScheduler
+
+    scheduler = AdaptiveScheduler(base_rate=10, max_rate=10)
+    assert scheduler.image_allowed()
+
+    scheduler.pose_started()
+    assert not scheduler.image_allowed()
+
+    scheduler.pose_done(None)
+    assert scheduler.image_allowed()
+
+
+def test_lower_thread_priority(config: None) -> None:
+    from src.scheduler_library import lower_thread_priority
+
+    niceness = []
+
+    def run() -> None:
+        tid = threading.get_native_id()
+        before = os.getpriority(os.PRIO_PROCESS, tid)
+        lower_thread_priority(1)
+        niceness.append(os.getpriority(os.PRIO_PROCESS, tid) - before)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+    assert niceness == [1]
+    # only that thread
+    assert os.getpriority(os.PRIO_PROCESS, threading.get_native_id()) == os.nice(0)
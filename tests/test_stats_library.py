@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import itertools
+import tracemalloc
+
+import numpy as np
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+from src.stats_library import FrameLoopStats, LatencyTracker, process_uptime
+
+
+def test_frame_loop_stats() -> None:
+    stats = FrameLoopStats(frame_period=0.01)
+
+    # frames every 10ms, except one 40ms gap where 3 frames were missed
+    for timestamp in (0, 10, 20, 60, 70):
+        stats.grabbed(1_000_000_000 + timestamp * 1_000_000)
+
+    assert stats.frames == 5
+    assert stats.dropped == 3
+
+    stats.processed(0.005)
+    stats.processed(0.015)
+
+    assert stats.published == 2
+    assert stats.lagged == 1
+
+    stats.failed_grab()
+    stats.rejected_frame()
+    stats.looped(0.05, period=0.1)
+    stats.looped(0.15, period=0.1)
+
+    assert stats.failed == 1
+    assert stats.rejected == 1
+    assert stats.overruns == 1
+
+
+def test_latency_tracker_empty() -> None:
+    assert LatencyTracker().percentiles() == {
+        "p50": 0.0,
+        "p95": 0.0,
+        "p99": 0.0,
+        "max": 0.0,
+    }
+
+
+def test_latency_tracker() -> None:
+    tracker = LatencyTracker(capacity=100)
+
+    # the first 50 samples are pushed out of the window by the next 100
+    for _ in range(50):
+        tracker.record(1.0)
+    for i in range(1, 101):
+        tracker.record(i / 1000)
+
+    assert tracker.count == 150
+    percentiles = tracker.percentiles()
+    assert percentiles["p50"] == pytest.approx(50.5)
+    assert percentiles["p95"] == pytest.approx(95.05)
+    assert percentiles["p99"] == pytest.approx(99.01)
+    assert percentiles["max"] == pytest.approx(100)
+
+    tracker.reset()
+    assert tracker.count == 0
+    assert tracker.percentiles()["max"] == 0.0
+
+    tracker.record(0.002)
+    assert tracker.percentiles()["max"] == pytest.approx(2)
+
+
+def test_latency_tracker_record_allocations() -> None:
+    tracker = LatencyTracker(capacity=1024)
+    samples = np.linspace(0, 1, 1000).tolist()
+
+    for sample in samples:
+        tracker.record(sample)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        for sample in itertools.chain(samples, samples):
+            tracker.record(sample)
+
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # only the sample counter's int objects churn, nothing near the 8KB buffer
+    assert current - start <= 64
+    assert peak - start < 1024
+
+
+def test_process_uptime(mocker: MockerFixture) -> None:
+    uptime = process_uptime()
+    assert 0 <= uptime < 3600
+    assert process_uptime() >= uptime
+
+    # counts from the import where /proc can't be read
+    mocker.patch("builtins.open", side_effect=OSError)
+    assert 0 <= process_uptime() < 3600
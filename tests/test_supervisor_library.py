@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import pytest
+
+
+def test_reconnect_after_failure_limit(config: None) -> None:
+    from src.supervisor_library import CameraSupervisor
+
+    supervisor = CameraSupervisor(failure_limit=3)
+
+    # a few failures in a row are tolerated
+    assert not supervisor.grab_failed(100.0)
+    assert supervisor.state == "failing"
+    supervisor.grab_succeeded(100.1)
+    assert supervisor.state == "running"
+    assert supervisor.consecutive_failures == 0
+
+    assert not supervisor.grab_failed(101.0)
+    assert not supervisor.grab_failed(101.1)
+    assert supervisor.grab_failed(101.2)
+    assert supervisor.state == "reconnecting"
+    # the first attempt is made right away
+    assert supervisor.retry_delay(101.2) == 0
+
+    supervisor.reopened()
+    assert supervisor.state == "recovering"
+    assert supervisor.reconnects == 1
+
+    # recovery counts from the first failed grab
+    supervisor.grab_succeeded(101.5)
+    assert supervisor.state == "running"
+    assert supervisor.recoveries == 1
+    assert supervisor.recovery_time == pytest.approx(0.5)
+    assert supervisor.report()["recovery_ms"] == pytest.approx(500)
+
+
+def test_reconnect_backoff(config: None) -> None:
+    from src.supervisor_library import CameraSupervisor
+
+    supervisor = CameraSupervisor(failure_limit=1, backoff=0.1, max_backoff=0.5)
+    assert supervisor.grab_failed(100.0)
+
+    # doubles with every failed attempt, up to the maximum
+    delays = [supervisor.reopen_failed(100.0) for _ in range(5)]
+    assert delays == pytest.approx([0.1, 0.2, 0.4, 0.5, 0.5])
+    assert supervisor.retry_delay(100.2) == pytest.approx(0.3)
+    assert supervisor.reconnect_failures == 5
+
+    # a reopened camera that still can't grab counts as a failed attempt,
+    # and only grabs succeeding again start the backoff over
+    supervisor = CameraSupervisor(failure_limit=1, backoff=0.1, max_backoff=0.5)
+    assert supervisor.grab_failed(200.0)
+    assert supervisor.retry_delay(200.0) == 0
+
+    delays = []
+    for _ in range(4):
+        supervisor.reopened()
+        assert supervisor.grab_failed(200.0)
+        assert supervisor.state == "reconnecting"
+        delays.append(supervisor.retry_delay(200.0))
+    assert delays == pytest.approx([0.1, 0.2, 0.4, 0.5])
+
+    supervisor.reopened()
+    supervisor.grab_succeeded(201.0)
+    assert supervisor.grab_failed(202.0)
+    assert supervisor.retry_delay(202.0) == 0
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import math
+import time
+
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("trajectory", ["hover", "circle", "figure8"])
+def test_synthetic_camera_trajectory(config: None, trajectory: str) -> None:
+    from src.synthetic_library import SyntheticCamera, trajectory_point
+    from src.vio_library import CameraCoordinateTransformation
+
+    camera = SyntheticCamera(trajectory, fps=50, speed=0, period=2.0, altitude=1.5)
+    camera.setup()
+    coord_trans = CameraCoordinateTransformation()
+
+    for i in range(120):
+        data = camera.get_pipe_data()
+        assert data is not None
+        assert data["frame_id"] == i + 1
+        assert data["tracker_confidence"] == 100.0
+
+        # with no resync, the module publishes the trajectory itself
+        ned_pos, ned_vel, rpy = coord_trans.transform_trackcamera_to_global_ned(data)
+        position, velocity, heading = trajectory_point(
+            trajectory, i / 50, radius=2.0, period=2.0, altitude=1.5
+        )
+        assert np.allclose(ned_pos, np.array(position) * 100)
+        assert np.allclose(ned_vel[:3], np.array(velocity) * 100)
+        assert rpy[0] == pytest.approx(0, abs=1e-9)
+        assert rpy[1] == pytest.approx(0, abs=1e-9)
+        assert math.remainder(rpy[2] - heading, math.tau) == pytest.approx(0, abs=1e-9)
+
+    # frames are spaced by the frame rate
+    assert camera.timestamp - camera._start_ns == round(119 / 50 * 1e9)
+
+
+def test_synthetic_camera_unknown_trajectory(config: None) -> None:
+    from src.synthetic_library import SyntheticCamera
+
+    with pytest.raises(ValueError):
+        SyntheticCamera("loop")
+
+
+def test_synthetic_camera_noise_and_dropout(config: None) -> None:
+    from src.synthetic_library import SyntheticCamera
+
+    camera = SyntheticCamera(
+        "hover",
+        fps=500,
+        speed=0,
+        position_noise=0.01,
+        dropout=0.2,
+        confidence_drop=0.1,
+        seed=16,
+    )
+    camera.setup()
+
+    frames = [camera.get_pipe_data() for _ in range(2000)]
+    delivered = [frame for frame in frames if frame is not None]
+
+    assert camera.index == 2000
+    assert camera.dropped == 2000 - len(delivered)
+    assert 300 < camera.dropped < 500
+    assert [frame["frame_id"] for frame in delivered] == list(
+        range(1, len(delivered) + 1)
+    )
+
+    low = [frame for frame in delivered if frame["tracker_confidence"] < 100]
+    assert 100 < len(low) < 220
+    assert all(frame["tracker_confidence"] < 50 for frame in low)
+
+    translations = np.array([frame["translation"] for frame in delivered])
+    assert np.std(translations, axis=0).max() == pytest.approx(0.01, rel=0.2)
+
+
+def test_synthetic_camera_images(config: None) -> None:
+    from src.synthetic_library import SyntheticCamera
+
+    camera = SyntheticCamera("circle", speed=0, period=4.0)
+    camera.setup()
+    camera.get_pipe_data()
+
+    left = camera.get_image_frame("left")
+    right = camera.get_image_frame("right")
+    assert left is not None and right is not None
+    assert left["image"].shape == (720, 1280, 4)
+    assert left["image"].dtype == np.uint8
+    assert left["frame_id"] == right["frame_id"] == 1
+    assert left["timestamp"] == camera.timestamp
+    assert not np.array_equal(left["image"], right["image"])
+
+    # the view slides as the vehicle moves east
+    for _ in range(30):
+        camera.get_pipe_data()
+    later = camera.get_rgb_image("left")
+    assert later is not None
+    assert not np.array_equal(left["image"], later)
+
+
+def test_synthetic_camera_skips_ahead(config: None) -> None:
+    from src.synthetic_library import SyntheticCamera
+
+    camera = SyntheticCamera("hover", fps=100)
+    camera.setup()
+
+    first = camera.get_pipe_data()
+    time.sleep(0.1)
+    # a slow reader gets the newest frame, like the ZED
+    latest = camera.get_pipe_data()
+    assert first is not None and latest is not None
+    assert latest["frame_id"] == first["frame_id"] + 1
+    assert latest["timestamp"] - first["timestamp"] >= 90_000_000
+
+
+def test_synthetic_camera_imu(config: None) -> None:
+    from src.synthetic_library import SyntheticCamera
+    from src.vio_library import CameraCoordinateTransformation
+
+    camera = SyntheticCamera("circle", fps=50, speed=0, period=2.0, imu_rate=400)
+    camera.setup()
+    R_aeroBody_TRACKCAMBody = CameraCoordinateTransformation().tm[
+        "H_aeroBody_TRACKCAMBody"
+    ][:3, :3]
+
+    camera.get_pipe_data()
+    samples = []
+    while (imu_data := camera.get_imu_data()) is not None:
+        samples.append(imu_data)
+
+    # every sample up to the next frame, in order
+    assert [sample["timestamp"] - camera._start_ns for sample in samples] == [
+        i * 2_500_000 for i in range(9)
+    ]
+
+    # turning at one lap per period, about the body's down axis
+    for sample in samples:
+        rate = R_aeroBody_TRACKCAMBody.dot(sample["angular_velocity"])
+        assert np.allclose(rate, (0, 0, math.pi))
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import math
+from typing import TYPE_CHECKING, List, Tuple
+
+import numpy as np
+import pytest
+from pytest_mock.plugin import MockerFixture
+
+if TYPE_CHECKING:
+    from src.velocity_library import VelocityEstimator
+
+ESTIMATORS = ["finite_difference", "least_squares", "kalman"]
+
+# 60fps with the ZED's nanosecond timestamps, starting well after the epoch
+START = 1_700_000_000_000_000_000
+PERIOD = 16_666_667
+
+
+def _create(mocker: MockerFixture, name: str) -> VelocityEstimator:
+    mocker.patch("config.VELOCITY_ESTIMATOR", name)
+    mocker.patch("config.VELOCITY_WINDOW", 5)
+    mocker.patch("config.VELOCITY_KALMAN_PROCESS_NOISE", 1.0)
+    mocker.patch("config.VELOCITY_KALMAN_MEASUREMENT_NOISE", 1e-4)
+
+    from src.velocity_library import create_velocity_estimator
+
+    return create_velocity_estimator()
+
+
+def _line(
+    count: int, velocity: Tuple[float, float, float], noise: float = 0.0
+) -> List[Tuple[int, Tuple[float, float, float]]]:
+    rng = np.random.default_rng(6)
+    samples = []
+    for i in range(count):
+        t = i * PERIOD / 1e9
+        x, y, z = (np.array(velocity) * t + rng.normal(0, noise, 3)).tolist()
+        samples.append((START + i * PERIOD, (x, y, z)))
+
+    return samples
+
+
+@pytest.mark.parametrize("name", ESTIMATORS)
+def test_first_sample(config: None, mocker: MockerFixture, name: str) -> None:
+    estimator = _create(mocker, name)
+    assert estimator.update(START, (1.0, 2.0, 3.0)) == (0.0, 0.0, 0.0)
+
+
+@pytest.mark.parametrize("name", ESTIMATORS)
+def test_constant_velocity(config: None, mocker: MockerFixture, name: str) -> None:
+    estimator = _create(mocker, name)
+
+    for timestamp, position in _line(600, (1.0, -2.0, 0.5)):
+        velocity = estimator.update(timestamp, position)
+
+    # 10 seconds of nanosecond timestamps should not degrade the estimate
+    assert velocity == pytest.approx((1.0, -2.0, 0.5), abs=1e-6)
+
+
+@pytest.mark.parametrize("name", ESTIMATORS)
+def test_rejects_bad_samples(config: None, mocker: MockerFixture, name: str) -> None:
+    estimator = _create(mocker, name)
+
+    for timestamp, position in _line(10, (1.0, 1.0, 1.0)):
+        velocity = estimator.update(timestamp, position)
+
+    # repeated timestamp, timestamp going backwards, and a NaN position
+    assert estimator.update(timestamp, (5.0, 5.0, 5.0)) == velocity
+    assert estimator.update(timestamp - PERIOD, (5.0, 5.0, 5.0)) == velocity
+    assert estimator.update(timestamp + PERIOD, (math.nan, 0.0, 0.0)) == velocity
+    assert estimator.rejected == 3
+
+    # keeps going from the last good sample
+    velocity = estimator.update(timestamp + PERIOD, (10 * PERIOD / 1e9,) * 3)
+    assert all(math.isfinite(v) for v in velocity)
+    assert velocity == pytest.approx((1.0, 1.0, 1.0), rel=1e-3)
+
+
+def test_least_squares_less_noisy(config: None, mocker: MockerFixture) -> None:
+    finite_difference = _create(mocker, "finite_difference")
+    least_squares = _create(mocker, "least_squares")
+
+    finite_difference_error = []
+    least_squares_error = []
+    for timestamp, position in _line(600, (1.0, 0.0, 0.0), noise=0.001):
+        finite_difference_error.append(
+            finite_difference.update(timestamp, position)[0] - 1.0
+        )
+        least_squares_error.append(least_squares.update(timestamp, position)[0] - 1.0)
+
+    # skip warm up
+    assert np.std(least_squares_error[10:]) < np.std(finite_difference_error[10:]) / 2
+
+
+def test_least_squares_uneven_spacing(config: None, mocker: MockerFixture) -> None:
+    estimator = _create(mocker, "least_squares")
+
+    # dropped frames leave gaps, which a plain Savitzky-Golay kernel gets wrong
+    for i in (0, 1, 2, 5, 6, 9, 10, 11, 15):
+        velocity = estimator.update(START + i * PERIOD, (2.0 * i * PERIOD / 1e9,) * 3)
+
+    assert velocity == pytest.approx((2.0, 2.0, 2.0), rel=1e-6)
+
+
+def test_least_squares_window(config: None) -> None:
+    from src.velocity_library import LeastSquaresVelocityEstimator
+
+    with pytest.raises(ValueError):
+        LeastSquaresVelocityEstimator(window=1)
+
+
+def test_unknown_estimator(config: None, mocker: MockerFixture) -> None:
+    with pytest.raises(ValueError):
+        _create(mocker, "magic")
+
+
+def test_estimator_without_estimate(config: None) -> None:
+    from src.velocity_library import VelocityEstimator
+
+    class Incomplete(VelocityEstimator):
+        pass
+
+    # fails when created, not on the first frame
+    with pytest.raises(TypeError):
+        Incomplete(capacity=2)  # type: ignore
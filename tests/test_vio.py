@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import math
+import time
+from pathlib import Path
 from typing import TYPE_CHECKING, Tuple
 
 import pytest
@@ -7,6 +10,7 @@ from bell.avr.mqtt.payloads import (
     AVRVIOAttitudeEulerRadians,
     AVRVIOConfidence,
     AVRVIOHeading,
+    AVRVIOImageRequest,
     AVRVIOPositionLocal,
     AVRVIOResync,
     AVRVIOVelocity,
@@ -37,6 +41,42 @@ def test_handle_resync_continuous_on(
     assert vio_module.coord_trans.sync.call_count == 2
 
 
+def test_tracking_reset(vio_module: VIOModule) -> None:
+    import numpy as np
+
+    vio_module.coord_trans.aligner.add(np.zeros(3), 0.0, np.zeros(3), 0.0)
+
+    # resyncs from before the ZED reconnected or relocalized are forgotten
+    vio_module.camera.on_tracking_reset()  # type: ignore
+    assert vio_module.coord_trans.aligner.count == 0
+
+
+def test_sync_persisted_with_area(
+    mocker: MockerFixture, vio_module: VIOModule, tmp_path: Path
+) -> None:
+    from src.vio import VIOModule
+
+    mocker.patch("config.AREA_MEMORY", True)
+    mocker.patch("config.SYNC_FILE", str(tmp_path / "vio_sync.json"))
+
+    def sync(payload: AVRVIOResync, timestamp: int) -> None:
+        vio_module.coord_trans.apply_sync_offsets(math.pi / 2, (10.0, 20.0, 30.0))
+
+    mocker.patch.object(vio_module.coord_trans, "sync", side_effect=sync)
+    vio_module.handle_resync(AVRVIOResync(n=0, e=0, d=0, hdg=0))
+
+    # only restored if the camera relocalizes in the area it belongs to
+    vio = VIOModule()
+    vio.restore_sync()
+    assert vio.coord_trans.heading_offset == 0
+
+    vio.camera.area_loaded = True  # type: ignore
+    vio.restore_sync()
+    assert vio.coord_trans.heading_offset == pytest.approx(math.pi / 2)
+    assert vio.coord_trans.position_offset == (10.0, 20.0, 30.0)
+    assert vio.coord_trans.version > 1
+
+
 @pytest.mark.parametrize(
     "ned_pos, ned_vel, rpy, tracker_confidence, expected_ned_update,"
     + " expected_eul_update, expected_heading_update, expected_vel_update,"
@@ -69,9 +109,9 @@ def test_handle_resync_continuous_on(
             (4, float("nan"), 6),
             (1, 2, 3),
             1.0,
-            AVRVIOPositionLocal(n=1.0, e=2.0, d=3.0),
-            AVRVIOAttitudeEulerRadians(psi=1.0, theta=2.0, phi=3.0),
-            AVRVIOHeading(hdg=171.88733853924697),
+            None,
+            None,
+            None,
             None,
             None,
         ),
@@ -80,7 +120,7 @@ def test_handle_resync_continuous_on(
             (4, 5, 6),
             (1, 2, float("nan")),
             1.0,
-            AVRVIOPositionLocal(n=1.0, e=2.0, d=3.0),
+            None,
             None,
             None,
             None,
@@ -102,6 +142,13 @@ def test_publish_update(
 ) -> None:
     vio_module.publish_updates(ned_pos, ned_vel, rpy, tracker_confidence)
 
+    # NaNs anywhere stop everything from being sent
+    if expected_ned_update is None:
+        vio_module.send_message.assert_not_called()
+        assert vio_module.frame_stats.rejected == 1
+    else:
+        assert vio_module.frame_stats.rejected == 0
+
     if expected_ned_update is not None:
         vio_module.send_message.assert_any_call(
             "avr/vio/position/local", expected_ned_update
@@ -130,21 +177,700 @@ def test_process_camera_data_empty_response(
     mocker: MockerFixture, vio_module: VIOModule
 ) -> None:
     mocker.patch.object(vio_module.camera, "get_pipe_data", None)
-    mocker.patch.object(vio_module.coord_trans, "transform_trackcamera_to_global_ned")
+    mocker.patch.object(
+        vio_module.coord_trans, "transform_trackcamera_to_global_ned_fast"
+    )
 
     vio_module.process_camera_data()
-    vio_module.coord_trans.transform_trackcamera_to_global_ned.assert_not_called()
+    vio_module.coord_trans.transform_trackcamera_to_global_ned_fast.assert_not_called()
 
 
 def test_process_camera_data(mocker: MockerFixture, vio_module: VIOModule) -> None:
     mocker.patch.object(vio_module.camera, "get_pipe_data")
     mocker.patch.object(
         vio_module.coord_trans,
-        "transform_trackcamera_to_global_ned",
+        "transform_trackcamera_to_global_ned_fast",
         return_value=((1, 2, 3), (4, 5, 6), (7, 8, 9)),
     )
     mocker.patch.object(vio_module, "publish_updates")
 
     vio_module.process_camera_data()
-    vio_module.coord_trans.transform_trackcamera_to_global_ned.assert_called_once()
+    vio_module.coord_trans.transform_trackcamera_to_global_ned_fast.assert_called_once()
     vio_module.publish_updates.assert_called_once()
+
+
+def test_create_camera_replay(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import create_camera
+
+    mocker.patch("config.CAMERA_BACKEND", "replay")
+    mocker.patch("config.REPLAY_FILE", "recording.bin")
+    mocker.patch("config.REPLAY_SPEED", 2.0)
+
+    camera = create_camera()
+    assert type(camera).__name__ == "ReplayCamera"
+    assert camera.path == "recording.bin"  # type: ignore
+    assert camera.speed == 2.0  # type: ignore
+
+
+def test_create_camera_synthetic(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import create_camera
+
+    mocker.patch("config.CAMERA_BACKEND", "synthetic")
+    mocker.patch("config.SYNTHETIC_TRAJECTORY", "figure8")
+    mocker.patch("config.SYNTHETIC_FPS", 400)
+
+    camera = create_camera()
+    assert type(camera).__name__ == "SyntheticCamera"
+    assert camera.trajectory == "figure8"  # type: ignore
+    assert camera.fps == 400  # type: ignore
+
+
+def test_create_camera_unknown(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import create_camera
+
+    mocker.patch("config.CAMERA_BACKEND", "webcam")
+
+    with pytest.raises(ValueError):
+        create_camera()
+
+
+def test_process_camera_data_recorder(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    data = mocker.MagicMock()
+    mocker.patch.object(vio_module.camera, "get_pipe_data", return_value=data)
+    mocker.patch.object(vio_module, "publish_updates")
+    vio_module.recorder = mocker.MagicMock()
+
+    vio_module.process_camera_data()
+    vio_module.recorder.record.assert_called_once_with(data)
+
+
+def test_process_camera_frames_decimation(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    mocker.patch("config.CAM_OUTPUT_DECIMATION", 3)
+    get_pipe_data = mocker.patch.object(vio_module.camera, "get_pipe_data")
+    mocker.patch.object(
+        vio_module.coord_trans,
+        "transform_trackcamera_to_global_ned_fast",
+        return_value=((1, 2, 3), (4, 5, 6), (7, 8, 9)),
+    )
+    mocker.patch.object(vio_module, "publish_updates")
+
+    for i in range(9):
+        get_pipe_data.return_value = {
+            "tracker_confidence": 1.0,
+            "timestamp": i * 16_666_667,
+        }
+        vio_module.process_camera_frames()
+
+    assert vio_module.frame_stats.frames == 9
+    assert vio_module.frame_stats.dropped == 0
+    assert vio_module.publish_updates.call_count == 3
+    assert vio_module.frame_stats.published == 3
+
+
+def test_process_camera_frames_no_data(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    get_pipe_data = mocker.patch.object(vio_module.camera, "get_pipe_data")
+    mocker.patch.object(vio_module, "publish_updates")
+    sleep = mocker.patch("time.sleep")
+
+    # no frame returns right away, so the loop waits a frame instead of spinning
+    get_pipe_data.return_value = None
+    vio_module.process_camera_frames()
+    sleep.assert_called_once_with(1 / 60)
+
+    sleep.reset_mock()
+    get_pipe_data.return_value = {"tracker_confidence": 1.0, "timestamp": 0}
+    vio_module.process_camera_frames()
+    sleep.assert_not_called()
+
+
+def test_process_camera_frame_rejected(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    mocker.patch.object(
+        vio_module.camera,
+        "get_pipe_data",
+        return_value={"tracker_confidence": 1.0, "timestamp": 1_000_000_000},
+    )
+    mocker.patch.object(
+        vio_module.coord_trans,
+        "transform_trackcamera_to_global_ned_fast",
+        return_value=((float("nan"), 2, 3), (4, 5, 6), (7, 8, 9)),
+    )
+
+    # a frame with NaNs is only counted as rejected
+    assert vio_module.process_camera_frame() is None
+    assert vio_module.frame_stats.rejected == 1
+    assert vio_module.frame_stats.published == 0
+    assert vio_module.frame_stats.lagged == 0
+
+
+def test_stats_report(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import STATS_TOPIC
+
+    get_pipe_data = mocker.patch.object(vio_module.camera, "get_pipe_data")
+    mocker.patch.object(
+        vio_module.coord_trans,
+        "transform_trackcamera_to_global_ned_fast",
+        return_value=((1, 2, 3), (4, 5, 6), (0.1, 0.2, 0.3)),
+    )
+    monotonic = mocker.patch("time.monotonic", return_value=0.0)
+    vio_module.stats_report()
+
+    for i in range(4):
+        get_pipe_data.return_value = {
+            "tracker_confidence": 1.0,
+            "timestamp": i * 16_666_667,
+        }
+        vio_module.process_camera_frame()
+
+    get_pipe_data.return_value = None
+    vio_module.process_camera_frame()
+    vio_module.publish_updates(
+        (float("nan"), 0.0, 0.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 1.0
+    )
+
+    vio_module.coord_trans.syncs = 2
+    vio_module.coord_trans.heading_offset = math.pi / 2
+    vio_module.coord_trans.position_offset = (1.0, 2.0, 3.0)
+
+    monotonic.return_value = 2.0
+    report = vio_module.stats_report()
+    assert report["grab"] == {"rate_hz": 2.0, "frames": 4, "failed": 1, "dropped": 0}
+    assert report["pose"]["rate_hz"] == 2.0
+    assert report["pose"]["published"] == 4
+    assert report["pose"]["rejected_nan"] == 1
+    assert report["resync"]["count"] == 2
+    assert report["resync"]["heading_offset_deg"] == pytest.approx(90)
+    assert report["resync"]["position_offset_cm"] == (1.0, 2.0, 3.0)
+    assert set(report["throttled"]) == set(vio_module.throttles)
+
+    # rates are since the last report
+    monotonic.return_value = 3.0
+    assert vio_module.stats_report()["grab"]["rate_hz"] == 0.0
+
+    vio_module.publish_stats()
+    assert vio_module.send_message.call_args.args[0] == STATS_TOPIC  # type: ignore
+
+
+def test_process_camera_data_overruns(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    # polled at 10 Hz
+    frame = mocker.patch.object(vio_module, "process_camera_frame")
+    vio_module.process_camera_data()
+    assert vio_module.frame_stats.overruns == 0
+
+    frame.side_effect = lambda: time.sleep(0.15)
+    vio_module.process_camera_data()
+    assert vio_module.frame_stats.overruns == 1
+
+
+def test_adaptive_scheduler(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from bell.avr.mqtt.payloads import AVRVIOImageStreamEnable
+
+    from src.vio import VIOModule
+
+    mocker.patch("config.ADAPTIVE_SCHEDULER", True)
+    vio = VIOModule()
+    scheduler = vio.scheduler
+    assert scheduler is not None
+    assert vio.image_encoder.nice > 0
+
+    vio.handle_image_stream_enable(
+        AVRVIOImageStreamEnable(side="left", compressed=False, frequency=4)
+    )
+    assert scheduler.images_streaming
+
+    rate_limit = mocker.patch("src.vio.rate_limit")
+    send_rgb_image = mocker.patch.object(vio, "send_rgb_image")
+
+    # images wait while a pose frame is being processed
+    scheduler.pose_started()
+    vio.stream_rgb_images()
+    rate_limit.assert_not_called()
+
+    scheduler.pose_done(None)
+    scheduler.image_level = 2
+    vio.stream_rgb_images()
+    assert rate_limit.call_args.kwargs["frequency"] == 2
+    rate_limit.call_args.args[0]()
+    assert send_rgb_image.call_args.kwargs["scale"] == 2 * vio.image_stream_scale
+
+    vio.handle_image_stream_disable()
+    assert not scheduler.images_streaming
+
+    iterations = scheduler.iterations
+    mocker.patch.object(vio, "process_camera_frame", return_value=0.001)
+    vio.process_camera_scheduled()
+    assert scheduler.iterations == iterations + 1
+    assert vio.stats_report()["scheduler"]["image_level"] == 2
+
+    # errors don't end the loop
+    mocker.patch.object(scheduler, "wait_for_pose", side_effect=RuntimeError)
+    vio.process_camera_scheduled()
+
+
+def test_imu_attitude(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import VIOModule
+
+    mocker.patch("config.IMU_ATTITUDE", True)
+    vio = VIOModule()
+    assert vio.attitude is not None
+    get_imu_data = mocker.patch.object(
+        vio.camera,
+        "get_imu_data",
+        return_value={"angular_velocity": (0.0, 0.0, 0.0), "timestamp": 2_500_000},
+    )
+    publish = mocker.patch.object(vio.publisher, "publish")
+
+    # nothing to propagate before the first camera frame
+    vio.process_imu_data()
+    publish.assert_not_called()
+
+    # camera frames publish the attitude until gyro samples arrive
+    get_pipe_data = mocker.patch.object(vio.camera, "get_pipe_data")
+    get_pipe_data.return_value = {
+        "rotation": (1.0, 0.0, 0.0, 0.0),
+        "translation": (0.0, 0.0, 0.0),
+        "velocity": (0.0, 0.0, 0.0),
+        "tracker_confidence": 1.0,
+        "timestamp": 0,
+    }
+    vio.process_camera_frame()
+    assert vio.attitude.initialized
+    assert "avr/vio/heading" in [call.args[0] for call in publish.call_args_list]
+
+    publish.reset_mock()
+    vio.process_imu_data()
+    assert [call.args[0] for call in publish.call_args_list] == [
+        "avr/vio/attitude/euler/radians",
+        "avr/vio/heading",
+    ]
+
+    # then frames leave the attitude to the gyro
+    publish.reset_mock()
+    get_pipe_data.return_value["timestamp"] = 5_000_000
+    vio.process_camera_frame()
+    topics = [call.args[0] for call in publish.call_args_list]
+    assert "avr/vio/position/local" in topics
+    assert "avr/vio/heading" not in topics
+
+    # samples older than the last frame are rejected
+    vio.process_imu_data()
+    get_imu_data.assert_called()
+    assert vio.stats_report()["attitude"]["propagated"] == 1
+    assert vio.stats_report()["attitude"]["corrections"] == 1
+
+    # a camera error doesn't end the loop
+    get_imu_data.side_effect = RuntimeError("camera unplugged")
+    vio.process_imu_data()
+
+
+def test_pose_prediction(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import VIOModule
+
+    mocker.patch("config.POSE_PREDICTION", True)
+    vio = VIOModule()
+    mocker.patch.object(
+        vio.camera,
+        "get_pipe_data",
+        return_value={"tracker_confidence": 1.0, "timestamp": 1_000_000_000},
+    )
+    mocker.patch.object(
+        vio.coord_trans,
+        "transform_trackcamera_to_global_ned_fast",
+        return_value=((1.0, 2.0, 3.0), (100.0, 0.0, 0.0), (0.0, 0.0, 0.0)),
+    )
+    mocker.patch("time.time_ns", return_value=1_050_000_000)
+    publish_updates = mocker.patch.object(vio, "publish_updates")
+
+    vio.process_camera_frame()
+
+    # moved along the velocity up to when it was published
+    assert publish_updates.call_args.args[0] == pytest.approx((6.0, 2.0, 3.0))
+    assert vio.stats_report()["prediction"]["lead_ms"] == pytest.approx(50)
+
+
+def test_pose_prediction_resync(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import VIOModule
+
+    mocker.patch("config.POSE_PREDICTION", True)
+    vio = VIOModule()
+    get_pipe_data = mocker.patch.object(vio.camera, "get_pipe_data")
+    transform = mocker.patch.object(
+        vio.coord_trans, "transform_trackcamera_to_global_ned_fast"
+    )
+    mocker.patch("time.time_ns", return_value=1_050_000_000)
+    publish_updates = mocker.patch.object(vio, "publish_updates")
+
+    get_pipe_data.return_value = {"tracker_confidence": 1.0, "timestamp": 1_000_000_000}
+    transform.return_value = ((1.0, 2.0, 3.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0))
+    vio.process_camera_frame()
+
+    # the heading step of a resync between two frames is not a turn
+    vio.coord_trans.apply_sync_offsets(0.3, (0.0, 0.0, 0.0))
+    get_pipe_data.return_value = {"tracker_confidence": 1.0, "timestamp": 1_010_000_000}
+    transform.return_value = ((1.0, 2.0, 3.0), (0.0, 0.0, 0.0), (0.0, 0.0, 0.3))
+    vio.process_camera_frame()
+
+    assert publish_updates.call_args.args[2] == pytest.approx((0.0, 0.0, 0.3))
+    assert vio.predictor.angle_correction == 0  # type: ignore
+
+
+def test_publish_updates_latency(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import POSE_TOPICS
+
+    mocker.patch("time.time_ns", return_value=1_050_000_000)
+
+    vio_module.publish_updates((1, 2, 3), (4, 5, 6), (1, 2, 3), 1.0, 1_000_000_000)
+
+    assert vio_module.latency["end_to_end"].percentiles()["max"] == pytest.approx(50)
+    for topic in POSE_TOPICS:
+        assert vio_module.latency[topic].count == 1
+
+
+def test_log_latency(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    vio_module.log_latency()
+
+    # errors don't end the loop
+    mocker.patch.object(vio_module, "latency_report", side_effect=RuntimeError)
+    vio_module.log_latency()
+
+
+def test_latency_report(vio_module: VIOModule) -> None:
+    from src.vio import POSE_TOPICS, STATE_TOPIC
+
+    assert set(vio_module.latency_report()) == {
+        "grab",
+        "pose",
+        "image_encode",
+        "publish_queue",
+        "publish_send",
+        "image_publish_send",
+        "transform",
+        "end_to_end",
+        *POSE_TOPICS,
+        STATE_TOPIC,
+    }
+
+
+def test_send_rgb_image_not_captured(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    mocker.patch.object(vio_module.camera, "get_image_frame", return_value=None)
+    vio_module.send_rgb_image("left", compressed=False)
+    vio_module.send_message.assert_not_called()  # type: ignore
+
+
+def test_send_rgb_image(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    import numpy as np
+    from bell.avr.utils.images import deserialize_image
+
+    image = np.arange(8 * 8 * 4, dtype=np.uint8).reshape((8, 8, 4))
+    mocker.patch.object(
+        vio_module.camera,
+        "get_image_frame",
+        return_value={"image": image, "frame_id": 1, "timestamp": 0},
+    )
+
+    # the encoder pool is not started, so this is sent right away
+    vio_module.send_rgb_image("right", compressed=True, scale=2)
+
+    topic, payload = vio_module.send_message.call_args.args  # type: ignore
+    assert topic == "avr/vio/image/capture"
+    assert payload.side == "right"
+    assert (deserialize_image(payload) == image[::2, ::2]).all()
+
+
+def test_slow_image_send(vio_module: VIOModule) -> None:
+    import threading
+
+    import numpy as np
+
+    from src.image_library import encode_image
+
+    image_sending = threading.Event()
+    release = threading.Event()
+    pose_sent = threading.Event()
+
+    def send_message(topic: str, payload: object) -> None:
+        if topic == "avr/vio/image/capture":
+            # an image that takes long to send
+            image_sending.set()
+            release.wait(5)
+        elif topic == "avr/vio/position/local":
+            pose_sent.set()
+
+    vio_module.send_message.side_effect = send_message  # type: ignore
+    vio_module.publisher.start()
+    vio_module.image_publisher.start()
+
+    try:
+        image = np.zeros((8, 8, 4), dtype=np.uint8)
+        vio_module.send_image_capture("left", encode_image(image))
+        assert image_sending.wait(5)
+
+        # poses don't queue behind the image still being sent
+        vio_module.publish_updates((1, 2, 3), (4, 5, 6), (1, 2, 3), 1.0, time.time_ns())
+        assert pose_sent.wait(1)
+    finally:
+        release.set()
+        vio_module.publisher.close()
+        vio_module.image_publisher.close()
+
+    assert vio_module.image_publisher.sent == 1
+
+
+def test_handle_image_options(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    import numpy as np
+
+    image = np.zeros((720, 1280, 4), dtype=np.uint8)
+    mocker.patch.object(
+        vio_module.camera,
+        "get_image_frame",
+        return_value={"image": image, "frame_id": 1, "timestamp": 0},
+    )
+
+    vio_module.handle_image_options({"scale": 2, "grayscale": True})
+    vio_module.send_rgb_image("left", compressed=False, scale=2)
+    assert vio_module.send_message.call_args.args[1].shape == [180, 320]  # type: ignore
+
+    # invalid options are ignored
+    vio_module.handle_image_options({"scale": -1})
+    assert vio_module.image_options["scale"] == 2
+
+    # an empty message resets them
+    vio_module.handle_image_options()
+    vio_module.send_rgb_image("left", compressed=False)
+    assert vio_module.send_message.call_args.args[1].shape == [720, 1280, 4]  # type: ignore
+
+
+def test_handle_profile(
+    mocker: MockerFixture, vio_module: VIOModule, tmp_path: Path
+) -> None:
+    from src.vio import PROFILE_RESULT_TOPIC
+
+    mocker.patch("config.PROFILE_DIR", str(tmp_path))
+    mocker.patch.object(vio_module.camera, "get_pipe_data", return_value=None)
+
+    vio_module.handle_profile({"mode": "cprofile", "duration": 0.2})
+    session = vio_module.profile_session
+    assert session is not None
+
+    # only one session at a time
+    vio_module.handle_profile({"mode": "sampling", "duration": 0.2})
+    assert vio_module.profile_session is session
+
+    while not session.done:
+        vio_module.process_camera_frame()
+        time.sleep(0.01)
+
+    # hooks are removed again
+    assert "process_camera_frame" not in vars(vio_module)
+
+    for _ in range(100):
+        if vio_module.send_message.call_count:  # type: ignore
+            break
+        time.sleep(0.01)
+
+    topic, summary = vio_module.send_message.call_args.args  # type: ignore
+    assert topic == PROFILE_RESULT_TOPIC
+    assert summary["mode"] == "cprofile"
+    assert summary["file"].startswith(str(tmp_path))
+    assert any(
+        entry["function"].startswith("process_camera_frame ")
+        for entry in summary["functions"]
+    )
+
+
+def test_publish_updates_state(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import POSE_TOPICS
+
+    mocker.patch("config.PUBLISH_STATE", True)
+
+    vio_module.publish_updates((1, 2, 3), (4, 5, 6), (1, 2, 3), 1.0, 1_000_000_000)
+
+    vio_module.send_message.assert_any_call(  # type: ignore
+        "avr/vio/state",
+        {
+            "timestamp": 1_000_000_000,
+            "position": {"n": 1, "e": 2, "d": 3},
+            "attitude": {"psi": 1, "theta": 2, "phi": 3},
+            "heading": {"hdg": 171.88733853924697},
+            "velocity": {"Vn": 4, "Ve": 5, "Vd": 6},
+            "confidence": {"tracking": 1.0},
+        },
+    )
+    assert vio_module.send_message.call_count == 1 + len(POSE_TOPICS)  # type: ignore
+
+
+def test_publish_updates_throttle(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.publish_library import TopicThrottle
+
+    vio_module.throttles["avr/vio/heading"] = TopicThrottle(decimation=0)
+    vio_module.throttles["avr/vio/velocity"] = TopicThrottle(decimation=2)
+
+    for _ in range(4):
+        vio_module.publish_updates((1, 2, 3), (4, 5, 6), (1, 2, 3), 1.0)
+
+    topics = [call.args[0] for call in vio_module.send_message.call_args_list]  # type: ignore
+    assert topics.count("avr/vio/position/local") == 4
+    assert topics.count("avr/vio/heading") == 0
+    assert topics.count("avr/vio/velocity") == 2
+    # unchanged confidence is only sent once a second by default
+    assert topics.count("avr/vio/confidence") == 1
+
+
+def test_handle_resync_delay(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    mocker.patch.object(vio_module.coord_trans, "sync")
+    mocker.patch("config.RESYNC_DELAY", 0.05)
+    mocker.patch("time.time_ns", return_value=1_000_000_000)
+
+    payload = AVRVIOResync(n=0, e=0, d=0, hdg=0)
+    vio_module.handle_resync(payload)
+    vio_module.coord_trans.sync.assert_called_once_with(payload, 950_000_000)
+
+
+def test_status(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    from src.vio import STATUS_TOPIC
+
+    mocker.patch("config.STATUS_STALE_TIMEOUT", 2.0)
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    assert vio_module.status_report()["state"] == "starting"
+
+    vio_module.camera_failures = 1
+    assert vio_module.status_report()["state"] == "degraded"
+
+    mocker.patch.object(vio_module.camera, "setup")
+    vio_module.setup_camera()
+    assert vio_module.camera_ready
+    assert vio_module.startup["camera_s"] is not None
+    assert vio_module.status_report()["state"] == "starting"
+
+    # no pose for too long after the camera was set up
+    monotonic.return_value = 103.0
+    assert vio_module.status_report()["reason"] == "no pose since camera setup"
+
+    vio_module.publish_updates((1, 2, 3), (4, 5, 6), (1, 2, 3), 1.0)
+    assert vio_module.startup["first_pose_s"] is not None
+    status = vio_module.status_report()
+    assert status["state"] == "tracking"
+    assert status["startup"] == vio_module.startup
+
+    monotonic.return_value = 106.0
+    assert vio_module.status_report() == {
+        "state": "degraded",
+        "reason": "poses stopped",
+        "startup": vio_module.startup,
+    }
+
+    vio_module.publisher.publish = mocker.Mock()  # type: ignore
+    vio_module.publish_status()
+    vio_module.publisher.publish.assert_called_once_with(  # type: ignore
+        STATUS_TOPIC, vio_module.status_report()
+    )
+
+    vio_module.camera.supervisor.state = "reconnecting"  # type: ignore
+    assert vio_module.status_report()["reason"] == "camera reconnecting"
+    assert vio_module.stats_report()["camera"]["state"] == "reconnecting"
+
+    # errors don't end the loops
+    vio_module.publisher.publish.side_effect = RuntimeError  # type: ignore
+    vio_module.publish_status()
+    vio_module.publish_stats()
+
+
+def test_setup_camera_retry(mocker: MockerFixture, vio_module: VIOModule) -> None:
+    mocker.patch("config.CAMERA_SETUP_RETRY_PERIOD", 0)
+    setup = mocker.patch.object(
+        vio_module.camera,
+        "setup",
+        side_effect=[RuntimeError("no camera"), RuntimeError("no camera"), None],
+    )
+
+    vio_module.setup_camera()
+    assert setup.call_count == 3
+    assert vio_module.camera_failures == 2
+    assert vio_module.camera_ready
+
+
+def test_image_request_before_camera_ready(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    send_rgb_image = mocker.patch.object(vio_module, "send_rgb_image")
+    payload = AVRVIOImageRequest(side="left", compressed=False)
+
+    vio_module.handle_image_request(payload)
+    vio_module.stream_rgb_images()
+    send_rgb_image.assert_not_called()
+
+    # sent from the image stream thread
+    vio_module.camera_ready = True
+    vio_module.handle_image_request(payload)
+    send_rgb_image.assert_not_called()
+    vio_module.stream_rgb_images()
+    send_rgb_image.assert_called_once_with(side="left", compressed=False)
+
+
+def test_image_request_waits_for_capture(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    vio_module.camera_ready = True
+    send_rgb_image = mocker.patch.object(
+        vio_module, "send_rgb_image", side_effect=[False, True]
+    )
+    payload = AVRVIOImageRequest(side="left", compressed=False)
+
+    # the camera only captures the image after its next grab
+    vio_module.handle_image_request(payload)
+    vio_module.stream_rgb_images()
+    assert vio_module.image_request is payload
+    vio_module.stream_rgb_images()
+    assert vio_module.image_request is None
+    assert send_rgb_image.call_count == 2
+
+    # and is given up on after a while
+    send_rgb_image.side_effect = None
+    send_rgb_image.return_value = False
+    mocker.patch("config.IMAGE_DEMAND_TIMEOUT", 0.0)
+    vio_module.handle_image_request(payload)
+    time.sleep(0.01)
+    vio_module.stream_rgb_images()
+    assert vio_module.image_request is None
+
+
+def test_images_captured_after_publish(
+    mocker: MockerFixture, vio_module: VIOModule
+) -> None:
+    from src.models import CameraFrameData
+
+    calls = []
+    mocker.patch.object(
+        vio_module.camera,
+        "get_pipe_data",
+        return_value=CameraFrameData(
+            rotation=(1.0, 0.0, 0.0, 0.0),
+            translation=(0.0, 0.0, 0.0),
+            velocity=(0.0, 0.0, 0.0),
+            tracker_confidence=1.0,
+            timestamp=1,
+            frame_id=1,
+        ),
+    )
+    mocker.patch.object(
+        vio_module, "publish_updates", side_effect=lambda *args: calls.append("pose")
+    )
+    mocker.patch.object(
+        vio_module.camera, "capture_images", side_effect=lambda: calls.append("image")
+    )
+
+    # image retrieval never delays the pose of its frame
+    vio_module.process_camera_frame()
+    assert calls == ["pose", "image"]
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+import sys
+import threading
+import tracemalloc
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
 
 import numpy as np
 import pytest
 from bell.avr.mqtt.payloads import AVRVIOResync
+from pytest_mock.plugin import MockerFixture
 
 from src.models import CameraFrameData
 
@@ -186,3 +191,449 @@ def test_sync(
         expected_H_aeroRefSync_aeroRef,
         camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"],
     )
+
+
+def test_euler2mat_rxyz(config: None) -> None:
+    import transforms3d as t3d
+
+    from src.vio_library import _compose, _euler2mat_rxyz
+
+    rng = np.random.default_rng(0)
+    for roll, pitch, yaw in rng.uniform(-np.pi, np.pi, size=(100, 3)):
+        R = t3d.euler.euler2mat(roll, pitch, yaw, axes="rxyz")
+        assert np.allclose(_euler2mat_rxyz(roll, pitch, yaw), R)
+        assert np.allclose(
+            _compose((1, 2, 3), R), t3d.affines.compose((1, 2, 3), R, np.ones(3))
+        )
+
+
+def _random_camera_frames(count: int) -> List[CameraFrameData]:
+    rng = np.random.default_rng(0)
+    return [
+        CameraFrameData(
+            rotation=tuple(rng.normal(size=4).tolist()),  # type: ignore
+            translation=tuple(rng.uniform(-10, 10, size=3).tolist()),  # type: ignore
+            velocity=tuple(rng.uniform(-2, 2, size=3).tolist()),  # type: ignore
+            tracker_confidence=1.0,
+        )
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize(
+    "resync_data",
+    [None, AVRVIOResync(n=7, e=8, d=9, hdg=-10), AVRVIOResync(n=0, e=0, d=0, hdg=270)],
+)
+def test_transform_trackcamera_to_global_ned_fast(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+    resync_data: Optional[AVRVIOResync],
+) -> None:
+    frames = _random_camera_frames(50)
+
+    if resync_data is not None:
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned(frames[0])
+        camera_coordinate_transformation.sync(resync_data)
+
+    # include the degenerate zero quaternion the reference path maps to identity
+    frames.append(
+        CameraFrameData(
+            rotation=(0, 0, 0, 0),
+            translation=(1, 2, 3),
+            velocity=(4, 5, 6),
+            tracker_confidence=1.0,
+        )
+    )
+
+    for frame in frames:
+        (
+            expected_pos,
+            expected_vel,
+            expected_eul,
+        ) = camera_coordinate_transformation.transform_trackcamera_to_global_ned(frame)
+        pos, vel, eul = (
+            camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(
+                frame
+            )
+        )
+
+        assert np.allclose(pos, expected_pos, rtol=0, atol=1e-9)
+        assert np.allclose(vel, expected_vel, rtol=0, atol=1e-9)
+        assert np.allclose(eul, expected_eul, rtol=0, atol=1e-9)
+
+
+def test_transform_trackcamera_to_global_ned_fast_sync(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    frame = _random_camera_frames(1)[0]
+    resync_data = AVRVIOResync(n=7, e=8, d=9, hdg=-10)
+
+    camera_coordinate_transformation.transform_trackcamera_to_global_ned(frame)
+    camera_coordinate_transformation.sync(resync_data)
+    expected = camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+
+    # a resync driven only by the fast path must land on the same correction
+    camera_coordinate_transformation.setup_transforms()
+    camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(frame)
+    camera_coordinate_transformation.sync(resync_data)
+
+    assert np.allclose(
+        expected,
+        camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"],
+        rtol=0,
+        atol=1e-9,
+    )
+
+
+def _peak_allocated_bytes(func: Callable, frames: List[CameraFrameData]) -> int:
+    # warm up on the first half so any lazily created state exists before
+    # measuring, and timestamps keep moving forward
+    half = len(frames) // 2
+    for frame in frames[:half]:
+        func(frame)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        for frame in frames[half:]:
+            func(frame)
+
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak - start
+
+
+def test_transform_trackcamera_to_global_ned_fast_allocations(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    # timestamped, so recording the pose history is measured too
+    frames: List[CameraFrameData] = [
+        {**frame, "timestamp": 1_700_000_000_000_000_000 + i * 16_666_667}  # type: ignore
+        for i, frame in enumerate(_random_camera_frames(400))
+    ]
+
+    # the measuring loop itself has a small constant overhead,
+    # so compare against a function that does nothing
+    baseline = _peak_allocated_bytes(lambda frame: None, frames)
+    fast = _peak_allocated_bytes(
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast,
+        frames,
+    )
+    reference = _peak_allocated_bytes(
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned, frames
+    )
+
+    # no matrices are created per frame, only short lived objects like
+    # the one taking the pose lock
+    assert fast < baseline + 512
+    assert reference > fast + 4096
+
+
+def _stack_camera_frames(
+    frames: List[CameraFrameData],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    return (
+        np.array([frame["rotation"] for frame in frames]),
+        np.array([frame["translation"] for frame in frames]),
+        np.array([frame["velocity"] for frame in frames]),
+    )
+
+
+@pytest.mark.parametrize(
+    "resync_data",
+    [None, AVRVIOResync(n=7, e=8, d=9, hdg=-10)],
+)
+def test_transform_trackcamera_to_global_ned_batch(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+    resync_data: Optional[AVRVIOResync],
+) -> None:
+    frames = _random_camera_frames(100)
+    frames[10]["rotation"] = (0, 0, 0, 0)
+
+    if resync_data is not None:
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned(frames[0])
+        camera_coordinate_transformation.sync(resync_data)
+
+    pos, vel, rpy = (
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_batch(
+            *_stack_camera_frames(frames)
+        )
+    )
+    assert pos.shape == vel.shape == rpy.shape == (len(frames), 3)
+
+    for i, frame in enumerate(frames):
+        (
+            expected_pos,
+            expected_vel,
+            expected_eul,
+        ) = camera_coordinate_transformation.transform_trackcamera_to_global_ned(frame)
+
+        assert np.allclose(pos[i], expected_pos, rtol=0, atol=1e-9)
+        assert np.allclose(vel[i], expected_vel[:3], rtol=0, atol=1e-9)
+        assert np.allclose(rpy[i], expected_eul, rtol=0, atol=1e-9)
+
+
+def test_transform_trackcamera_to_global_ned_batch_per_sample_sync(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    frames = _random_camera_frames(20)
+
+    # build a different sync correction for every sample
+    sync_matrices = []
+    for i, frame in enumerate(frames):
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned(frame)
+        camera_coordinate_transformation.sync(
+            AVRVIOResync(n=i, e=-i, d=i / 2, hdg=i * 17)
+        )
+        sync_matrices.append(
+            camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+        )
+
+    pos, vel, rpy = (
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_batch(
+            *_stack_camera_frames(frames), np.stack(sync_matrices)
+        )
+    )
+
+    for i, frame in enumerate(frames):
+        camera_coordinate_transformation.set_sync_correction(sync_matrices[i])
+        (
+            expected_pos,
+            expected_vel,
+            expected_eul,
+        ) = camera_coordinate_transformation.transform_trackcamera_to_global_ned(frame)
+
+        assert np.allclose(pos[i], expected_pos, rtol=0, atol=1e-9)
+        assert np.allclose(vel[i], expected_vel[:3], rtol=0, atol=1e-9)
+        assert np.allclose(rpy[i], expected_eul, rtol=0, atol=1e-9)
+
+
+def test_transform_trackcamera_to_global_ned_batch_bad_shapes(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    with pytest.raises(ValueError):
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_batch(
+            np.zeros((2, 4)), np.zeros((3, 3)), np.zeros((2, 3))
+        )
+
+    with pytest.raises(ValueError):
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_batch(
+            np.zeros((2, 4)), np.zeros((2, 3)), np.zeros((2, 3)), np.zeros((3, 4, 4))
+        )
+
+
+def test_sync_version(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    frame = _random_camera_frames(1)[0]
+    camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(frame)
+
+    state = camera_coordinate_transformation.state
+    version = camera_coordinate_transformation.version
+
+    camera_coordinate_transformation.sync(AVRVIOResync(n=1, e=2, d=3, hdg=4))
+
+    # a new snapshot is swapped in, the old one is left untouched
+    assert camera_coordinate_transformation.version == version + 1
+    assert camera_coordinate_transformation.state is not state
+    assert np.array_equal(state.H_aeroRefSync_aeroRef, np.eye(4))
+    assert not state.H_aeroRefSync_aeroRef.flags.writeable
+
+
+def test_reset_resyncs_during_sync(
+    mocker: MockerFixture,
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    frame = _random_camera_frames(1)[0]
+    camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(frame)
+    aligner = camera_coordinate_transformation.aligner
+    add = aligner.add
+    resets = []
+
+    def add_then_reset(*args: Any) -> None:
+        add(*args)
+        # the camera reconnects between adding the pair and fitting it
+        reset = threading.Thread(target=camera_coordinate_transformation.reset_resyncs)
+        reset.start()
+        reset.join(0.1)
+        resets.append(reset)
+
+    mocker.patch.object(aligner, "add", side_effect=add_then_reset)
+    camera_coordinate_transformation.sync(AVRVIOResync(n=1, e=2, d=3, hdg=4))
+
+    # the reset waits for the fit, rather than emptying the window under it
+    assert camera_coordinate_transformation.syncs == 1
+    resets[0].join(5)
+    assert aligner.count == 0
+
+
+def test_latest_camera_pose_concurrent(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+) -> None:
+    assert camera_coordinate_transformation.latest_camera_pose() is None
+
+    frames = 20_000
+    done = threading.Event()
+
+    def write() -> None:
+        for i in range(frames):
+            camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(
+                CameraFrameData(
+                    rotation=(1.0, 0.0, 0.0, 0.0),
+                    translation=(i, i, i),
+                    velocity=(0.0, 0.0, 0.0),
+                    tracker_confidence=1.0,
+                )
+            )
+        done.set()
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        writer = threading.Thread(target=write)
+        writer.start()
+
+        while not done.is_set():
+            H = camera_coordinate_transformation.latest_camera_pose()
+            if H is None:
+                continue
+
+            # a torn copy would mix translations of different frames
+            assert H[0, 3] == H[1, 3] == H[2, 3]
+            assert np.array_equal(H[:3, :3], np.eye(3))
+
+        writer.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+
+def test_sync_concurrent_replay(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+    tmp_path: Path,
+) -> None:
+    from src.replay_library import FrameRecorder, ReplayCamera
+
+    # record a flight, then replay it as fast as possible
+    path = tmp_path / "recording.bin"
+    recorder = FrameRecorder(str(path))
+    for i, frame in enumerate(_random_camera_frames(300)):
+        recorder.record({**frame, "timestamp": i * 16_666_667, "frame_id": i + 1})
+    recorder.close()
+
+    camera = ReplayCamera(str(path), speed=0, loop=True)
+    camera.setup()
+
+    coord_trans = camera_coordinate_transformation
+    coord_trans.transform_trackcamera_to_global_ned_fast(camera.get_pipe_data())  # type: ignore
+
+    states = [coord_trans.state]
+    done = threading.Event()
+
+    def resync() -> None:
+        i = 0
+        while not done.is_set():
+            coord_trans.sync(AVRVIOResync(n=i, e=-i, d=i / 2, hdg=i * 7 % 360))
+            states.append(coord_trans.state)
+            i += 1
+
+    results = []
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        syncer = threading.Thread(target=resync)
+        syncer.start()
+
+        # keep replaying until plenty of resyncs landed mid-replay
+        while len(results) < 300 or (len(states) < 50 and len(results) < 50_000):
+            data = camera.get_pipe_data()
+            assert data is not None
+            pos, vel, rpy = coord_trans.transform_trackcamera_to_global_ned_fast(data)
+            results.append((data, pos.copy(), vel[:3].copy(), rpy))
+    finally:
+        done.set()
+        syncer.join()
+        sys.setswitchinterval(switch_interval)
+
+    assert len(states) >= 50
+    assert [state.version for state in states] == list(
+        range(states[0].version, states[0].version + len(states))
+    )
+
+    # every frame must match exactly one complete snapshot,
+    # never a mix of two
+    H_sync = np.stack([state.H_aeroRefSync_aeroRef for state in states])
+    for data, pos, vel, rpy in results:
+        count = len(states)
+        expected_pos, expected_vel, expected_rpy = (
+            coord_trans.transform_trackcamera_to_global_ned_batch(
+                np.tile(data["rotation"], (count, 1)),
+                np.tile(data["translation"], (count, 1)),
+                np.tile(data["velocity"], (count, 1)),
+                H_sync,
+            )
+        )
+        matches = (
+            np.isclose(expected_pos, pos, rtol=0, atol=1e-9).all(axis=1)
+            & np.isclose(expected_vel, vel, rtol=0, atol=1e-9).all(axis=1)
+            & np.isclose(expected_rpy, rpy, rtol=0, atol=1e-9).all(axis=1)
+        )
+        assert matches.any()
+
+
+def test_sync_timestamp(
+    camera_coordinate_transformation: CameraCoordinateTransformation,
+    mocker: MockerFixture,
+) -> None:
+    # apply each resync on its own
+    mocker.patch("config.RESYNC_WINDOW", 1)
+    camera_coordinate_transformation.setup_transforms()
+
+    # flying straight at 1 m/s
+    frames = [
+        CameraFrameData(
+            rotation=(1.0, 0.0, 0.0, 0.0),
+            translation=(i / 60, 0.0, 0.0),
+            velocity=(1.0, 0.0, 0.0),
+            tracker_confidence=1.0,
+            timestamp=i * 16_666_667,
+            frame_id=i + 1,
+        )
+        for i in range(60)
+    ]
+    resync_data = AVRVIOResync(n=7, e=8, d=9, hdg=10)
+
+    # resync against frame 30 as the latest pose
+    for frame in frames[:31]:
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(frame)
+    camera_coordinate_transformation.sync(resync_data)
+    expected = camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+
+    # the same reference arriving 500ms later lands on the same correction
+    camera_coordinate_transformation.setup_transforms()
+    for frame in frames:
+        camera_coordinate_transformation.transform_trackcamera_to_global_ned_fast(frame)
+    camera_coordinate_transformation.sync(resync_data, frames[30]["timestamp"])
+
+    assert np.allclose(
+        expected,
+        camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"],
+        rtol=0,
+        atol=1e-6,
+    )
+
+    # while without the timestamp it would be off by the distance moved
+    camera_coordinate_transformation.sync(resync_data)
+    assert not np.allclose(
+        expected, camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+    )
+
+    # older than the history falls back to the latest pose
+    camera_coordinate_transformation.sync(resync_data, -1)
+    latest = camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+    camera_coordinate_transformation.sync(resync_data)
+    assert np.allclose(
+        latest, camera_coordinate_transformation.tm["H_aeroRefSync_aeroRef"]
+    )
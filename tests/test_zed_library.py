@@ -1,5 +1,10 @@
 from __future__ import annotations
 
+import itertools
+import math
+import threading
+import time
+from pathlib import Path
 from typing import TYPE_CHECKING, Tuple
 
 import pytest
@@ -23,6 +28,8 @@ if TYPE_CHECKING:
                 "tracker_confidence": 1.0,
                 "translation": (4, 5, 6),
                 "velocity": (3.0, 3.0, 3.0),
+                "timestamp": 1_000_000_000,
+                "frame_id": 1,
             },
         ),
     ],
@@ -35,16 +42,286 @@ def test_get_pipe_data(
     rotation: Tuple[float, float, float, float],
     expected: CameraFrameData,
 ) -> None:
+    # force 1 second since last reading
+    zed_camera.velocity_estimator.update(0, last_pos)
+
     # mock incoming values
-    mocker.patch.object(zed_camera, "last_pos", last_pos)
     zed_camera.zed_pose.get_translation.return_value.get.return_value = translation
     zed_camera.zed_pose.pose_confidence = 1.0
     from src.zed_library import sl
 
     sl.Orientation.return_value.get.return_value = rotation
 
-    # force 1 seond since last reading
-    zed_camera.last_time = 0
-    zed_camera.zed.get_timestamp.return_value.get_milliseconds.return_value = 1000
+    zed_camera.zed.get_timestamp.return_value.get_nanoseconds.return_value = (
+        1_000_000_000
+    )
 
     assert zed_camera.get_pipe_data() == expected
+
+
+def test_capture_images(zed_camera: ZEDCamera, mocker: MockerFixture) -> None:
+    zed_camera.zed.get_timestamp.return_value.get_nanoseconds.return_value = 1
+    retrieve_image = mocker.patch.object(zed_camera.zed, "retrieve_image")
+
+    # nothing is retrieved until an image is asked for
+    for _ in range(2):
+        zed_camera.get_pipe_data()
+        zed_camera.capture_images()
+    retrieve_image.assert_not_called()
+
+    # nothing has been captured for this request yet, and it doesn't wait
+    start = time.monotonic()
+    assert zed_camera.get_image_frame("left") is None
+    assert time.monotonic() - start < 0.1
+
+    # grabbing never retrieves images, the pose loop does once the pose is out
+    zed_camera.get_pipe_data()
+    retrieve_image.assert_not_called()
+    zed_camera.capture_images()
+    retrieve_image.assert_called_once()
+    assert retrieve_image.call_args.args[1] == zed_camera._image_views["left"]
+
+    image_frame = zed_camera.get_image_frame("left")
+    assert image_frame is not None
+    assert image_frame["frame_id"] == 3
+    assert image_frame["timestamp"] == 1
+
+    # each grab is only retrieved once
+    zed_camera.capture_images()
+    assert retrieve_image.call_count == 1
+
+
+def test_get_imu_data(zed_camera: ZEDCamera, mocker: MockerFixture) -> None:
+    mocker.patch("config.IMU_ATTITUDE", True)
+    get_sensors_data = mocker.patch.object(
+        zed_camera.zed, "get_sensors_data", return_value=True
+    )
+    imu_data = zed_camera.imu_sensors.get_imu_data.return_value
+    imu_data.timestamp.get_nanoseconds.return_value = 1_000_000_000
+    imu_data.get_angular_velocity.return_value = (90.0, 180.0, -45.0)
+
+    # read by the pose loop after each grab, never by the caller
+    assert zed_camera.get_imu_data() is None
+    get_sensors_data.assert_not_called()
+    zed_camera.get_pipe_data()
+    get_sensors_data.reset_mock()
+
+    sample = zed_camera.get_imu_data()
+    get_sensors_data.assert_not_called()
+    assert sample is not None
+    assert sample["timestamp"] == 1_000_000_000
+    assert sample["angular_velocity"] == pytest.approx(
+        (math.pi / 2, -math.pi, -math.pi / 4)
+    )
+
+    # nothing new until the IMU moves on
+    assert zed_camera.get_imu_data() is None
+
+
+def test_imu_thread_pose_loop(zed_camera: ZEDCamera, mocker: MockerFixture) -> None:
+    mocker.patch("config.IMU_ATTITUDE", True)
+    sdk_threads = set()
+
+    def grab(*args: object) -> bool:
+        sdk_threads.add(threading.current_thread())
+        # waiting on the next frame
+        time.sleep(0.002)
+        return True
+
+    def get_sensors_data(*args: object) -> bool:
+        sdk_threads.add(threading.current_thread())
+        return True
+
+    mocker.patch.object(zed_camera.zed, "grab", side_effect=grab)
+    mocker.patch.object(
+        zed_camera.zed, "get_sensors_data", side_effect=get_sensors_data
+    )
+    imu_data = zed_camera.imu_sensors.get_imu_data.return_value
+    imu_data.get_angular_velocity.return_value = (0.0, 0.0, 0.0)
+    imu_data.timestamp.get_nanoseconds.side_effect = itertools.count()
+    zed_camera.zed_pose.get_translation.return_value.get.return_value = (0, 0, 0)
+    zed_camera.zed.get_timestamp.return_value.get_nanoseconds.side_effect = (
+        itertools.count(0, 10_000_000)
+    )
+
+    def pose_loop() -> float:
+        start = time.perf_counter()
+        for _ in range(50):
+            zed_camera.get_pipe_data()
+        return time.perf_counter() - start
+
+    alone = pose_loop()
+
+    # the attitude thread polls for gyro samples at the IMU rate meanwhile
+    samples = []
+    done = threading.Event()
+
+    def poll_imu() -> None:
+        while not done.is_set():
+            sample = zed_camera.get_imu_data()
+            if sample is not None:
+                samples.append(sample)
+            time.sleep(1 / 400)
+
+    thread = threading.Thread(target=poll_imu)
+    thread.start()
+    try:
+        together = pose_loop()
+    finally:
+        done.set()
+        thread.join()
+
+    # only the pose loop calls the SDK, and isn't slowed down by the poll
+    assert sdk_threads == {threading.main_thread()}
+    assert samples
+    assert together < alone * 1.5 + 0.02
+
+
+def test_setup_failure(zed_camera: ZEDCamera, mocker: MockerFixture) -> None:
+    # failures are raised for the module to retry, instead of exiting
+    mocker.patch.object(zed_camera.zed, "open", return_value=False)
+    with pytest.raises(RuntimeError, match="open"):
+        zed_camera.setup()
+
+    mocker.patch.object(zed_camera.zed, "open", return_value=True)
+    mocker.patch.object(
+        zed_camera.zed, "enable_positional_tracking", return_value=False
+    )
+    close = mocker.patch.object(zed_camera.zed, "close")
+    with pytest.raises(RuntimeError, match="tracking"):
+        zed_camera.setup()
+    close.assert_called_once()
+
+
+def test_reconnect(zed_camera: ZEDCamera, mocker: MockerFixture) -> None:
+    from src.supervisor_library import CameraSupervisor
+    from src.zed_library import sl
+
+    zed_camera.supervisor = CameraSupervisor(failure_limit=3, backoff=0.001)
+    zed_camera.on_tracking_reset = mocker.Mock()
+    zed_camera.zed.get_timestamp.return_value.get_nanoseconds.side_effect = (
+        itertools.count(1)
+    )
+    assert zed_camera.get_pipe_data() is not None
+
+    # grabs stop, until too many failed in a row
+    grab = mocker.patch.object(zed_camera.zed, "grab", return_value=False)
+    for _ in range(3):
+        assert zed_camera.get_pipe_data() is None
+    assert zed_camera.supervisor.state == "reconnecting"
+
+    close = mocker.patch.object(zed_camera.zed, "close")
+    open_ = mocker.patch.object(zed_camera.zed, "open", return_value=False)
+    assert zed_camera.get_pipe_data() is None
+    close.assert_called_once()
+    assert zed_camera.supervisor.reconnect_failures == 1
+    assert zed_camera.supervisor.state == "reconnecting"
+
+    # tracking continues from the last pose, instead of finding the floor again
+    open_.return_value = True
+    tracking_parameters = mocker.patch.object(sl, "PositionalTrackingParameters")
+    assert zed_camera.get_pipe_data() is None
+    tracking_parameters.assert_called_once_with(
+        _init_pos=zed_camera.zed_pose.pose_data.return_value
+    )
+    assert zed_camera.tracking_parameters.set_floor_as_origin is False
+    assert zed_camera.supervisor.state == "recovering"
+    zed_camera.on_tracking_reset.assert_called_once()
+
+    grab.return_value = True
+    assert zed_camera.get_pipe_data() is not None
+    assert zed_camera.supervisor.state == "running"
+    assert zed_camera.supervisor.recoveries == 1
+    assert zed_camera.supervisor.recovery_time is not None
+
+
+def test_area_memory(
+    zed_camera: ZEDCamera, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    from src.zed_library import sl
+
+    area_file = tmp_path / "vio.area"
+    area_file.write_bytes(b"old")
+    mocker.patch("config.AREA_MEMORY", True)
+    mocker.patch("config.AREA_FILE", str(area_file))
+    mocker.patch("config.AREA_SAVE_PERIOD", 0)
+
+    zed_camera.setup()
+    assert zed_camera.tracking_parameters.enable_area_memory is True
+    assert zed_camera.tracking_parameters.area_file_path == str(area_file)
+    assert zed_camera.area_loaded
+
+    zed_camera.zed.get_timestamp.return_value.get_nanoseconds.side_effect = (
+        itertools.count(1)
+    )
+
+    # relocalized once tracking finds where it is in the area
+    get_position = mocker.patch.object(zed_camera.zed, "get_position")
+    get_position.return_value = sl.POSITIONAL_TRACKING_STATE.SEARCHING
+    zed_camera.get_pipe_data()
+    assert not zed_camera.relocalized
+
+    on_tracking_reset = zed_camera.on_tracking_reset = mocker.Mock()
+    get_position.return_value = sl.POSITIONAL_TRACKING_STATE.OK
+    zed_camera.get_pipe_data()
+    assert zed_camera.relocalized
+    on_tracking_reset.assert_called_once()
+    assert zed_camera.relocalization_time is not None
+
+    # the export is started by the pose loop, and replaces the file once done.
+    # The SDK wants the .area extension on the temporary file too.
+    def save_area_map(path: str) -> bool:
+        assert path == str(tmp_path / "vio.tmp.area")
+        with open(path, "wb") as f:
+            f.write(b"new")
+        return True
+
+    mocker.patch.object(zed_camera.zed, "save_area_map", side_effect=save_area_map)
+    mocker.patch.object(
+        zed_camera.zed,
+        "get_area_export_state",
+        return_value=sl.AREA_EXPORTING_STATE.SUCCESS,
+    )
+
+    saved = []
+    saver = threading.Thread(target=lambda: saved.append(zed_camera.save_area(5)))
+    saver.start()
+    while saver.is_alive():
+        zed_camera.get_pipe_data()
+        time.sleep(0.01)
+
+    assert saved == [True]
+    assert area_file.read_bytes() == b"new"
+    assert not (tmp_path / "vio.tmp.area").exists()
+
+    report = zed_camera.area_report()
+    assert report["loaded"] and report["relocalized"]
+    assert report["saves"] == 1
+    assert report["save_failures"] == 0
+
+    # a failed export leaves the area file alone
+    mocker.patch.object(
+        zed_camera.zed,
+        "get_area_export_state",
+        return_value=sl.AREA_EXPORTING_STATE.FILE_ERROR,
+    )
+    assert not zed_camera.save_area(5, direct=True)
+    assert area_file.read_bytes() == b"new"
+    assert zed_camera.area_save_failures == 1
+
+
+def test_close_saves_area(
+    zed_camera: ZEDCamera, mocker: MockerFixture, tmp_path: Path
+) -> None:
+    mocker.patch("config.AREA_MEMORY", True)
+    mocker.patch("config.AREA_FILE", str(tmp_path / "vio.area"))
+    save_area_map = mocker.patch.object(
+        zed_camera.zed, "save_area_map", return_value=False
+    )
+
+    # a failed export leaves no file behind
+    zed_camera.close()
+    save_area_map.assert_called_once()
+    assert zed_camera.area_save_failures == 1
+    assert not (tmp_path / "vio.area").exists()
+    zed_camera.zed.close.assert_called_once()